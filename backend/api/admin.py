@@ -23,15 +23,16 @@ class DateAdmin(admin.ModelAdmin):
     list_display = (
         'name',
     )
+    list_select_related = (
+        'habit',
+    )
     search_fields = (
-        'name',
+        'habit__name',
     )
     empty_value_display = (
         '-пусто-'
     )
 
-    prepopulated_fields = {'slug': ('name',)}
-
 
 class HabitAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,62 @@
+"""
+Битовые карты выполнения привычки по годам.
+
+Бит N — N-й день года (1 января — бит 0, младшие биты первого байта идут
+первыми). 366 дней занимают 46 байт, поэтому строка HabitYearBitmap
+с картами done и restored весит около 92 байт. Модуль не импортирует
+модели, чтобы его можно было использовать в миграциях.
+"""
+import base64
+from datetime import date
+
+YEAR_BYTES = 46
+
+
+def empty_year():
+    return bytes(YEAR_BYTES)
+
+
+def day_index(day):
+    return (day - date(day.year, 1, 1)).days
+
+
+def with_bit(data, index, value):
+    """Copy of ``data`` with bit ``index`` set to ``value``."""
+    data = bytearray(data or empty_year())
+    if value:
+        data[index // 8] |= 1 << (index % 8)
+    else:
+        data[index // 8] &= ~(1 << (index % 8)) & 0xFF
+    return bytes(data)
+
+
+def pack_days(days):
+    """Pack days of one year into a bitmap."""
+    data = bytearray(YEAR_BYTES)
+    for day in days:
+        index = day_index(day)
+        data[index // 8] |= 1 << (index % 8)
+    return bytes(data)
+
+
+def range_mask(years, first, last):
+    """
+    Bits of the days in [first, last] from yearly bitmaps ``{year: bytes}``.
+    Bit k of the result is the day ``first + k``; the range may span years.
+    """
+    mask = 0
+    shift = 0
+    for year in range(first.year, last.year + 1):
+        lo = first if year == first.year else date(year, 1, 1)
+        hi = last if year == last.year else date(year, 12, 31)
+        width = (hi - lo).days + 1
+        data = years.get(year)
+        if data and width > 0:
+            mask |= ((int.from_bytes(data, 'little') >> day_index(lo)) & ((1 << width) - 1)) << shift
+        shift += max(width, 0)
+    return mask
+
+
+def encode_mask(mask, days):
+    """Base64 of a range mask: ``days`` bits, bit k (LSB first in each byte) is day k of the range."""
+    return base64.b64encode(mask.to_bytes((days + 7) // 8, 'little')).decode('ascii')
@@ -0,0 +1,171 @@
+"""
+Кэш вычисленных ответов аналитических эндпоинтов и ETag для условных запросов.
+
+Ключ — пользователь, эндпоинт, нормализованные параметры запроса, сегодняшняя дата
+(от неё зависят ответы без явного ?date=) и UserAll.data_version. Версия растёт при
+любой записи привычек, категорий и отметок, поэтому устаревшие записи явно не удаляются:
+к ним больше не обращаются, и кэш вытесняет их сам (LRU, MAX_ENTRIES в settings.CACHES).
+Из тех же составляющих строится ETag: пока версия не изменилась, клиент с If-None-Match
+получает 304 без единого запроса к Date.
+
+Одновременные одинаковые запросы при промахе кэша вычисляются один раз (single_flight):
+блокировка берётся через cache.add в том же бэкенде. LocMemCache общий для потоков одного
+процесса; чтобы запросы объединялись и между воркерами gunicorn, нужен общий бэкенд (Redis).
+"""
+import hashlib
+import json
+import time
+import uuid
+from datetime import date
+from functools import wraps
+
+from django.core.cache import caches
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import UserAll
+
+CACHE_ALIAS = 'analytics'
+# Блокировка вычисления истекает сама, если воркер умер, не сняв её (секунд)
+LOCK_TIMEOUT = 30
+# Сколько ждать чужого вычисления, прежде чем считать самому, и как часто проверять кэш (секунд)
+WAIT_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+
+
+def data_version(user_id):
+    """Текущая версия данных пользователя — один запрос по первичному ключу."""
+    return UserAll.objects.filter(pk=user_id).values_list('data_version', flat=True).first()
+
+
+def request_data_version(request):
+    """Версия данных пользователя запроса; читается один раз, даже если декораторов несколько."""
+    if not hasattr(request, '_data_version'):
+        request._data_version = data_version(request.profile.pk)
+    return request._data_version
+
+
+def normalize_params(query_params, url_kwargs=None):
+    """Параметры запроса в каноническом виде: порядок ключей и повторов значений не важен."""
+    params = {key: sorted(query_params.getlist(key)) for key in query_params}
+    for key, value in (url_kwargs or {}).items():
+        params[f'<{key}>'] = [str(value)]
+    return json.dumps(sorted(params.items()), ensure_ascii=False, separators=(',', ':'))
+
+
+def response_cache_key(user_id, endpoint, params, version):
+    digest = hashlib.sha1(params.encode()).hexdigest()
+    return f'{CACHE_ALIAS}:{user_id}:{endpoint}:{version}:{date.today().isoformat()}:{digest}'
+
+
+def single_flight(key, compute):
+    """
+    Значение из кэша по key, а при промахе — результат compute(), который среди одновременных
+    вызовов выполняет только один: остальные ждут, пока значение появится в кэше. Если вычислявший
+    вернул None (результат не кэшируется) или упал, ожидающие вычисляют сами по очереди.
+    """
+    cache = caches[CACHE_ALIAS]
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while True:
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.add(lock_key, token, LOCK_TIMEOUT):
+            break
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        # Предыдущий владелец блокировки мог записать значение между get и add
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                cache.set(key, value)
+        return value
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def cached_response(endpoint):
+    """
+    Декоратор действия ViewSet: успешный ответ кэшируется по версии данных пользователя,
+    повторный запрос с теми же параметрами отдаётся без пересчёта, а одновременные — ждут
+    одного вычисления.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            profile = request.profile
+            if profile is None:
+                return view(self, request, *args, **kwargs)
+
+            key = response_cache_key(
+                profile.pk, endpoint, normalize_params(request.query_params, kwargs), request_data_version(request),
+            )
+            computed = []
+
+            def compute():
+                response = view(self, request, *args, **kwargs)
+                computed.append(response)
+                if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+                    return response.data
+                return None
+
+            data = single_flight(key, compute)
+            return computed[0] if computed else Response(data)
+        return wrapper
+    return decorator
+
+
+def response_etag(request, endpoint, url_kwargs=None):
+    """
+    Сильный ETag ответа: пользователь, эндпоинт, параметры, версия данных, сегодняшняя дата
+    (ответы без ?date= строятся от неё) и адрес сайта (в ответах есть абсолютные ссылки на фото).
+    """
+    validator = '|'.join((
+        str(request.profile.pk),
+        endpoint,
+        normalize_params(request.query_params, url_kwargs),
+        str(request_data_version(request)),
+        date.today().isoformat(),
+        request.build_absolute_uri('/'),
+    ))
+    return '"%s"' % hashlib.sha1(validator.encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    """If-None-Match сравнивается слабо (RFC 9110): nginx с gzip превращает ETag в W/"..."."""
+    tags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+def conditional_response(endpoint):
+    """
+    Декоратор действия ViewSet: успешный ответ получает ETag, а запрос с совпавшим
+    If-None-Match — 304 Not Modified до того, как действие начнёт читать данные.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            if request.profile is None:
+                return view(self, request, *args, **kwargs)
+
+            etag = response_etag(request, endpoint, kwargs)
+            if etag_matches(request, etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            response['ETag'] = etag
+            # Браузер хранит ответ, но перед использованием всегда переспрашивает сервер
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
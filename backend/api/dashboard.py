@@ -0,0 +1,241 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Exists, OuterRef
+
+from .models import Date, Habit, HabitMonthStat, HabitWeekStat
+from .history import load_histories
+from .rollups import active_streak_segments
+from .serializers import HabitSerializer
+from .streaks import active_days
+
+# Сколько недель назад смотрим при подсчёте короны (как и раньше — не больше 100)
+CROWN_LOOKBACK_WEEKS = 100
+
+
+def is_streak_active_on_date(segments, habit_start, check_date):
+    """
+    Determines if the streak for a habit is active on a given date.
+    A miss on check_date itself is forgiven, so the streak also counts as active
+    when it was active the day before. Days before the habit's start are ignored.
+    """
+    for day in (check_date - timedelta(days=1), check_date):
+        if habit_start and day <= habit_start:
+            continue
+        if active_days(segments, day, day):
+            return True
+    return False
+
+
+def count_full_weeks(full_weeks, week_start, limit=None):
+    """Count consecutive 7/7 weeks (given by their Mondays) going back from ``week_start``."""
+    count = 0
+    while (limit is None or count < limit) and week_start in full_weeks:
+        count += 1
+        week_start -= timedelta(days=7)
+    return count
+
+
+def _photo_url(request, entry):
+    if entry and entry.photo:
+        try:
+            return request.build_absolute_uri(entry.photo.url)
+        except Exception:
+            pass
+    return None
+
+
+def _entry_details(request, entry):
+    return {
+        "id": entry.id,
+        "date": entry.habit_date.isoformat(),
+        "quantity": entry.quantity,
+        "is_done": entry.is_done,
+        "comment": entry.comment,
+        "photo": _photo_url(request, entry),
+    }
+
+
+def build_weekly_status(request, user_profile, reference_date):
+    """
+    Builds the weekly_status payload for every active habit of the user.
+
+    All Date rows needed for the week are loaded in bulk (a fixed number of
+    queries regardless of how many habits the user has) and the response is
+    assembled in memory.
+    """
+    start_date = reference_date - timedelta(days=reference_date.weekday())
+    end_date = start_date + timedelta(days=6)
+    today = date.today()
+
+    # Monthly range anchored to the end of the week (current/new month)
+    start_of_month = date(end_date.year, end_date.month, 1)
+    is_transition_week = start_date.month != end_date.month
+    if is_transition_week:
+        prev_start_of_month = date(start_date.year, start_date.month, 1)
+
+    prev_week_start = start_date - timedelta(days=7)
+    prev_sun = start_date - timedelta(days=1)
+    prev_sat = start_date - timedelta(days=2)
+    prev_fri = start_date - timedelta(days=3)
+
+    habits = list(
+        Habit.objects.for_profile(user_profile)
+        .select_related('latest_comment_entry', 'latest_photo_entry')
+        .annotate(
+            has_quantity_tracking=Exists(
+                Date.objects.filter(user=user_profile, habit=OuterRef('pk'), quantity__gt=0)
+            ),
+        )
+    )
+    if not habits:
+        return []
+    habit_ids = [h.id for h in habits]
+
+    # Day entries of the displayed week
+    week_entries = {}
+    for entry in Date.objects.filter(
+        user=user_profile,
+        habit_id__in=habit_ids,
+        habit_date__range=[start_date, end_date],
+    ):
+        week_entries[(entry.habit_id, entry.habit_date)] = entry
+
+    # Completion history of this and the previous week
+    histories = load_histories(habit_ids, prev_week_start, end_date, user=user_profile)
+
+    # Streak state around today, needed when a future week is shown
+    streak_segments = {}
+    if prev_fri > today:
+        streak_segments = active_streak_segments(habit_ids, today - timedelta(days=1), today)
+
+    # Month totals (and the previous month in transition weeks) from the monthly rollup
+    month_starts = [start_of_month]
+    if is_transition_week:
+        month_starts.append(prev_start_of_month)
+    month_stats = {
+        (stat.habit_id, stat.month_start): stat
+        for stat in HabitMonthStat.objects.filter(habit_id__in=habit_ids, month_start__in=month_starts)
+    }
+
+    # Full (7/7) weeks from the weekly rollup for crown and award streaks
+    crown_window_start = start_date - timedelta(days=7 * (CROWN_LOOKBACK_WEEKS - 1))
+    full_weeks = defaultdict(set)
+    for habit_id, week_start in HabitWeekStat.objects.filter(
+        habit_id__in=habit_ids,
+        week_start__range=[crown_window_start, start_date],
+        on_time_count__gte=7,
+    ).values_list('habit_id', 'week_start'):
+        full_weeks[habit_id].add(week_start)
+
+    def month_figures(habit, month_start):
+        stat = month_stats.get((habit.id, month_start))
+        if stat is None:
+            return 0, 0
+        overflow = stat.overflow_sum if habit.has_quantity_tracking else 0
+        return overflow, stat.on_time_count
+
+    result = []
+    for habit in habits:
+        try:
+            habit_data = HabitSerializer(habit).data
+            history = histories[habit.id]
+
+            # Check previous week for streak continuation (Sunday, Saturday, Friday)
+            streak_today = None
+            for key, day in (
+                ('prev_week_sun_done', prev_sun),
+                ('prev_week_sat_done', prev_sat),
+                ('prev_week_fri_done', prev_fri),
+            ):
+                if day > today:
+                    if streak_today is None:
+                        streak_today = is_streak_active_on_date(
+                            streak_segments.get(habit.id, []), habit.start_date, today
+                        )
+                    habit_data[key] = streak_today
+                else:
+                    habit_data[key] = history.is_on_time(day)
+
+            # Count previous week completions for dot transition
+            habit_data['prev_week_count'] = history.totals(prev_week_start, prev_sun).on_time
+
+            latest_comment = habit.latest_comment_entry
+            habit_data['latest_comment'] = None
+            habit_data['latest_comment_details'] = None
+            if latest_comment:
+                habit_data['latest_comment'] = latest_comment.comment
+                habit_data['latest_comment_details'] = _entry_details(request, latest_comment)
+
+            latest_photo = habit.latest_photo_entry
+            habit_data['latest_photo'] = None
+            habit_data['latest_photo_details'] = None
+            if latest_photo:
+                habit_data['latest_photo_details'] = _entry_details(request, latest_photo)
+                habit_data['latest_photo'] = habit_data['latest_photo_details']['photo']
+
+            # Get statuses for the range (Monday to Sunday)
+            statuses = []
+            weekly_overflow = 0
+            for i in range(7):
+                current_date = start_date + timedelta(days=i)
+                date_entry = week_entries.get((habit.id, current_date))
+                is_done = date_entry.is_done if date_entry else False
+                qty = date_entry.quantity if date_entry else None
+
+                if is_done and habit.has_quantity_tracking and qty and qty > 0:
+                    weekly_overflow += qty
+
+                statuses.append({
+                    "date": current_date.isoformat(),
+                    "is_done": is_done,
+                    "is_restored": date_entry.is_restored if date_entry else False,
+                    "id": date_entry.id if date_entry else None,
+                    "quantity": qty,
+                    "comment": date_entry.comment if date_entry else None,
+                    "photo": _photo_url(request, date_entry),
+                })
+            habit_data['statuses'] = statuses
+            habit_data['weekly_overflow'] = weekly_overflow
+
+            # Monthly overflow (sum of positive quantities only) and total (on-time days)
+            monthly_overflow, monthly_total = month_figures(habit, start_of_month)
+            habit_data['monthly_overflow'] = monthly_overflow
+            habit_data['monthly_total'] = monthly_total
+
+            if is_transition_week:
+                prev_monthly_overflow, prev_monthly_total = month_figures(habit, prev_start_of_month)
+                habit_data['prev_monthly_overflow'] = prev_monthly_overflow
+                habit_data['prev_monthly_total'] = prev_monthly_total
+                habit_data['is_transition_week'] = True
+            else:
+                habit_data['is_transition_week'] = False
+
+            weekly_completions = history.totals(start_date, end_date).on_time
+
+            # Crown streak (consecutive weeks of 7/7 on-time completions)
+            habit_full_weeks = full_weeks[habit.id]
+            crown_streak = count_full_weeks(habit_full_weeks, start_date, limit=CROWN_LOOKBACK_WEEKS)
+            habit_data['crown_streak'] = crown_streak
+
+            weekly_award_streak = crown_streak if weekly_completions >= 7 else 1
+            if weekly_completions in [3, 4, 5, 6]:
+                award_weeks = count_full_weeks(habit_full_weeks, prev_week_start)
+                if prev_week_start - timedelta(days=7 * award_weeks) < crown_window_start:
+                    # Streak runs past the preloaded window: read the rest of the rollup
+                    habit_full_weeks = habit_full_weeks | set(HabitWeekStat.objects.filter(
+                        habit=habit, week_start__lt=crown_window_start, on_time_count__gte=7,
+                    ).values_list('week_start', flat=True))
+                    award_weeks = count_full_weeks(habit_full_weeks, prev_week_start)
+                weekly_award_streak += award_weeks
+            habit_data['weekly_award_streak'] = weekly_award_streak
+
+            result.append(habit_data)
+        except Exception as habit_e:
+            import traceback
+            print(f"ERROR: processing habit {habit.id}: {habit_e}")
+            traceback.print_exc()
+            # Skip problematic habit or add partial data
+            continue
+
+    return result
@@ -0,0 +1,167 @@
+"""
+Компактная история выполнения привычек по дням.
+
+Одна ячейка на день: флаги в array('B') и количество в array('l').
+Истории всех нужных привычек загружаются одним запросом, после чего
+счётчики, серии, недельные/месячные суммы и значки считаются в памяти
+операциями над буферами (bytes.count, translate, popcount), а не циклом
+по объектам datetime.date.
+"""
+from array import array
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from .models import IS_DONE, Date, DateStatus
+
+DONE = 1
+RESTORED = 2
+HAS_QUANTITY = 4
+
+# Таблицы для bytes.translate: флаги дня -> b'1' / b'0'
+ON_TIME_BITS = bytes(0x31 if code & (DONE | RESTORED) == DONE else 0x30 for code in range(256))
+DONE_BITS = bytes(0x31 if code & DONE else 0x30 for code in range(256))
+
+PeriodTotals = namedtuple('PeriodTotals', ['on_time', 'restored', 'quantity_sum', 'units'])
+
+
+class HabitHistory:
+    """
+    Day-by-day history of one habit from ``first_day`` (one slot per day).
+    Only completed (is_done) days are stored; everything else is a miss.
+    """
+    __slots__ = ('habit_id', 'first_day', 'flags', 'quantity')
+
+    def __init__(self, habit_id, first_day, size):
+        self.habit_id = habit_id
+        self.first_day = first_day
+        self.flags = array('B', bytes(size))
+        self.quantity = array('l', [0]) * size
+
+    def __len__(self):
+        return len(self.flags)
+
+    def add(self, habit_date, is_restored, quantity):
+        i = (habit_date - self.first_day).days
+        self.flags[i] = DONE | (RESTORED if is_restored else 0) | (HAS_QUANTITY if quantity is not None else 0)
+        self.quantity[i] = quantity or 0
+
+    def _bounds(self, first=None, last=None):
+        """Slice indexes for the days in [first, last], clipped to the stored range."""
+        size = len(self.flags)
+        if not size:
+            return 0, 0
+        i = 0 if first is None else min(max((first - self.first_day).days, 0), size)
+        j = size if last is None else min(max((last - self.first_day).days + 1, i), size)
+        return i, j
+
+    def _bits(self, table, first, last):
+        """b'1' / b'0' for every day in [first, last], days outside the stored range included."""
+        length = (last - first).days + 1
+        if length <= 0:
+            return b''
+        if not self.flags:
+            return b'0' * length
+        lead = min(max((self.first_day - first).days, 0), length)
+        i, j = self._bounds(first, last)
+        bits = b'0' * lead + self.flags[i:j].tobytes().translate(table)
+        return bits.ljust(length, b'0')
+
+    def _days(self, table, first=None, last=None):
+        i, j = self._bounds(first, last)
+        bits = self.flags[i:j].tobytes().translate(table)
+        return [self.first_day + timedelta(days=i + k) for k, bit in enumerate(bits) if bit == 0x31]
+
+    def is_on_time(self, day):
+        if not self.flags:
+            return False
+        i = (day - self.first_day).days
+        return 0 <= i < len(self.flags) and self.flags[i] & (DONE | RESTORED) == DONE
+
+    def totals(self, first=None, last=None):
+        """On-time days, restored days and quantities of the completed days in [first, last]."""
+        i, j = self._bounds(first, last)
+        codes = self.flags[i:j].tobytes()
+        quantity_sum = sum(self.quantity[i:j])
+        without_quantity = codes.count(DONE) + codes.count(DONE | RESTORED)
+        return PeriodTotals(
+            on_time=codes.count(DONE) + codes.count(DONE | HAS_QUANTITY),
+            restored=codes.count(DONE | RESTORED) + codes.count(DONE | RESTORED | HAS_QUANTITY),
+            quantity_sum=quantity_sum,
+            units=quantity_sum + without_quantity,
+        )
+
+    def done_days(self, first=None, last=None):
+        """Completed days (on time or restored) in [first, last]."""
+        return self._days(DONE_BITS, first, last)
+
+    def _first(self, table, first=None, last=None):
+        i, j = self._bounds(first, last)
+        k = self.flags[i:j].tobytes().translate(table).find(b'1')
+        return self.first_day + timedelta(days=i + k) if k >= 0 else None
+
+    def first_done(self, first=None, last=None):
+        return self._first(DONE_BITS, first, last)
+
+    def streak_days(self, first, last):
+        """
+        Days in [first, last] with an active streak: on time on the day and on
+        the day before. Counted as popcount of ``mask & (mask >> 1)``.
+        """
+        bits = self._bits(ON_TIME_BITS, first - timedelta(days=1), last)
+        if len(bits) < 2:
+            return 0
+        mask = int(bits, 2)
+        return (mask & (mask >> 1)).bit_count()
+
+    def week_counts(self, first, last):
+        """
+        On-time days per calendar week (Monday - Sunday) covering [first, last].
+        Days outside [first, last] are not counted, so the first and the last
+        week may be partial.
+        """
+        bits = b'0' * first.weekday() + self._bits(ON_TIME_BITS, first, last)
+        return [bits.count(b'1', k, k + 7) for k in range(0, len(bits), 7)]
+
+    def badge_histogram(self, first, last):
+        """
+        Histogram {on-time days in the week: number of weeks} for weeks covering
+        [first, last] (bincount of the week counts): one pass over the days.
+        """
+        return Counter(self.week_counts(first, last))
+
+
+def load_histories(habits, first=None, last=None, user=None):
+    """
+    Loads the histories of the given habits with one query.
+    Returns {habit_id: HabitHistory}; without ``first``/``last`` the whole
+    stored range of every habit is loaded.
+    """
+    habit_ids = [habit if isinstance(habit, int) else habit.id for habit in habits]
+    dates = Date.objects.filter(IS_DONE, habit_id__in=habit_ids)
+    if user is not None:
+        dates = dates.filter(user=user)
+    if first is not None:
+        dates = dates.filter(habit_date__gte=first)
+    if last is not None:
+        dates = dates.filter(habit_date__lte=last)
+
+    rows = {habit_id: [] for habit_id in habit_ids}
+    for habit_id, habit_date, status, quantity in dates.values_list('habit_id', 'habit_date', 'status', 'quantity'):
+        rows[habit_id].append((habit_date, status == DateStatus.RESTORED, quantity))
+
+    histories = {}
+    for habit_id, habit_rows in rows.items():
+        if habit_rows:
+            habit_first = first or min(row[0] for row in habit_rows)
+            habit_last = last or max(row[0] for row in habit_rows)
+        else:
+            habit_first = first
+            habit_last = last
+        if habit_first is None or habit_last is None:
+            history = HabitHistory(habit_id, habit_first or habit_last, 0)
+        else:
+            history = HabitHistory(habit_id, habit_first, max((habit_last - habit_first).days + 1, 0))
+        for row in habit_rows:
+            history.add(*row)
+        histories[habit_id] = history
+    return histories
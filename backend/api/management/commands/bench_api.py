@@ -0,0 +1,141 @@
+import json
+import math
+import platform
+import statistics
+import time
+from datetime import date
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.cache import CACHE_ALIAS
+from api.models import Date, Habit
+
+# (имя, URL, параметры); {habit} подставляется ID первой привычки пользователя
+ENDPOINTS = [
+    ('weekly_status', '/api/v1/habits/weekly_status/', {}),
+    ('quarterly_status', '/api/v1/habits/quarterly_status/', {}),
+    ('summary_report', '/api/v1/habits/summary_report/', {'period': 'all'}),
+    ('summary_report', '/api/v1/habits/summary_report/', {'period': 'month'}),
+    ('summary_report', '/api/v1/habits/summary_report/', {'period': 'year'}),
+    ('daily_statistics', '/api/v1/habits/daily_statistics/', {'period': 'week'}),
+    ('daily_statistics', '/api/v1/habits/daily_statistics/', {'period': 'month'}),
+    ('daily_statistics', '/api/v1/habits/daily_statistics/', {'period': 'year'}),
+    ('analytics_chart', '/api/v1/habits/analytics_chart/', {}),
+    ('habit_comparison', '/api/v1/habits/habit_comparison/', {'period': 'month'}),
+    ('habit_comparison', '/api/v1/habits/habit_comparison/', {'period': 'year'}),
+    ('report', '/api/v1/habits/{habit}/report/', {'period': 'month'}),
+    ('report', '/api/v1/habits/{habit}/report/', {'period': 'year'}),
+    ('export', '/api/v1/habits/export/', {}),
+]
+
+
+def percentile(values, share):
+    """Перцентиль по методу ближайшего ранга; values отсортированы."""
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Замерить время ответа и число SQL-запросов аналитических эндпоинтов через тестовый клиент'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='load_0', help='Логин пользователя (см. seed_load)')
+        parser.add_argument('--repeat', type=int, default=20, help='Замеров на эндпоинт')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на эндпоинт')
+        parser.add_argument('--date', help='Опорная дата YYYY-MM-DD (по умолчанию — сегодня)')
+        parser.add_argument('--only', action='append', help='Замерить только этот эндпоинт (можно несколько раз)')
+        parser.add_argument('--cached', action='store_true',
+                            help='Замерять ответы из кэша аналитики; по умолчанию кэш очищается перед каждым '
+                                 'запросом (весь алиас analytics — не запускайте на общем Redis)')
+        parser.add_argument('--label', default='', help='Метка прогона, например версия или ветка')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        auth = User.objects.filter(username=options['user']).select_related('user_profile').first()
+        if auth is None or not hasattr(auth, 'user_profile'):
+            raise CommandError(f"Пользователь {options['user']} не найден. Создайте данные: manage.py seed_load")
+        profile = auth.user_profile
+        habit = Habit.objects.filter(user=profile, is_archived=False).order_by('order').first()
+        if habit is None:
+            raise CommandError(f"У пользователя {options['user']} нет привычек")
+        reference_date = options['date'] or date.today().isoformat()
+
+        client = APIClient()
+        client.force_authenticate(user=auth)
+        mode = 'cached' if options['cached'] else 'cold'
+        if options['cached']:
+            self.stdout.write(f"Режим: {mode} — ответы из кэша аналитики")
+        else:
+            self.stdout.write(f"Режим: {mode} — кэш аналитики очищается перед каждым запросом")
+
+        results = []
+        for name, url, params in ENDPOINTS:
+            if options['only'] and name not in options['only']:
+                continue
+            url = url.format(habit=habit.id)
+            params = {'date': reference_date, **params}
+            result = self._bench(client, name, url, params, options['repeat'], options['warmup'], options['cached'])
+            results.append(result)
+            self.stdout.write(
+                f"{name:<18} {params.get('period', ''):<6} queries={result['queries']:<3} "
+                f"p50={result['p50_ms']:>8.1f}ms p90={result['p90_ms']:>8.1f}ms p99={result['p99_ms']:>8.1f}ms"
+            )
+
+        report = {
+            'label': options['label'],
+            'mode': mode,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'user': options['user'],
+            'habits': Habit.objects.filter(user=profile).count(),
+            'dates': Date.objects.filter(user=profile).count(),
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
+
+    def _bench(self, client, name, url, params, repeat, warmup, cached):
+        cache = caches[CACHE_ALIAS]
+        for _ in range(warmup):
+            if not cached:
+                cache.clear()
+            client.get(url, params)
+
+        timings = []
+        query_counts = set()
+        for _ in range(max(1, repeat)):
+            if not cached:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{url} {params}: HTTP {response.status_code}")
+            query_counts.add(len(queries.captured_queries))
+
+        timings.sort()
+        return {
+            'endpoint': name,
+            'url': url,
+            'params': params,
+            'queries': max(query_counts),
+            'bytes': len(response.content),
+            'min_ms': round(timings[0], 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p90_ms': round(percentile(timings, 0.9), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(timings[-1], 2),
+        }
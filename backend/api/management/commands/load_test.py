@@ -0,0 +1,321 @@
+import http.client
+import importlib.util
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Сценарии: список запросов (метод, путь, параметры); тело update_status собирается в run_worker
+SCENARIOS = {
+    'dashboard': [
+        ('GET', '/api/auth/me/', None),
+        ('GET', '/api/v1/categories/', None),
+        ('GET', '/api/v1/habits/weekly_status/', None),
+    ],
+    'checkin': [
+        ('POST', '/api/v1/habits/update_status/', None),
+    ],
+    'analytics': [
+        ('GET', '/api/v1/habits/summary_report/', {'period': 'month'}),
+        ('GET', '/api/v1/habits/daily_statistics/', {'period': 'month'}),
+        ('GET', '/api/v1/habits/analytics_chart/', None),
+        ('GET', '/api/v1/habits/habit_comparison/', {'period': 'month'}),
+    ],
+}
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class LoadClient:
+    """HTTP-клиент одного виртуального пользователя: keep-alive соединение и сессионная авторизация."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, params=None, body=None):
+        if method == 'GET' and params:
+            path = f'{path}?{urlencode(params)}'
+        headers = {'Accept': 'application/json'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+            if 'csrftoken' in self.cookies:
+                headers['X-CSRFToken'] = self.cookies['csrftoken']
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body=payload, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # Сервер закрыл keep-alive соединение — переподключаемся один раз
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response.status, data
+
+    def login(self, username, password):
+        status, data = self.request('POST', '/api/auth/login/', body={'username': username, 'password': password})
+        if status != 200:
+            raise RuntimeError(f'Вход {username} не удался: HTTP {status}')
+        status, data = self.request('GET', '/api/v1/habits/')
+        habits = json.loads(data) if status == 200 else []
+        if isinstance(habits, dict):
+            habits = habits.get('results', [])
+        return [h['id'] for h in habits]
+
+
+def run_worker(options):
+    """Тело процесса нагрузки: крутит сценарии до истечения duration и возвращает сырые замеры по эндпоинтам."""
+    rnd = random.Random(options['seed'])
+    names = list(options['mix'])
+    weights = [options['mix'][name] for name in names]
+    stats = {}
+
+    def record(endpoint, elapsed, ok):
+        entry = stats.setdefault(endpoint, {'latencies': [], 'errors': 0})
+        entry['latencies'].append(elapsed * 1000)
+        entry['errors'] += not ok
+
+    clients = []
+    for username in options['users']:
+        client = LoadClient(options['base_url'], options['timeout'])
+        started = time.perf_counter()
+        try:
+            habit_ids = client.login(username, options['password'])
+        except (RuntimeError, OSError, http.client.HTTPException, ValueError):
+            record('auth/login', time.perf_counter() - started, False)
+            continue
+        record('auth/login', time.perf_counter() - started, True)
+        clients.append((client, habit_ids))
+    if not clients:
+        return stats
+
+    today = date.today().isoformat()
+    deadline = time.monotonic() + options['duration']
+    # Пользователи процесса не пересекаются с другими процессами (см. Command._run),
+    # поэтому переключатель отметки не спорит с чужими запросами за ту же привычку и день
+    done_today = set()
+    while time.monotonic() < deadline:
+        client, habit_ids = rnd.choice(clients)
+        for method, path, params in SCENARIOS[rnd.choices(names, weights)[0]]:
+            body = None
+            if method == 'POST':
+                if not habit_ids:
+                    continue
+                habit_id = rnd.choice(habit_ids)
+                # Отметка и снятие отметки чередуются, чтобы данные не разрастались
+                key = (id(client), habit_id)
+                body = {'habit_id': habit_id, 'date': today, 'is_done': key not in done_today}
+                done_today.symmetric_difference_update({key})
+            endpoint = path.removeprefix('/api/').removeprefix('v1/habits/').removeprefix('v1/').strip('/')
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, params, body)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+            record(endpoint, time.perf_counter() - started, ok)
+        if options['think_time']:
+            time.sleep(rnd.uniform(0, 2 * options['think_time']))
+    return stats
+
+
+def percentile(values, share):
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def histogram(latencies):
+    buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for value in latencies:
+        index = next((i for i, bound in enumerate(HISTOGRAM_BOUNDS) if value <= bound), len(HISTOGRAM_BOUNDS))
+        buckets[index] += 1
+    labels = [f'<={bound}ms' for bound in HISTOGRAM_BOUNDS] + [f'>{HISTOGRAM_BOUNDS[-1]}ms']
+    return dict(zip(labels, buckets))
+
+
+def summarize(stats, duration):
+    """Сводка по эндпоинтам: RPS, доля ошибок, перцентили и гистограмма задержек."""
+    rows = {}
+    for endpoint, entry in sorted(stats.items()):
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        rows[endpoint] = {
+            'requests': count,
+            'rps': round(count / duration, 2),
+            'errors': entry['errors'],
+            'error_rate': round(entry['errors'] / count, 4) if count else 0,
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p90_ms': round(percentile(latencies, 0.9), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'histogram': histogram(latencies),
+        }
+    return rows
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест API: сценарии с сессионной авторизацией из пула процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес уже запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--workers', type=int, default=3, help='Воркеров gunicorn при запуске своего сервера')
+        parser.add_argument('--processes', type=int, default=6, help='Процессов-генераторов нагрузки')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность, секунд')
+        parser.add_argument('--users', type=int, default=10,
+                            help='Сколько пользователей seed_load задействовать; не меньше числа процессов')
+        parser.add_argument('--prefix', default='load', help='Префикс логинов seed_load')
+        parser.add_argument('--password', default='load-password', help='Пароль пользователей seed_load')
+        parser.add_argument('--mix', default='dashboard=6,checkin=3,analytics=1',
+                            help='Веса сценариев: dashboard, checkin, analytics')
+        parser.add_argument('--think-time', type=float, default=0, help='Средняя пауза между сценариями, секунд')
+        parser.add_argument('--timeout', type=float, default=30, help='Таймаут запроса, секунд')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора случайных чисел')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options['mix'])
+        if max(1, options['processes']) > max(1, options['users']):
+            raise CommandError(
+                f"Процессов ({options['processes']}) больше, чем пользователей ({options['users']}): "
+                "каждому процессу нужны свои пользователи, иначе их отметки конфликтуют. "
+                "Увеличьте --users (manage.py seed_load --users N) или уменьшите --processes."
+            )
+        server = None
+        base_url = options['url']
+        if not base_url:
+            server, base_url = self._start_server(options['workers'])
+        try:
+            stats, elapsed = self._run(base_url, mix, options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+        rows = summarize(stats, elapsed)
+        if not rows:
+            raise CommandError('Нет ни одного замера: проверьте адрес сервера и пользователей (manage.py seed_load)')
+        self._print(rows)
+        if options['output']:
+            report = {
+                'url': base_url,
+                'processes': options['processes'],
+                'duration': round(elapsed, 2),
+                'mix': mix,
+                'endpoints': rows,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
+
+    def _parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name.strip() not in SCENARIOS:
+                raise CommandError(f"Неизвестный сценарий: {name}. Доступны: {', '.join(SCENARIOS)}")
+            mix[name.strip()] = float(weight or 1)
+        return mix
+
+    def _start_server(self, workers):
+        """Поднимает приложение на свободном порту: gunicorn, если установлен, иначе runserver."""
+        port = free_port()
+        env = {**os.environ, 'DEBUG': 'False'}
+        if importlib.util.find_spec('gunicorn'):
+            command = [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application',
+                       '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+        else:
+            self.stdout.write(self.style.WARNING('gunicorn не установлен — используется manage.py runserver'))
+            command = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Сервер завершился с кодом {server.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server, f'http://127.0.0.1:{port}'
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('Сервер не начал принимать соединения за 30 секунд')
+
+    def _run(self, base_url, mix, options):
+        usernames = [f"{options['prefix']}_{i}" for i in range(max(1, options['users']))]
+        processes = max(1, options['processes'])
+        jobs = [{
+            'base_url': base_url,
+            'users': usernames[i::processes],
+            'password': options['password'],
+            'duration': options['duration'],
+            'mix': mix,
+            'think_time': options['think_time'],
+            'timeout': options['timeout'],
+            'seed': options['seed'] * 1000 + i,
+        } for i in range(processes)]
+
+        self.stdout.write(f"Нагрузка на {base_url}: {processes} процессов, {options['duration']} с...")
+        started = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(run_worker, jobs)
+        elapsed = time.perf_counter() - started
+
+        stats = {}
+        for result in results:
+            for endpoint, entry in result.items():
+                merged = stats.setdefault(endpoint, {'latencies': [], 'errors': 0})
+                merged['latencies'].extend(entry['latencies'])
+                merged['errors'] += entry['errors']
+        return stats, elapsed
+
+    def _print(self, rows):
+        self.stdout.write(f"{'endpoint':<20} {'req':>7} {'rps':>8} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        for endpoint, row in rows.items():
+            self.stdout.write(
+                f"{endpoint:<20} {row['requests']:>7} {row['rps']:>8.1f} {row['error_rate'] * 100:>6.1f} "
+                f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+            )
+        total = sum(row['requests'] for row in rows.values())
+        self.stdout.write(f"Всего запросов: {total}, RPS: {sum(row['rps'] for row in rows.values()):.1f}")
+        merged = {}
+        for row in rows.values():
+            for label, count in row['histogram'].items():
+                merged[label] = merged.get(label, 0) + count
+        self.stdout.write('Гистограмма задержек:')
+        for label, count in merged.items():
+            bar = '#' * round(40 * count / total) if total else ''
+            self.stdout.write(f"  {label:>9} {count:>7} {bar}")
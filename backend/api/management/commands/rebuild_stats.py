@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Habit
+from api.rollups import rebuild_habit_rollups
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать сводные таблицы статистики привычек из записей Date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='ID профиля UserAll (по умолчанию — все пользователи)')
+        parser.add_argument('--habit', type=int, action='append', help='ID привычки (можно указать несколько раз)')
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.order_by('id')
+        if options['user']:
+            habits = habits.filter(user_id=options['user'])
+        if options['habit']:
+            habits = habits.filter(id__in=options['habit'])
+
+        habit_ids = list(habits.values_list('id', flat=True))
+        total = 0
+        for i in range(0, len(habit_ids), CHUNK_SIZE):
+            chunk = Habit.objects.filter(id__in=habit_ids[i:i + CHUNK_SIZE])
+            total += rebuild_habit_rollups(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово. Привычек: {len(habit_ids)}, строк сводки: {total}."
+        ))
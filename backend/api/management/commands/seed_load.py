@@ -0,0 +1,111 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Category, Date, DateStatus, Habit, UserAll
+from api.rollups import rebuild_habit_rollups
+
+CATEGORY_NAMES = ('Здоровье', 'Работа', 'Душа', 'Личное')
+HABIT_NAMES = (
+    'Зарядка', 'Чтение', 'Медитация', 'Вода', 'Прогулка', 'Английский', 'Дневник', 'Без сахара',
+    'Отжимания', 'Сон до 23:00', 'Растяжка', 'Планирование', 'Бег', 'Уборка', 'Музыка',
+)
+COMMENTS = ('Тяжело, но сделал', 'Отличный день', 'Пропустил из-за работы', 'Новый рекорд', 'Устал')
+PHOTO_PATH = 'habit_photos/seed.jpg'
+
+
+class Command(BaseCommand):
+    help = 'Создать синтетических пользователей с привычками и многолетней историей отметок для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Количество пользователей')
+        parser.add_argument('--habits', type=int, default=30, help='Привычек на пользователя')
+        parser.add_argument('--years', type=float, default=3, help='Длина истории в годах')
+        parser.add_argument('--prefix', default='load', help='Префикс логинов: <prefix>_<номер>')
+        parser.add_argument('--password', default='load-password', help='Пароль созданных пользователей')
+        parser.add_argument('--seed', type=int, default=0, help='Seed генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--clear', action='store_true', help='Удалить ранее созданных пользователей с этим префиксом')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=f'{prefix}_').delete()
+            UserAll.objects.filter(auth_user__isnull=True, name__startswith=f'{prefix}_').delete()
+            self.stdout.write(f"Удалено объектов: {deleted}")
+
+        usernames = [f'{prefix}_{i}' for i in range(options['users'])]
+        existing = list(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        if existing:
+            raise CommandError(f"Пользователи уже существуют: {', '.join(existing[:5])}. Используйте --clear.")
+
+        rnd = random.Random(options['seed'])
+        last_day = date.today() - timedelta(days=1)
+        days = max(1, int(options['years'] * 365))
+        total = 0
+        for username in usernames:
+            with transaction.atomic():
+                total += self._seed_user(rnd, username, options, last_day, days)
+            self.stdout.write(f"  {username}: готово")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово. Пользователей: {len(usernames)}, записей Date: {total}."
+        ))
+
+    def _seed_user(self, rnd, username, options, last_day, days):
+        auth = User.objects.create_user(username=username, password=options['password'])
+        profile = UserAll.objects.create(auth_user=auth, name=username, age='')
+        categories = [
+            Category.objects.create(user=profile, name=name, order=i) for i, name in enumerate(CATEGORY_NAMES)
+        ]
+
+        habits = []
+        for i in range(options['habits']):
+            # Привычки заводятся не одновременно: часть истории короче общей
+            history = days if i < options['habits'] // 2 else rnd.randint(max(1, days // 10), days)
+            name = HABIT_NAMES[i % len(HABIT_NAMES)]
+            if i >= len(HABIT_NAMES):
+                name = f'{name} {i // len(HABIT_NAMES) + 1}'
+            habits.append(Habit.objects.create(
+                user=profile, name=name, category=rnd.choice(categories + [None]), order=i,
+                start_date=last_day - timedelta(days=history - 1),
+                is_archived=rnd.random() < 0.1,
+            ))
+
+        batch = []
+        created = 0
+        for habit in habits:
+            for entry in self._entries(rnd, profile, habit, last_day):
+                batch.append(entry)
+                if len(batch) >= options['batch_size']:
+                    created += len(Date.objects.bulk_create(batch))
+                    batch = []
+        if batch:
+            created += len(Date.objects.bulk_create(batch))
+
+        rebuild_habit_rollups(Habit.objects.filter(user=profile))
+        return created
+
+    def _entries(self, rnd, profile, habit, last_day):
+        """Отметки одной привычки: серии выполнений (цепь Маркова), восстановленные дни, количества, комментарии и фото."""
+        keep_streak = rnd.uniform(0.75, 0.95)  # вероятность продолжить серию
+        resume = rnd.uniform(0.15, 0.5)  # вероятность начать серию после пропуска
+        counted = rnd.random() < 0.3
+        typical_quantity = rnd.choice((10, 20, 30, 50, 100))
+        done = False
+        day = habit.start_date
+        while day <= last_day:
+            done = rnd.random() < (keep_streak if done else resume)
+            comment = rnd.choice(COMMENTS) if rnd.random() < 0.04 else None
+            photo = PHOTO_PATH if rnd.random() < 0.01 else None
+            if done:
+                status = DateStatus.RESTORED if rnd.random() < 0.08 else DateStatus.ON_TIME
+                quantity = max(1, int(rnd.gauss(typical_quantity, typical_quantity / 4))) if counted else None
+                yield Date(user=profile, habit=habit, habit_date=day, status=status,
+                           quantity=min(quantity, 999) if quantity else None, comment=comment, photo=photo)
+            elif comment or photo:
+                yield Date(user=profile, habit=habit, habit_date=day, comment=comment, photo=photo)
+            day += timedelta(days=1)
@@ -0,0 +1,42 @@
+"""
+Профиль UserAll текущего пользователя — один раз на запрос.
+
+ProfileMiddleware кладёт в request.profile ленивый объект: профиль ищется
+только при первом обращении, уже после аутентификации DRF (DRF копирует
+пользователя в исходный HttpRequest). Для входа через сессию id профиля
+запоминается в сессии, и следующие запросы обходятся без запроса к UserAll.
+"""
+from django.utils.functional import SimpleLazyObject
+
+from .models import UserAll
+
+PROFILE_SESSION_KEY = '_profile_id'
+
+
+def resolve_profile(request):
+    """UserAll пользователя запроса (создаётся при первом обращении) или None для анонима."""
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    session = getattr(request, 'session', None)
+    # id кэшируется только в сессии этого же пользователя: login/logout очищают её
+    session_login = session is not None and session.get('_auth_user_id') == str(user.pk)
+    if session_login and PROFILE_SESSION_KEY in session:
+        # Остальные поля догружаются при обращении, save() обновит только загруженные
+        return UserAll.from_db(None, ['id', 'auth_user_id'], [session[PROFILE_SESSION_KEY], user.pk])
+    profile, _ = UserAll.objects.get_or_create(
+        auth_user=user,
+        defaults={'name': user.username, 'age': ''}
+    )
+    if session_login:
+        session[PROFILE_SESSION_KEY] = profile.pk
+    return profile
+
+
+class ProfileMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: resolve_profile(request))
+        return self.get_response(request)
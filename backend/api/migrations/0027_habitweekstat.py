@@ -0,0 +1,60 @@
+# Generated by Django 5.2.9 on 2026-10-18 17:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncWeek
+
+
+def fill_week_stats(apps, schema_editor):
+    Date = apps.get_model('api', 'Date')
+    HabitWeekStat = apps.get_model('api', 'HabitWeekStat')
+    rows = (
+        Date.objects.filter(is_done=True)
+        .annotate(week=TruncWeek('habit_date'))
+        .values('habit_id', 'week')
+        .annotate(
+            on_time_count=Count('id', filter=Q(is_restored=False)),
+            quantity_sum=Sum('quantity', filter=Q(quantity__gte=1), default=0),
+        )
+        .order_by()
+    )
+    HabitWeekStat.objects.bulk_create(
+        (
+            HabitWeekStat(
+                habit_id=row['habit_id'],
+                week_start=row['week'],
+                on_time_count=row['on_time_count'],
+                quantity_sum=row['quantity_sum'],
+            )
+            for row in rows.iterator()
+            if row['on_time_count'] or row['quantity_sum']
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_add_created_at_to_category_and_habit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitWeekStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField(verbose_name='Начало недели')),
+                ('on_time_count', models.PositiveSmallIntegerField(default=0, verbose_name='Выполнено вовремя')),
+                ('quantity_sum', models.IntegerField(default=0, verbose_name='Сумма количества')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='week_stats', to='api.habit')),
+            ],
+            options={
+                'verbose_name': 'Недельная статистика',
+                'verbose_name_plural': 'Недельная статистика',
+                'unique_together': {('habit', 'week_start')},
+            },
+        ),
+        migrations.RunPython(fill_week_stats, migrations.RunPython.noop),
+    ]
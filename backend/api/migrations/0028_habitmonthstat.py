@@ -0,0 +1,66 @@
+# Generated by Django 5.2.9 on 2026-10-18 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_month_stats(apps, schema_editor):
+    Date = apps.get_model('api', 'Date')
+    HabitMonthStat = apps.get_model('api', 'HabitMonthStat')
+    rows = (
+        Date.objects.filter(is_done=True)
+        .annotate(month=TruncMonth('habit_date'))
+        .values('habit_id', 'month')
+        .annotate(
+            done_count=Count('id'),
+            on_time_count=Count('id', filter=Q(is_restored=False)),
+            restored_count=Count('id', filter=Q(is_restored=True)),
+            quantity_count=Count('quantity'),
+            quantity_sum=Sum('quantity', default=0),
+            overflow_sum=Sum('quantity', filter=Q(quantity__gte=1), default=0),
+        )
+        .order_by()
+    )
+    HabitMonthStat.objects.bulk_create(
+        (
+            HabitMonthStat(
+                habit_id=row.pop('habit_id'),
+                month_start=row.pop('month'),
+                **row,
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_habitweekstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitMonthStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month_start', models.DateField(verbose_name='Начало месяца')),
+                ('done_count', models.PositiveSmallIntegerField(default=0, verbose_name='Выполнено')),
+                ('on_time_count', models.PositiveSmallIntegerField(default=0, verbose_name='Выполнено вовремя')),
+                ('restored_count', models.PositiveSmallIntegerField(default=0, verbose_name='Восполнено')),
+                ('quantity_count', models.PositiveSmallIntegerField(default=0, verbose_name='Записей с количеством')),
+                ('quantity_sum', models.IntegerField(default=0, verbose_name='Сумма количества')),
+                ('overflow_sum', models.IntegerField(default=0, verbose_name='Сумма положительного количества')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_stats', to='api.habit')),
+            ],
+            options={
+                'verbose_name': 'Месячная статистика',
+                'verbose_name_plural': 'Месячная статистика',
+                'unique_together': {('habit', 'month_start')},
+            },
+        ),
+        migrations.RunPython(fill_month_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:03
+
+from itertools import groupby
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.streaks import streak_segments
+
+
+def fill_streak_segments(apps, schema_editor):
+    Date = apps.get_model('api', 'Date')
+    HabitStreakSegment = apps.get_model('api', 'HabitStreakSegment')
+    rows = (
+        Date.objects.filter(is_done=True, is_restored=False)
+        .order_by('habit_id', 'habit_date')
+        .values_list('habit_id', 'habit_date')
+    )
+    segments = []
+    for habit_id, habit_rows in groupby(rows.iterator(), key=lambda row: row[0]):
+        segments.extend(
+            HabitStreakSegment(habit_id=habit_id, start_date=start, end_date=end, is_active=active)
+            for start, end, active in streak_segments(day for _, day in habit_rows)
+        )
+    HabitStreakSegment.objects.bulk_create(segments, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_habitmonthstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitStreakSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Начало отрезка')),
+                ('end_date', models.DateField(verbose_name='Конец отрезка')),
+                ('is_active', models.BooleanField(default=False, verbose_name='Серия активна')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='streak_segments', to='api.habit')),
+            ],
+            options={
+                'verbose_name': 'Отрезок серии',
+                'verbose_name_plural': 'Отрезки серий',
+                'indexes': [models.Index(fields=['habit', 'is_active', 'end_date'], name='api_streak_active_end_idx')],
+                'unique_together': {('habit', 'start_date')},
+            },
+        ),
+        migrations.RunPython(fill_streak_segments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_latest_entries(apps, schema_editor):
+    Date = apps.get_model('api', 'Date')
+    Habit = apps.get_model('api', 'Habit')
+    habit_dates = Date.objects.filter(habit=OuterRef('pk')).order_by('-habit_date', '-id').values('id')
+    Habit.objects.update(
+        latest_comment_entry=Subquery(
+            habit_dates.filter(comment__isnull=False).exclude(comment__exact='')[:1]
+        ),
+        latest_photo_entry=Subquery(
+            habit_dates.exclude(photo=None).exclude(photo='')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_habitstreaksegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='latest_comment_entry',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.date', verbose_name='Последний комментарий'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='latest_photo_entry',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.date', verbose_name='Последнее фото'),
+        ),
+        migrations.RunPython(fill_latest_entries, migrations.RunPython.noop),
+    ]
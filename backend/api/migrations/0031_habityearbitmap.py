@@ -0,0 +1,58 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:26
+
+from collections import defaultdict
+
+import api.bitmaps
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+
+from api.bitmaps import pack_days
+
+
+def fill_year_bitmaps(apps, schema_editor):
+    Date = apps.get_model('api', 'Date')
+    HabitYearBitmap = apps.get_model('api', 'HabitYearBitmap')
+    days = defaultdict(lambda: ([], []))
+    rows = Date.objects.filter(Q(is_done=True) | Q(is_restored=True)).values_list(
+        'habit_id', 'habit_date', 'is_done', 'is_restored'
+    )
+    for habit_id, habit_date, is_done, is_restored in rows.iterator():
+        done_days, restored_days = days[habit_id, habit_date.year]
+        if is_done:
+            done_days.append(habit_date)
+        if is_restored:
+            restored_days.append(habit_date)
+    HabitYearBitmap.objects.bulk_create(
+        [
+            HabitYearBitmap(habit_id=habit_id, year=year, done=pack_days(done), restored=pack_days(restored))
+            for (habit_id, year), (done, restored) in days.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_habit_latest_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitYearBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('done', models.BinaryField(default=api.bitmaps.empty_year, max_length=46, verbose_name='Выполнено')),
+                ('restored', models.BinaryField(default=api.bitmaps.empty_year, max_length=46, verbose_name='Восполнено')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='year_bitmaps', to='api.habit')),
+            ],
+            options={
+                'verbose_name': 'Годовая карта выполнения',
+                'verbose_name_plural': 'Годовые карты выполнения',
+                'unique_together': {('habit', 'year')},
+            },
+        ),
+        migrations.RunPython(fill_year_bitmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+import secrets
+
+from django.db import migrations
+from django.utils.text import slugify
+
+BATCH_SIZE = 1000
+
+
+def random_slug(name):
+    suffix = secrets.token_hex(4)
+    slug = slugify(name)[:100 - len(suffix) - 1].strip('-')
+    return f'{slug}-{suffix}' if slug else suffix
+
+
+def fill_missing_slugs(apps, schema_editor):
+    """
+    Give rows saved without a slug (bulk writes bypass save()) a slug in the suffix format.
+    Date is skipped: 0033 drops its slug column.
+    """
+    for model_name in ('UserAll', 'Category', 'Habit'):
+        model = apps.get_model('api', model_name)
+        batch = []
+        for obj in model.objects.filter(slug='').only('id', 'name').iterator(chunk_size=BATCH_SIZE):
+            obj.slug = random_slug(obj.name)
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ['slug'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_habityearbitmap'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:42
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_fill_missing_slugs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='date',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='date',
+            name='slug',
+        ),
+    ]
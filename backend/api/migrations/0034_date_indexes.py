@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_date_drop_name_slug'),
+    ]
+
+    operations = [
+        # Индексы создаются до снятия индексов внешних ключей: MySQL не даёт удалить
+        # единственный индекс, на который опирается FOREIGN KEY (ошибка 1553)
+        migrations.AddIndex(
+            model_name='date',
+            index=models.Index(fields=['habit', 'user', 'habit_date', 'is_done', 'is_restored', 'quantity'], name='api_date_done_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='date',
+            index=models.Index(condition=models.Q(('comment__isnull', False), models.Q(('comment', ''), _negated=True)), fields=['habit', '-habit_date', '-id'], name='api_date_comment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='date',
+            index=models.Index(condition=models.Q(('photo__isnull', False), models.Q(('photo', ''), _negated=True)), fields=['habit', '-habit_date', '-id'], name='api_date_photo_idx'),
+        ),
+        migrations.AlterField(
+            model_name='date',
+            name='habit',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='date', to='api.habit'),
+        ),
+        migrations.AlterField(
+            model_name='date',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='date', to='api.userall'),
+        ),
+    ]
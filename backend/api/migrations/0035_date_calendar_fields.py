@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_calendar_fields(apps, schema_editor):
+    """Fill week_start / month_start / year of existing Date rows in batches."""
+    Date = apps.get_model('api', 'Date')
+    batch = []
+    for entry in Date.objects.only('id', 'habit_date').iterator(chunk_size=BATCH_SIZE):
+        entry.week_start = entry.habit_date - timedelta(days=entry.habit_date.weekday())
+        entry.month_start = entry.habit_date.replace(day=1)
+        entry.year = entry.habit_date.year
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            Date.objects.bulk_update(batch, ['week_start', 'month_start', 'year'])
+            batch = []
+    if batch:
+        Date.objects.bulk_update(batch, ['week_start', 'month_start', 'year'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='date',
+            name='week_start',
+            field=models.DateField(editable=False, null=True, verbose_name='Начало недели'),
+        ),
+        migrations.AddField(
+            model_name='date',
+            name='month_start',
+            field=models.DateField(editable=False, null=True, verbose_name='Начало месяца'),
+        ),
+        migrations.AddField(
+            model_name='date',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Год'),
+        ),
+        migrations.RunPython(fill_calendar_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='date',
+            name='week_start',
+            field=models.DateField(editable=False, verbose_name='Начало недели'),
+        ),
+        migrations.AlterField(
+            model_name='date',
+            name='month_start',
+            field=models.DateField(editable=False, verbose_name='Начало месяца'),
+        ),
+        migrations.AlterField(
+            model_name='date',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False, verbose_name='Год'),
+        ),
+        # Новый индекс создаётся под временным именем до удаления старого, чтобы у внешнего
+        # ключа habit всё время был индекс (MySQL не даёт удалить последний, ошибка 1553)
+        migrations.AddIndex(
+            model_name='date',
+            index=models.Index(fields=['habit', 'user', 'habit_date', 'is_done', 'is_restored', 'quantity', 'week_start', 'month_start', 'year'], name='api_date_done_cover_tmp'),
+        ),
+        migrations.RemoveIndex(
+            model_name='date',
+            name='api_date_done_cover_idx',
+        ),
+        migrations.RenameIndex(
+            model_name='date',
+            new_name='api_date_done_cover_idx',
+            old_name='api_date_done_cover_tmp',
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations, models
+from django.db.models import BooleanField, Case, ExpressionWrapper, Q, When
+
+MISSED, COMMENT_ONLY, ON_TIME, RESTORED = range(4)
+
+
+def fill_status(apps, schema_editor):
+    """Encode is_done / is_restored (and comment/photo presence for misses) into status with one UPDATE."""
+    Date = apps.get_model('api', 'Date')
+    has_note = (Q(comment__isnull=False) & ~Q(comment='')) | (Q(photo__isnull=False) & ~Q(photo=''))
+    Date.objects.update(status=Case(
+        When(is_done=True, is_restored=True, then=RESTORED),
+        When(is_done=True, then=ON_TIME),
+        When(has_note, then=COMMENT_ONLY),
+        default=MISSED,
+    ))
+
+
+def fill_flags(apps, schema_editor):
+    Date = apps.get_model('api', 'Date')
+    Date.objects.update(
+        is_done=ExpressionWrapper(Q(status__gte=ON_TIME), output_field=BooleanField()),
+        is_restored=ExpressionWrapper(Q(status=RESTORED), output_field=BooleanField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_date_calendar_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='date',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Не выполнено'), (1, 'Только комментарий'), (2, 'Выполнено вовремя'), (3, 'Восполнено')], default=0, verbose_name='Статус'),
+        ),
+        migrations.RunPython(fill_status, fill_flags),
+        # Новый индекс создаётся под временным именем до удаления старого, чтобы у внешнего
+        # ключа habit всё время был индекс (MySQL не даёт удалить последний, ошибка 1553)
+        migrations.AddIndex(
+            model_name='date',
+            index=models.Index(fields=['habit', 'user', 'habit_date', 'status', 'quantity', 'week_start', 'month_start', 'year'], name='api_date_done_cover_tmp'),
+        ),
+        migrations.RemoveIndex(
+            model_name='date',
+            name='api_date_done_cover_idx',
+        ),
+        migrations.RemoveField(
+            model_name='date',
+            name='is_done',
+        ),
+        migrations.RemoveField(
+            model_name='date',
+            name='is_restored',
+        ),
+        migrations.RenameIndex(
+            model_name='date',
+            new_name='api_date_done_cover_idx',
+            old_name='api_date_done_cover_tmp',
+        ),
+    ]
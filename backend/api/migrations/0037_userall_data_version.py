@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:20
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_date_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userall',
+            name='data_version',
+            field=models.BigIntegerField(default=api.models.new_data_version, editable=False, verbose_name='Версия данных'),
+        ),
+    ]
@@ -1,17 +1,79 @@
-from django.db import models
+import secrets
+import time
+from datetime import date, timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, ExtractYear, Greatest, Trunc
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django.core.validators import MinLengthValidator, MaxValueValidator, MinValueValidator
 
-
-def unique_slugify(instance, slug):
-    model = instance.__class__
-    unique_slug = slug
-    num = 1
-    while model.objects.filter(slug=unique_slug).exclude(id=instance.id).exists():
-        unique_slug = f'{slug}-{num}'
-        num += 1
-    return unique_slug
+from .bitmaps import YEAR_BYTES, empty_year
+
+
+# Длина случайного суффикса слага в байтах (8 hex-символов)
+SLUG_SUFFIX_BYTES = 4
+SLUG_MAX_LENGTH = 100
+# Сколько раз сгенерировать суффикс заново, если он совпал с уже занятым слагом
+SLUG_ATTEMPTS = 5
+
+# Непустые комментарий и фото. Запросы должны использовать ровно эти условия,
+# иначе частичные индексы Date для них не подойдут
+HAS_COMMENT = Q(comment__isnull=False) & ~Q(comment='')
+HAS_PHOTO = Q(photo__isnull=False) & ~Q(photo='')
+
+
+class DateStatus(models.IntegerChoices):
+    """
+    Состояние записи Date. Выполненные статусы идут последними, поэтому
+    «выполнено» — это одно условие status >= ON_TIME. MISSED и COMMENT_ONLY
+    различаются только для отображения: оба считаются невыполнением.
+    """
+    MISSED = 0, "Не выполнено"
+    COMMENT_ONLY = 1, "Только комментарий"
+    ON_TIME = 2, "Выполнено вовремя"
+    RESTORED = 3, "Восполнено"
+
+
+IS_DONE = Q(status__gte=DateStatus.ON_TIME)
+IS_ON_TIME = Q(status=DateStatus.ON_TIME)
+IS_RESTORED = Q(status=DateStatus.RESTORED)
+
+
+def unique_slugify(slug):
+    """
+    Slug with a short random suffix. Unique without probing the table, so
+    saving does not depend on how many rows share the same name.
+    """
+    suffix = secrets.token_hex(SLUG_SUFFIX_BYTES)
+    slug = slug[:SLUG_MAX_LENGTH - len(suffix) - 1].strip('-')
+    return f'{slug}-{suffix}' if slug else suffix
+
+
+def save_with_unique_slug(instance, save, *args, **kwargs):
+    """
+    Save a new row with a generated slug. Names without latin letters all get a bare
+    suffix, so a suffix collision on the unique index regenerates it a few times.
+    """
+    if instance.slug:
+        return save(*args, **kwargs)
+    base = slugify(instance.name)
+    for attempt in range(SLUG_ATTEMPTS):
+        instance.slug = unique_slugify(base)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            taken = type(instance)._default_manager.filter(slug=instance.slug).exists()
+            if not taken or attempt == SLUG_ATTEMPTS - 1:
+                instance.slug = ''
+                raise
+
+
+def new_data_version():
+    """Начальная версия данных профиля — текущее время в микросекундах."""
+    return time.time_ns() // 1000
 
 
 class UserAll(models.Model):
@@ -55,10 +117,29 @@ class UserAll(models.Model):
         blank=True,
     )
 
+    # Растёт при любой записи привычек, категорий и отметок пользователя (см. bump_data_version)
+    data_version = models.BigIntegerField(
+        default=new_data_version,
+        editable=False,
+        verbose_name="Версия данных",
+    )
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, slugify(self.name))
-        super().save(*args, **kwargs)
+        save_with_unique_slug(self, super().save, *args, **kwargs)
+
+    @classmethod
+    def bump_data_version(cls, *user_ids):
+        """Увеличивает версию данных пользователей. Версия не опускается ниже текущего времени,
+        поэтому не повторяется и после пересоздания профиля с тем же id.
+
+        UPDATE блокирует строку профиля до конца транзакции, поэтому записи привычек, категорий
+        и отметок вызывают его до своей записи: блокировки всегда берутся в порядке профиль -> привычка,
+        а проверка внешнего ключа на UserAll не превращается из разделяемой блокировки в исключительную."""
+        user_ids = {pk for pk in user_ids if pk is not None}
+        if user_ids:
+            cls.objects.filter(pk__in=user_ids).update(
+                data_version=Greatest(F('data_version') + 1, Value(new_data_version()))
+            )
 
     def __str__(self) -> str:
         return self.name
@@ -103,9 +184,14 @@ class Category(models.Model):
     )
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, slugify(self.name))
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            UserAll.bump_data_version(self.user_id)
+            save_with_unique_slug(self, super().save, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            UserAll.bump_data_version(self.user_id)
+            return super().delete(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.name
@@ -117,6 +203,36 @@ class Category(models.Model):
         ordering = ['order']
 
 
+# Значения фильтра категории в параметрах запросов
+ALL_CATEGORIES = 'Все'
+NO_CATEGORY = 'Без категории'
+
+
+class HabitQuerySet(models.QuerySet):
+    def for_profile(self, profile, archived=False, category=None):
+        """
+        Привычки профиля в порядке order вместе с категорией (JOIN вместо запроса
+        на каждую привычку; из категории читаются только id, name и slug).
+        archived=None — активные и архивные. category — название категории из
+        параметров запроса: NO_CATEGORY — без категории, пусто или ALL_CATEGORIES — все.
+        """
+        habits = (
+            self.filter(user=profile)
+            .select_related('category')
+            .defer('category__user', 'category__order', 'category__is_archived', 'category__created_at')
+            .order_by('order')
+        )
+        if archived is not None:
+            habits = habits.filter(is_archived=archived)
+        if category == NO_CATEGORY:
+            habits = habits.filter(category_id__isnull=True)
+        elif category and category != ALL_CATEGORIES:
+            habits = habits.filter(
+                category_id__in=Category.objects.filter(user=profile, name=category).values('id')
+            )
+        return habits
+
+
 class Habit(models.Model):
     user = models.ForeignKey(
         UserAll,
@@ -207,10 +323,36 @@ class Habit(models.Model):
         help_text="Целевое количество действий (например, страниц) в месяц"
     )
 
+    # Денормализованные ссылки на последние записи с комментарием и с фото.
+    # Поддерживаются при записи Date (см. api/rollups.py).
+    latest_comment_entry = models.ForeignKey(
+        'Date',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Последний комментарий",
+    )
+    latest_photo_entry = models.ForeignKey(
+        'Date',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Последнее фото",
+    )
+
+    objects = HabitQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = unique_slugify(self, slugify(self.name))
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            UserAll.bump_data_version(self.user_id)
+            save_with_unique_slug(self, super().save, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            UserAll.bump_data_version(self.user_id)
+            return super().delete(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.name
@@ -221,41 +363,127 @@ class Habit(models.Model):
         ordering = ['order']
 
 
+# Производные календарные поля Date, которые хранятся рядом с habit_date
+CALENDAR_FIELDS = ('week_start', 'month_start', 'year')
+# Поля Date, которые пересчитываются при изменении исходных полей
+DERIVED_FIELDS = {'habit_date': CALENDAR_FIELDS, 'comment': ('status',), 'photo': ('status',)}
+# Столбец, по которому rollup() группирует записи каждого вида периода
+PERIOD_FIELDS = {'day': 'habit_date', 'week': 'week_start', 'month': 'month_start', 'year': 'year'}
+
+
+def calendar_fields(day):
+    """Начало недели (понедельник), начало месяца и год дня."""
+    return {
+        'week_start': day - timedelta(days=day.weekday()),
+        'month_start': day.replace(day=1),
+        'year': day.year,
+    }
+
+
+class DateQuerySet(models.QuerySet):
+    # Массовые операции не вызывают save(), поэтому производные поля и версия данных обновляются здесь
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_derived_fields()
+        result = super().bulk_create(objs, *args, **kwargs)
+        UserAll.bump_data_version(*{obj.user_id for obj in objs})
+        return result
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = Date.with_derived_fields(fields)
+        for obj in objs:
+            obj.set_derived_fields()
+        result = super().bulk_update(objs, fields, *args, **kwargs)
+        UserAll.bump_data_version(*{obj.user_id for obj in objs})
+        return result
+
+    def update(self, **kwargs):
+        day = kwargs.get('habit_date')
+        if isinstance(day, date):
+            kwargs.update(calendar_fields(day))
+        elif day is not None:
+            kwargs.update(
+                week_start=Trunc(day, 'week', output_field=models.DateField()),
+                month_start=Trunc(day, 'month', output_field=models.DateField()),
+                year=ExtractYear(day),
+            )
+        user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+        new_user = kwargs.get('user_id', kwargs.get('user'))
+        if new_user is not None:
+            user_ids.add(getattr(new_user, 'pk', new_user))
+        with transaction.atomic():
+            # Как и Date.save, профили блокируются до записи Date
+            UserAll.bump_data_version(*user_ids)
+            return super().update(**kwargs)
+
+    def rollup(self, kind):
+        """
+        Итоги выполненных записей по периодам одним запросом.
+        kind — 'day', 'week', 'month' или 'year'. Возвращает
+        {начало периода: {'on_time', 'restored', 'quantity_sum', 'units'}},
+        где units — количество, а для записей без количества — 1.
+        """
+        rows = (
+            self.filter(IS_DONE)
+            .values(period=models.F(PERIOD_FIELDS[kind]))
+            .annotate(
+                on_time=models.Count('id', filter=IS_ON_TIME),
+                restored=models.Count('id', filter=IS_RESTORED),
+                quantity_sum=models.Sum('quantity', default=0),
+                units=models.Sum(Coalesce('quantity', 1)),
+            )
+            .order_by()
+        )
+        if kind == 'year':
+            return {date(row.pop('period'), 1, 1): row for row in rows}
+        return {row.pop('period'): row for row in rows}
+
+
+def sum_periods(buckets, first, last):
+    """Sum rollup() buckets whose period starts within [first, last]."""
+    totals = dict.fromkeys(('on_time', 'restored', 'quantity_sum', 'units'), 0)
+    for period, row in buckets.items():
+        if first <= period <= last:
+            for field in totals:
+                totals[field] += row[field]
+    return totals
+
+
 class Date(models.Model):
     user = models.ForeignKey(
         UserAll,
         on_delete=models.CASCADE,
         related_name="date",
+        db_index=False,  # ведущий столбец unique_together
     )
     habit = models.ForeignKey(
         Habit,
         on_delete=models.CASCADE,
         related_name="date",
+        db_index=False,  # ведущий столбец api_date_done_cover_idx
     )
     habit_date = models.DateField(
         max_length=100,
         verbose_name="Дата привычки",
     )
-    name = models.CharField(
-        max_length=100,
-        verbose_name="Название",
-        blank=True,
+    week_start = models.DateField(
+        verbose_name="Начало недели",
+        editable=False,
     )
-
-    slug = models.SlugField(
-        unique=True,
-        verbose_name="Слаг",
-        max_length=100,
-        blank=True,
+    month_start = models.DateField(
+        verbose_name="Начало месяца",
+        editable=False,
     )
-
-    is_done = models.BooleanField(
-        verbose_name="Сделано",
-        default=False
+    year = models.PositiveSmallIntegerField(
+        verbose_name="Год",
+        editable=False,
     )
-    is_restored = models.BooleanField(
-        verbose_name="Восполнено",
-        default=False
+    status = models.PositiveSmallIntegerField(
+        verbose_name="Статус",
+        choices=DateStatus.choices,
+        default=DateStatus.MISSED,
     )
 
     quantity = models.IntegerField(
@@ -279,12 +507,109 @@ class Date(models.Model):
         null=True
     )
 
+    objects = DateQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный день, чтобы при переносе записи пересчитать и старую неделю
+        instance._stored_day = (instance.__dict__.get('habit_id'), instance.__dict__.get('habit_date'))
+        # и исходное состояние дня, чтобы не пересчитывать сводки, если оно не изменилось
+        if 'status' in instance.__dict__ and 'quantity' in instance.__dict__:
+            instance._stored_state = (instance.status, instance.quantity)
+        return instance
+
+    @property
+    def name(self):
+        """Название записи; привычка читается только при обращении (select_related('habit') в списках)."""
+        return f"{self.habit.name} - {self.habit_date}"
+
+    @property
+    def slug(self):
+        """Запись однозначно задаётся привычкой и днём, поэтому слаг не хранится."""
+        return f"{self.habit_id}-{self.habit_date}"
+
+    # is_done / is_restored сохранены как свойства поверх status. Флаг восполнения
+    # без выполнения запоминается, чтобы порядок присваивания не имел значения
+    @property
+    def is_done(self):
+        return self.status >= DateStatus.ON_TIME
+
+    @is_done.setter
+    def is_done(self, value):
+        self._set_flags(value, self.__dict__.get('_restored', self.status == DateStatus.RESTORED))
+
+    @property
+    def is_restored(self):
+        return self.status == DateStatus.RESTORED
+
+    @is_restored.setter
+    def is_restored(self, value):
+        self._set_flags(self.is_done, value)
+
+    def _set_flags(self, is_done, is_restored):
+        self._restored = bool(is_restored)
+        if is_done:
+            self.status = DateStatus.RESTORED if is_restored else DateStatus.ON_TIME
+        elif self.status >= DateStatus.ON_TIME:
+            self.status = DateStatus.MISSED
+
+    def set_derived_fields(self):
+        day = self._meta.get_field('habit_date').to_python(self.habit_date)
+        for field, value in calendar_fields(day).items():
+            setattr(self, field, value)
+        if not self.is_done:
+            self.status = DateStatus.COMMENT_ONLY if self.comment or self.photo else DateStatus.MISSED
+
+    @staticmethod
+    def with_derived_fields(fields):
+        """update_fields вместе с зависящими от них производными полями."""
+        fields = ['status' if field in ('is_done', 'is_restored') else field for field in fields]
+        derived = [field for source in fields for field in DERIVED_FIELDS.get(source, ())]
+        return list(dict.fromkeys([*fields, *derived]))
+
+    def _previous_state(self):
+        """(status, quantity) дня до записи; None — строки не было, UNKNOWN_STATE — запись не читалась из базы."""
+        from .rollups import UNKNOWN_STATE
+
+        if hasattr(self, '_stored_state'):
+            return self._stored_state
+        return None if self.pk is None else UNKNOWN_STATE
+
     def save(self, *args, **kwargs):
-        if not self.name:
-            self.name = f"{self.habit.name} - {self.habit_date}"
-        if not self.slug:
-            self.slug = unique_slugify(self, slugify(self.name))
-        super().save(*args, **kwargs)
+        from .rollups import lock_habits, rollup_habit_ids, sync_date_rollups
+
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = kwargs['update_fields'] = self.with_derived_fields(update_fields)
+        previous = self._previous_state()
+        with transaction.atomic():
+            # Профиль и привычки блокируются до записи Date (см. UserAll.bump_data_version)
+            UserAll.bump_data_version(self.user_id)
+            lock_habits(rollup_habit_ids(self, update_fields))
+            super().save(*args, **kwargs)
+            sync_date_rollups(self, update_fields=update_fields, previous=previous)
+        self._stored_day = (self.habit_id, self.habit_date)
+        if update_fields is None:
+            self._stored_state = (self.status, self.quantity)
+        elif hasattr(self, '_stored_state'):
+            status, quantity = self._stored_state
+            self._stored_state = (
+                self.status if 'status' in update_fields else status,
+                self.quantity if 'quantity' in update_fields else quantity,
+            )
+
+    def delete(self, *args, **kwargs):
+        from .rollups import lock_habits, rollup_habit_ids, sync_date_rollups
+
+        previous = self._previous_state()
+        with transaction.atomic():
+            UserAll.bump_data_version(self.user_id)
+            lock_habits(rollup_habit_ids(self))
+            result = super().delete(*args, **kwargs)
+            sync_date_rollups(self, deleted=True, previous=previous)
+        return result
 
     def __str__(self) -> str:
         return self.name
@@ -293,6 +618,159 @@ class Date(models.Model):
         verbose_name = "Дата"
         verbose_name_plural = "Даты"
         unique_together = ('user', 'habit', 'habit_date')
+        indexes = [
+            # Покрывающий индекс для подсчётов и сумм по выполненным дням привычек:
+            # запросы историй и сводок, в том числе GROUP BY по неделям, месяцам и годам,
+            # читают только индекс, без обращения к таблице
+            models.Index(
+                fields=['habit', 'user', 'habit_date', 'status', 'quantity', 'week_start', 'month_start', 'year'],
+                name='api_date_done_cover_idx',
+            ),
+            # Последние запись с комментарием и запись с фото привычки
+            models.Index(
+                fields=['habit', '-habit_date', '-id'], condition=HAS_COMMENT, name='api_date_comment_idx',
+            ),
+            models.Index(
+                fields=['habit', '-habit_date', '-id'], condition=HAS_PHOTO, name='api_date_photo_idx',
+            ),
+        ]
+
+
+class HabitWeekStat(models.Model):
+    """Сводка выполнения привычки за ISO-неделю (понедельник - воскресенье)."""
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="week_stats",
+    )
+    week_start = models.DateField(
+        verbose_name="Начало недели",
+    )
+    on_time_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Выполнено вовремя",
+    )
+    quantity_sum = models.IntegerField(
+        default=0,
+        verbose_name="Сумма количества",
+    )
+
+    def __str__(self) -> str:
+        return f"{self.habit_id} - {self.week_start}"
+
+    class Meta:
+        verbose_name = "Недельная статистика"
+        verbose_name_plural = "Недельная статистика"
+        unique_together = ('habit', 'week_start')
+
+
+class HabitMonthStat(models.Model):
+    """Сводка выполнения привычки за календарный месяц."""
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="month_stats",
+    )
+    month_start = models.DateField(
+        verbose_name="Начало месяца",
+    )
+    done_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Выполнено",
+    )
+    on_time_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Выполнено вовремя",
+    )
+    restored_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Восполнено",
+    )
+    quantity_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Записей с количеством",
+    )
+    quantity_sum = models.IntegerField(
+        default=0,
+        verbose_name="Сумма количества",
+    )
+    overflow_sum = models.IntegerField(
+        default=0,
+        verbose_name="Сумма положительного количества",
+    )
+
+    @property
+    def units(self):
+        """Количество действий: записи без количества считаются за одно действие."""
+        return self.quantity_sum + self.done_count - self.quantity_count
+
+    def __str__(self) -> str:
+        return f"{self.habit_id} - {self.month_start}"
+
+    class Meta:
+        verbose_name = "Месячная статистика"
+        verbose_name_plural = "Месячная статистика"
+        unique_together = ('habit', 'month_start')
+
+
+class HabitStreakSegment(models.Model):
+    """Отрезок дней с неизменным состоянием серии привычки."""
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="streak_segments",
+    )
+    start_date = models.DateField(
+        verbose_name="Начало отрезка",
+    )
+    end_date = models.DateField(
+        verbose_name="Конец отрезка",
+    )
+    is_active = models.BooleanField(
+        default=False,
+        verbose_name="Серия активна",
+    )
+
+    def __str__(self) -> str:
+        return f"{self.habit_id}: {self.start_date} - {self.end_date}"
+
+    class Meta:
+        verbose_name = "Отрезок серии"
+        verbose_name_plural = "Отрезки серий"
+        unique_together = ('habit', 'start_date')
+        indexes = [
+            models.Index(fields=['habit', 'is_active', 'end_date'], name='api_streak_active_end_idx'),
+        ]
+
+
+class HabitYearBitmap(models.Model):
+    """Битовые карты выполнения привычки за год (по биту на день)."""
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="year_bitmaps",
+    )
+    year = models.PositiveSmallIntegerField(
+        verbose_name="Год",
+    )
+    done = models.BinaryField(
+        max_length=YEAR_BYTES,
+        default=empty_year,
+        verbose_name="Выполнено",
+    )
+    restored = models.BinaryField(
+        max_length=YEAR_BYTES,
+        default=empty_year,
+        verbose_name="Восполнено",
+    )
+
+    def __str__(self) -> str:
+        return f"{self.habit_id}: {self.year}"
+
+    class Meta:
+        verbose_name = "Годовая карта выполнения"
+        verbose_name_plural = "Годовые карты выполнения"
+        unique_together = ('habit', 'year')
 
 
 class Achievement(models.Model):
@@ -0,0 +1,440 @@
+"""
+Сводные таблицы статистики (rollups), которые поддерживаются при каждой записи Date.
+
+Date.save() / Date.delete() вызывают sync_date_rollups(), который пересчитывает
+только затронутые неделю, месяц, хвост отрезков серии и биты дня в годовой карте, а также ссылки
+Habit.latest_comment_entry / latest_photo_entry. Массовые операции (bulk_create, QuerySet.update/delete)
+хуки не вызывают — после них нужно запускать rebuild_habit_rollups()
+или команду ``manage.py rebuild_stats``.
+
+Пересчёт — это чтение Date и запись сводок (UPDATE или INSERT строки периода, delete + bulk_create
+отрезков, изменение бита в общей строке года). Одновременные записи одной привычки из разных воркеров
+затёрли бы друг друга, поэтому Date.save/delete ещё до записи самой Date блокируют строку профиля
+(UserAll.bump_data_version) и строки Habit (lock_habits, SELECT ... FOR UPDATE в порядке id) до конца
+транзакции. Так в InnoDB проверка внешнего ключа при INSERT не берёт разделяемую блокировку, которую
+потом пришлось бы повышать (взаимоблокировка 1213), а снимок REPEATABLE READ создаётся уже после
+блокировки и видит закоммиченные записи предыдущего владельца. SQLite FOR UPDATE не поддерживает,
+но сериализует запись всей базой.
+
+Если состояние дня (выполнение, восполнение, количество) не изменилось — например, правился только
+комментарий, — недели, месяца, отрезков серии и годовой карты запись не касается.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .bitmaps import day_index, pack_days, range_mask, with_bit
+from .models import (
+    HAS_COMMENT, HAS_PHOTO, IS_DONE, IS_ON_TIME, IS_RESTORED,
+    Date, DateStatus, Habit, HabitMonthStat, HabitStreakSegment, HabitWeekStat, HabitYearBitmap, UserAll,
+)
+from .streaks import streak_segments
+
+# Поля Date, от которых зависят сводки
+ROLLUP_FIELDS = {'habit', 'habit_id', 'habit_date', 'status', 'quantity'}
+# Поля Date, от которых зависят ссылки на последние комментарий и фото
+LATEST_ENTRY_FIELDS = {'habit', 'habit_id', 'habit_date', 'comment', 'photo'}
+
+MONTH_STAT_FIELDS = (
+    'done_count', 'on_time_count', 'restored_count', 'quantity_count', 'quantity_sum', 'overflow_sum',
+)
+
+BATCH_SIZE = 1000
+
+# Состояние дня до записи неизвестно: Date не читалась из базы, сводки пересчитываются полностью
+UNKNOWN_STATE = object()
+
+
+def week_start_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start_of(day):
+    return date(day.year, day.month, 1)
+
+
+def month_end_of(day):
+    if day.month == 12:
+        return date(day.year, 12, 31)
+    return date(day.year, day.month + 1, 1) - timedelta(days=1)
+
+
+def _week_aggregates():
+    return {
+        'on_time_count': Count('id', filter=IS_ON_TIME),
+        'quantity_sum': Sum('quantity', filter=Q(quantity__gte=1), default=0),
+    }
+
+
+def _month_aggregates():
+    return {
+        'done_count': Count('id'),
+        'on_time_count': Count('id', filter=IS_ON_TIME),
+        'restored_count': Count('id', filter=IS_RESTORED),
+        'quantity_count': Count('quantity'),
+        'quantity_sum': Sum('quantity', default=0),
+        'overflow_sum': Sum('quantity', filter=Q(quantity__gte=1), default=0),
+    }
+
+
+def _grouped_rows(dates, period_field, aggregates):
+    """Group completed Date rows by (habit, period start)."""
+    return (
+        dates.filter(IS_DONE)
+        .values('habit_id', period=F(period_field))
+        .annotate(**aggregates)
+        .order_by()
+    )
+
+
+def refresh_week_stat(habit_id, week_start):
+    """Recompute one HabitWeekStat row from the Date table."""
+    row = Date.objects.filter(
+        IS_DONE,
+        habit_id=habit_id,
+        habit_date__range=[week_start, week_start + timedelta(days=6)],
+    ).aggregate(**_week_aggregates())
+    stat = HabitWeekStat.objects.filter(habit_id=habit_id, week_start=week_start)
+    if not (row['on_time_count'] or row['quantity_sum']):
+        stat.delete()
+    elif not stat.update(**row):
+        HabitWeekStat.objects.create(habit_id=habit_id, week_start=week_start, **row)
+
+
+def refresh_month_stat(habit_id, month_start):
+    """Recompute one HabitMonthStat row from the Date table."""
+    row = Date.objects.filter(
+        IS_DONE,
+        habit_id=habit_id,
+        habit_date__range=[month_start, month_end_of(month_start)],
+    ).aggregate(**_month_aggregates())
+    stat = HabitMonthStat.objects.filter(habit_id=habit_id, month_start=month_start)
+    if not row['done_count']:
+        stat.delete()
+    elif not stat.update(**row):
+        HabitMonthStat.objects.create(habit_id=habit_id, month_start=month_start, **row)
+
+
+def refresh_streak_segments(habit_id, day):
+    """
+    Recompute the streak segments affected by a change on ``day``.
+    A change on day X only affects the state of X and X+1, so segments ending
+    before X-1 stay valid: the last of them anchors the recomputation.
+    """
+    segments = HabitStreakSegment.objects.filter(habit_id=habit_id)
+    anchor = segments.filter(end_date__lt=day - timedelta(days=1)).order_by('-start_date').first()
+    done_days = Date.objects.filter(IS_ON_TIME, habit_id=habit_id)
+    if anchor:
+        segments = segments.filter(start_date__gte=anchor.start_date)
+        done_days = done_days.filter(habit_date__gte=anchor.start_date - timedelta(days=1))
+    segments.delete()
+    since = anchor.start_date if anchor else None
+    HabitStreakSegment.objects.bulk_create(
+        HabitStreakSegment(habit_id=habit_id, start_date=start, end_date=end, is_active=active)
+        for start, end, active in streak_segments(done_days.values_list('habit_date', flat=True), since=since)
+    )
+
+
+def set_year_bits(habit_id, day, is_done, is_restored):
+    """Set the done/restored bits of one day in the habit's HabitYearBitmap."""
+    bitmap = HabitYearBitmap.objects.filter(habit_id=habit_id, year=day.year).first()
+    if bitmap is None:
+        if not (is_done or is_restored):
+            return
+        bitmap = HabitYearBitmap(habit_id=habit_id, year=day.year)
+    index = day_index(day)
+    bitmap.done = with_bit(bytes(bitmap.done), index, is_done)
+    bitmap.restored = with_bit(bytes(bitmap.restored), index, is_restored)
+    if not (any(bitmap.done) or any(bitmap.restored)):
+        if bitmap.pk:
+            bitmap.delete()
+    elif bitmap.pk:
+        bitmap.save(update_fields=['done', 'restored'])
+    else:
+        bitmap.save()
+
+
+def refresh_latest_entries(habits):
+    """Recompute latest_comment_entry / latest_photo_entry with one UPDATE."""
+    habit_dates = Date.objects.filter(habit=OuterRef('pk')).order_by('-habit_date', '-id').values('id')
+    habits.update(
+        latest_comment_entry=Subquery(
+            habit_dates.filter(HAS_COMMENT)[:1]
+        ),
+        latest_photo_entry=Subquery(
+            habit_dates.filter(HAS_PHOTO)[:1]
+        ),
+    )
+
+
+def sync_latest_entries(entry, moved=False, deleted=False):
+    """
+    Keep the habit's latest comment/photo pointers correct after a write.
+    Usually the pointer only has to move to a newer entry; a full lookup is needed
+    only when the pointed entry lost its comment/photo, moved or was deleted
+    (SET_NULL has already cleared the pointer in that case).
+    """
+    current = Habit.objects.filter(id=entry.habit_id).values(
+        'latest_comment_entry_id', 'latest_comment_entry__habit_date',
+        'latest_photo_entry_id', 'latest_photo_entry__habit_date',
+    ).first()
+    if current is None:
+        return
+
+    stale = False
+    updates = {}
+    for field, has_value in (
+        ('latest_comment_entry', bool(entry.comment)),
+        ('latest_photo_entry', bool(entry.photo)),
+    ):
+        pointer_id = current[f'{field}_id']
+        if deleted:
+            stale |= has_value and pointer_id is None
+        elif pointer_id == entry.id:
+            stale |= moved or not has_value
+        elif has_value and (
+            pointer_id is None
+            or (entry.habit_date, entry.id) > (current[f'{field}__habit_date'], pointer_id)
+        ):
+            updates[f'{field}_id'] = entry.id
+
+    habit = Habit.objects.filter(id=entry.habit_id)
+    if stale:
+        refresh_latest_entries(habit)
+    elif updates:
+        habit.update(**updates)
+
+
+def lock_habits(habit_ids):
+    """Lock Habit rows until the end of the transaction, in id order to avoid deadlocks."""
+    if habit_ids:
+        list(Habit.objects.select_for_update().filter(id__in=habit_ids).order_by('id').values_list('id', flat=True))
+
+
+def _affected_days(entry):
+    """(habit_id, day) pairs a write touches, and whether the entry moved from its stored day."""
+    days = {(entry.habit_id, entry.habit_date)}
+    stored_day = getattr(entry, '_stored_day', None)
+    moved = bool(stored_day and None not in stored_day and stored_day != (entry.habit_id, entry.habit_date))
+    if moved:
+        days.add(stored_day)
+    return days, stored_day, moved
+
+
+def rollup_habit_ids(entry, update_fields=None):
+    """Habits whose rollups a write of ``entry`` may change; the caller locks them before writing."""
+    if update_fields is not None and not (LATEST_ENTRY_FIELDS | ROLLUP_FIELDS).intersection(update_fields):
+        return set()
+    days, _, _ = _affected_days(entry)
+    return {habit_id for habit_id, _ in days}
+
+
+def _done_state(state):
+    """(status, quantity) of a completed day, None for a day that is not done or has no row."""
+    if state is None or state[0] < DateStatus.ON_TIME:
+        return None
+    return state
+
+
+def sync_date_rollups(entry, update_fields=None, deleted=False, previous=UNKNOWN_STATE):
+    """
+    Update rollups after a single Date row was saved or deleted. Must run inside the transaction
+    that holds the rollup_habit_ids() locks. ``previous`` is the day's (status, quantity) before
+    the write, or None if there was no row; with it, unchanged day states skip the rollup tables.
+    """
+    days, stored_day, moved = _affected_days(entry)
+
+    if update_fields is not None and not (LATEST_ENTRY_FIELDS | ROLLUP_FIELDS).intersection(update_fields):
+        return
+
+    if update_fields is None or LATEST_ENTRY_FIELDS.intersection(update_fields):
+        sync_latest_entries(entry, moved=moved, deleted=deleted)
+        if moved and stored_day[0] != entry.habit_id:
+            refresh_latest_entries(Habit.objects.filter(id=stored_day[0]))
+
+    if update_fields is not None and not ROLLUP_FIELDS.intersection(update_fields):
+        return
+
+    if previous is UNKNOWN_STATE or moved:
+        stats_changed = streak_changed = bits_changed = True
+    else:
+        before = _done_state(previous)
+        after = _done_state(None if deleted else (entry.status, entry.quantity))
+        status_before, status_after = before and before[0], after and after[0]
+        stats_changed = before != after
+        streak_changed = (status_before == DateStatus.ON_TIME) != (status_after == DateStatus.ON_TIME)
+        bits_changed = status_before != status_after
+
+    if stats_changed:
+        for habit_id, week_start in sorted({(h, week_start_of(d)) for h, d in days}):
+            refresh_week_stat(habit_id, week_start)
+        for habit_id, month_start in sorted({(h, month_start_of(d)) for h, d in days}):
+            refresh_month_stat(habit_id, month_start)
+    if streak_changed:
+        for habit_id, habit_days in groupby(sorted(days), key=lambda day: day[0]):
+            refresh_streak_segments(habit_id, min(d for _, d in habit_days))
+    if not bits_changed:
+        return
+    if moved:
+        set_year_bits(*stored_day, is_done=False, is_restored=False)
+    set_year_bits(
+        entry.habit_id, entry.habit_date,
+        is_done=entry.is_done and not deleted,
+        is_restored=entry.is_restored and not deleted,
+    )
+
+
+def rebuild_habit_rollups(habits):
+    """Rebuild all rollup rows for the given habits from scratch."""
+    habit_ids = list(habits.values_list('id', flat=True))
+    dates = Date.objects.filter(habit_id__in=habit_ids)
+    with transaction.atomic():
+        HabitWeekStat.objects.filter(habit_id__in=habit_ids).delete()
+        week_stats = [
+            HabitWeekStat(
+                habit_id=row['habit_id'],
+                week_start=row['period'],
+                on_time_count=row['on_time_count'],
+                quantity_sum=row['quantity_sum'],
+            )
+            for row in _grouped_rows(dates, 'week_start', _week_aggregates()).iterator()
+            if row['on_time_count'] or row['quantity_sum']
+        ]
+        HabitWeekStat.objects.bulk_create(week_stats, batch_size=BATCH_SIZE)
+
+        HabitMonthStat.objects.filter(habit_id__in=habit_ids).delete()
+        month_stats = [
+            HabitMonthStat(
+                habit_id=row['habit_id'],
+                month_start=row['period'],
+                **{field: row[field] for field in MONTH_STAT_FIELDS},
+            )
+            for row in _grouped_rows(dates, 'month_start', _month_aggregates()).iterator()
+        ]
+        HabitMonthStat.objects.bulk_create(month_stats, batch_size=BATCH_SIZE)
+
+        HabitStreakSegment.objects.filter(habit_id__in=habit_ids).delete()
+        on_time_rows = (
+            dates.filter(IS_ON_TIME)
+            .order_by('habit_id', 'habit_date')
+            .values_list('habit_id', 'habit_date')
+        )
+        segments = []
+        for habit_id, habit_rows in groupby(on_time_rows.iterator(), key=lambda row: row[0]):
+            segments.extend(
+                HabitStreakSegment(habit_id=habit_id, start_date=start, end_date=end, is_active=active)
+                for start, end, active in streak_segments(day for _, day in habit_rows)
+            )
+        HabitStreakSegment.objects.bulk_create(segments, batch_size=BATCH_SIZE)
+
+        HabitYearBitmap.objects.filter(habit_id__in=habit_ids).delete()
+        bitmaps = year_bitmaps_from_dates(dates)
+        HabitYearBitmap.objects.bulk_create(bitmaps, batch_size=BATCH_SIZE)
+
+        refresh_latest_entries(Habit.objects.filter(id__in=habit_ids))
+        # Пересборка идёт после массовых записей, которые сами версию данных не увеличивают
+        UserAll.bump_data_version(*Habit.objects.filter(id__in=habit_ids).values_list('user_id', flat=True).distinct())
+    return len(week_stats) + len(month_stats) + len(segments) + len(bitmaps)
+
+
+def year_bitmaps_from_dates(dates):
+    """Unsaved HabitYearBitmap objects for the given Date rows."""
+    days = defaultdict(lambda: ([], []))
+    for habit_id, habit_date, status in (
+        dates.filter(IS_DONE).values_list('habit_id', 'habit_date', 'status').iterator()
+    ):
+        done_days, restored_days = days[habit_id, habit_date.year]
+        done_days.append(habit_date)
+        if status == DateStatus.RESTORED:
+            restored_days.append(habit_date)
+    return [
+        HabitYearBitmap(habit_id=habit_id, year=year, done=pack_days(done_days), restored=pack_days(restored_days))
+        for (habit_id, year), (done_days, restored_days) in days.items()
+    ]
+
+
+def month_totals(habits, first_month, last_month):
+    """
+    Sum HabitMonthStat rows of several habits per month.
+    Returns {month_start: {'on_time_count': ..., 'units': ..., ...}}.
+    """
+    totals = defaultdict(lambda: dict.fromkeys(MONTH_STAT_FIELDS + ('units',), 0))
+    for row in HabitMonthStat.objects.filter(
+        habit__in=habits,
+        month_start__range=[first_month, last_month],
+    ).values('month_start').annotate(
+        **{field: Sum(field) for field in MONTH_STAT_FIELDS}
+    ).order_by():
+        bucket = totals[row['month_start']]
+        for field in MONTH_STAT_FIELDS:
+            bucket[field] = row[field]
+        bucket['units'] = row['quantity_sum'] + row['done_count'] - row['quantity_count']
+    return totals
+
+
+def habit_totals_since_start(habits):
+    """
+    On-time completions and units per habit, counted from the habit's start_date
+    (all time when start_date is empty). Returns {habit_id: (on_time_count, units)}.
+    Whole months come from HabitMonthStat; the days of the start month before
+    start_date are subtracted using the raw Date rows.
+    """
+    habits = list(habits)
+    first_month = {h.id: month_start_of(h.start_date) for h in habits if h.start_date}
+    totals = defaultdict(lambda: [0, 0])
+    for stat in HabitMonthStat.objects.filter(habit__in=habits).only(
+        'habit_id', 'month_start', 'done_count', 'on_time_count', 'quantity_count', 'quantity_sum',
+    ):
+        if stat.habit_id in first_month and stat.month_start < first_month[stat.habit_id]:
+            continue
+        totals[stat.habit_id][0] += stat.on_time_count
+        totals[stat.habit_id][1] += stat.units
+
+    before_start = Q()
+    for h in habits:
+        if h.start_date and h.start_date.day > 1:
+            before_start |= Q(habit_id=h.id, habit_date__range=[first_month[h.id], h.start_date - timedelta(days=1)])
+    if before_start:
+        for row in Date.objects.filter(before_start, IS_DONE).values('habit_id').annotate(
+            on_time_count=Count('id', filter=IS_ON_TIME),
+            units=Sum(Coalesce('quantity', 1)),
+        ).order_by():
+            totals[row['habit_id']][0] -= row['on_time_count']
+            totals[row['habit_id']][1] -= row['units']
+
+    return {habit_id: tuple(values) for habit_id, values in totals.items()}
+
+
+def active_streak_segments(habits, first, last):
+    """Active streak segments overlapping [first, last]: {habit_id: [(start, end), ...]}."""
+    segments = defaultdict(list)
+    for habit_id, start, end in HabitStreakSegment.objects.filter(
+        habit__in=habits,
+        is_active=True,
+        end_date__gte=first,
+        start_date__lte=last,
+    ).values_list('habit_id', 'start_date', 'end_date'):
+        segments[habit_id].append((start, end))
+    return segments
+
+
+def range_bitmaps(habits, first, last):
+    """
+    Done and restored bits of [first, last] from HabitYearBitmap rows:
+    {habit_id: (done_mask, restored_mask)}, bit k of a mask is the day first + k.
+    """
+    years = defaultdict(lambda: ({}, {}))
+    for habit_id, year, done, restored in HabitYearBitmap.objects.filter(
+        habit__in=habits,
+        year__range=[first.year, last.year],
+    ).values_list('habit_id', 'year', 'done', 'restored'):
+        years[habit_id][0][year] = bytes(done)
+        years[habit_id][1][year] = bytes(restored)
+    return {
+        habit_id: (range_mask(done, first, last), range_mask(restored, first, last))
+        for habit_id, (done, restored) in years.items()
+    }
@@ -38,10 +38,7 @@ class HabitSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={'name': request.user.username, 'age': ''}
-            )
+            user_profile = request.profile
             self.fields['category'].queryset = Category.objects.filter(user=user_profile)
 
     def get_category_name(self, obj):
@@ -54,14 +51,22 @@ class HabitSerializer(serializers.ModelSerializer):
 class UserAllSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserAll
-        fields = '__all__'
+        # data_version — служебный ключ кэша аналитики (api/cache.py), клиенту не нужен
+        exclude = ('data_version',)
 
 
 class DateSerializer(serializers.ModelSerializer):
+    name = serializers.ReadOnlyField()
+    slug = serializers.ReadOnlyField()
+    # Флаги хранятся в status; запись через свойства модели
+    is_done = serializers.BooleanField(required=False)
+    is_restored = serializers.BooleanField(required=False)
+
     class Meta:
         model = Date
-        fields = '__all__'  # Includes quantity field
-        read_only_fields = ('id', 'slug', 'name')
+        fields = ('id', 'user', 'habit', 'habit_date', 'name', 'slug', 'is_done', 'is_restored', 'status',
+                  'quantity', 'comment', 'photo')
+        read_only_fields = ('id', 'status')
 
 class AchievementSerializer(serializers.ModelSerializer):
     class Meta:
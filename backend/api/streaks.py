@@ -0,0 +1,56 @@
+"""
+Серии (streaks) привычек в виде отрезков.
+
+Серия активна в день X, если привычка выполнена вовремя в X и в X-1
+(два выполнения подряд включают серию, любой пропуск её выключает).
+Состояние по дням хранится как чередующиеся отрезки (start, end, is_active)
+от первого до последнего выполнения привычки.
+"""
+from datetime import timedelta
+
+ONE_DAY = timedelta(days=1)
+
+
+def streak_segments(done_days, since=None):
+    """
+    Run-length encode the streak state for a set of on-time days.
+    Returns [(start, end, is_active), ...]. With ``since`` the result starts
+    at that day; ``done_days`` must then include the day before ``since``.
+    """
+    segments = []
+
+    def push(start, end, active):
+        if start > end:
+            return
+        if segments and segments[-1][2] == active and segments[-1][1] + ONE_DAY == start:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end, active])
+
+    days = sorted(done_days)
+    run_start = prev = None
+    for day in days + [None]:
+        if day is not None and prev is not None and day == prev + ONE_DAY:
+            prev = day
+            continue
+        if prev is not None:
+            # The first hit of a run does not activate the streak yet
+            push(run_start, run_start, False)
+            push(run_start + ONE_DAY, prev, True)
+            if day is not None:
+                push(prev + ONE_DAY, day - ONE_DAY, False)
+        run_start = prev = day
+
+    if since is not None:
+        segments = [[max(start, since), end, active] for start, end, active in segments if end >= since]
+    return [tuple(segment) for segment in segments]
+
+
+def active_days(segments, first, last):
+    """Number of days in [first, last] covered by active segments."""
+    total = 0
+    for start, end in segments:
+        overlap = (min(end, last) - max(start, first)).days + 1
+        if overlap > 0:
+            total += overlap
+    return total
@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from api.models import Category, Date, Habit, UserAll
+
+
+class AdminSmokeTest(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.client.force_login(admin_user)
+        user = UserAll.objects.create(auth_user=admin_user, name='Admin')
+        category = Category.objects.create(user=user, name='Health')
+        self.habit = Habit.objects.create(user=user, name='Read', category=category, start_date=date(2026, 3, 1))
+        Date.objects.create(user=user, habit=self.habit, habit_date=date(2026, 3, 2), is_done=True)
+
+    def test_changelists_and_search_render(self):
+        """Every registered model's changelist opens, with and without a search query"""
+        for model in ('achievement', 'habit', 'date', 'userall', 'category'):
+            url = f'/admin/api/{model}/'
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+            self.assertEqual(self.client.get(url, {'q': 'Read'}).status_code, 200, url)
+
+    def test_habit_change_form_renders(self):
+        """The habit form opens with the slug prepopulated from the name"""
+        response = self.client.get(f'/admin/api/habit/{self.habit.pk}/change/')
+
+        self.assertEqual(response.status_code, 200)
+        prepopulated = response.context['adminform'].prepopulated_fields
+        self.assertEqual([(f['field'].name, [d.name for d in f['dependencies']]) for f in prepopulated],
+                         [('slug', ['name'])])
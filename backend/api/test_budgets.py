@@ -0,0 +1,186 @@
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Category, Date, DateStatus, Habit, HabitWeekStat, UserAll
+from api.rollups import rebuild_habit_rollups
+
+# Максимум SQL-запросов на вызов эндпоинта (вместе с определением профиля).
+# Кэшируемые эндпоинты и эндпоинты с ETag (api/cache.py) добавляют чтение версии данных.
+#
+# update_status — самая частая запись, поэтому потолок равен фактическому числу запросов
+# новой отметки в опорный день, чьи неделя, месяц и год уже есть в сводках (см. seed_profile):
+#   профиль, привычка, поиск отметки                                     3
+#   BEGIN, COMMIT                                                        2
+#   версия данных (блокирует профиль), блокировка привычки               2
+#   INSERT Date, указатели последних комментария и фото                  2
+#   неделя и месяц: агрегат + UPDATE                                     4
+#   отрезки серии: якорь, DELETE хвоста, выборка дней, INSERT            4
+#   годовая битовая карта: SELECT + UPDATE                               2
+# Первая отметка в новой неделе или месяце добавляет INSERT сводки, поэтому замеры не зависят
+# от сегодняшней даты: история и запросы строятся от REFERENCE_DATE.
+QUERY_BUDGETS = {
+    'weekly_status': 7,
+    'quarterly_status': 4,
+    'summary_report': 5,
+    'daily_statistics': 5,
+    'analytics_chart': 6,
+    'habit_comparison': 4,
+    'report': 5,
+    'export': 4,
+    'update_status': 19,
+}
+# Среда в середине месяца: у недели и месяца опорного дня есть дни до него
+REFERENCE_DATE = date(2026, 3, 18)
+
+
+def seed_profile(username, habit_count, days, seed):
+    """
+    Профиль с habit_count привычками и историей за days дней до REFERENCE_DATE (не включая его).
+    День перед опорным выполнен у всех привычек, так что сводки недели, месяца, года и отрезок
+    серии для отметки в REFERENCE_DATE уже существуют.
+    """
+    rnd = random.Random(seed)
+    auth = User.objects.create_user(username=username, password='password123')
+    profile = UserAll.objects.create(auth_user=auth, name=username)
+    categories = [Category.objects.create(user=profile, name=f'Category {i}') for i in range(3)]
+    first_day = REFERENCE_DATE - timedelta(days=days)
+    habits = [
+        Habit.objects.create(user=profile, name=f'Habit {i}', category=categories[i % 3], order=i,
+                             start_date=first_day)
+        for i in range(habit_count)
+    ]
+    entries = []
+    for habit in habits:
+        for offset in range(days):
+            roll = 0.5 if offset == days - 1 else rnd.random()
+            if roll < 0.6:
+                status = DateStatus.RESTORED if roll < 0.06 else DateStatus.ON_TIME
+            elif roll < 0.63:
+                status = DateStatus.COMMENT_ONLY
+            else:
+                continue
+            entries.append(Date(
+                user=profile, habit=habit, habit_date=first_day + timedelta(days=offset), status=status,
+                quantity=rnd.choice([None, None, rnd.randint(1, 30)]),
+                comment='note' if status == DateStatus.COMMENT_ONLY else None,
+            ))
+    Date.objects.bulk_create(entries, batch_size=1000)
+    rebuild_habit_rollups(Habit.objects.filter(user=profile))
+    return auth, habits
+
+
+class EndpointBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = seed_profile('small', habit_count=2, days=60, seed=1)
+        cls.large = seed_profile('large', habit_count=30, days=3 * 365, seed=2)
+
+    def _calls(self, habit):
+        day = REFERENCE_DATE.isoformat()
+        calls = [
+            ('weekly_status', 'get', '/api/v1/habits/weekly_status/', {'date': day}),
+            ('quarterly_status', 'get', '/api/v1/habits/quarterly_status/', {'date': day}),
+            ('analytics_chart', 'get', '/api/v1/habits/analytics_chart/', {}),
+            ('export', 'get', '/api/v1/habits/export/', {}),
+            ('update_status', 'post', '/api/v1/habits/update_status/',
+             {'habit_id': habit.id, 'date': day, 'is_done': True}),
+        ]
+        for period in ('all', 'day', 'week', 'month', 'year'):
+            calls.append(('summary_report', 'get', '/api/v1/habits/summary_report/', {'period': period, 'date': day}))
+        for period in ('day', 'week', 'month', 'year'):
+            calls.append(('daily_statistics', 'get', '/api/v1/habits/daily_statistics/', {'period': period, 'date': day}))
+            calls.append(('report', 'get', f'/api/v1/habits/{habit.id}/report/', {'period': period, 'date': day}))
+        for period in ('week', 'month', 'year'):
+            calls.append(('habit_comparison', 'get', '/api/v1/habits/habit_comparison/', {'period': period, 'date': day}))
+        return calls
+
+    def _measure(self, profile):
+        auth, habits = profile
+        client = APIClient()
+        client.force_authenticate(user=auth)
+        results = []
+        for name, method, url, params in self._calls(habits[0]):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, params, format='json' if method == 'post' else None)
+                elapsed = time.perf_counter() - started
+            self.assertEqual(response.status_code, 200, (url, params, response.data))
+            results.append((name, params.get('period'), len(queries.captured_queries), elapsed))
+        return results
+
+    def _log(self, results):
+        path = os.environ.get('API_BUDGET_LOG')
+        if not path:
+            return
+        with open(path, 'a') as log:
+            for name, period, queries, elapsed in results:
+                log.write(json.dumps({'endpoint': name, 'period': period, 'queries': queries,
+                                      'ms': round(elapsed * 1000, 2)}) + '\n')
+
+    def test_query_budgets(self):
+        """Every endpoint stays within its query budget for 2 habits x 60 days and 30 habits x 3 years"""
+        small = self._measure(self.small)
+        large = self._measure(self.large)
+        self._log(large)
+
+        for (name, period, small_queries, _), (_, _, large_queries, _) in zip(small, large):
+            self.assertEqual(large_queries, small_queries, (name, period))
+            self.assertLessEqual(large_queries, QUERY_BUDGETS[name], (name, period))
+
+
+class LoadCommandsTest(TestCase):
+    def test_seed_load_and_bench_api(self):
+        """seed_load creates users with history and rollups; bench_api writes per-endpoint JSON results of uncached requests"""
+        call_command('seed_load', users=2, habits=3, years=0.5, seed=7, stdout=StringIO())
+
+        profile = UserAll.objects.get(auth_user__username='load_1')
+        self.assertEqual(Habit.objects.filter(user=profile).count(), 3)
+        dates = Date.objects.filter(user=profile)
+        self.assertTrue(dates.filter(status=DateStatus.ON_TIME).exists())
+        self.assertFalse(dates.filter(habit_date__gte=date.today()).exists())
+        self.assertTrue(HabitWeekStat.objects.filter(habit__user=profile).exists())
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('bench_api', user='load_0', repeat=2, warmup=1, only=['weekly_status', 'report'],
+                         output=output.name, stdout=StringIO())
+            with open(output.name, encoding='utf-8') as f:
+                report = json.load(f)
+
+        self.assertEqual([r['endpoint'] for r in report['results']], ['weekly_status', 'report', 'report'])
+        self.assertTrue(all(r['p50_ms'] <= r['max_ms'] for r in report['results']))
+        # По умолчанию замеряется вычисление, а не попадание в кэш (профиль + версия данных = 2 запроса)
+        self.assertEqual(report['mode'], 'cold')
+        self.assertTrue(all(r['queries'] > 2 for r in report['results']))
+
+    def test_load_test_gives_every_process_its_own_users(self):
+        """load_test never shares a user between processes, so check-in toggles do not collide"""
+        with self.assertRaises(CommandError):
+            call_command('load_test', url='http://127.0.0.1:9', processes=4, users=2, stdout=StringIO())
+
+        jobs = []
+
+        def fake_map(func, worker_jobs):
+            jobs.extend(worker_jobs)
+            return [{'weekly_status': {'latencies': [1.0], 'errors': 0}} for _ in worker_jobs]
+
+        with mock.patch('multiprocessing.Pool') as pool:
+            pool.return_value.__enter__.return_value.map.side_effect = fake_map
+            call_command('load_test', url='http://127.0.0.1:9', processes=3, users=7, stdout=StringIO())
+
+        users = [user for job in jobs for user in job['users']]
+        self.assertEqual(sorted(users), sorted(f'load_{i}' for i in range(7)))
+        self.assertTrue(all(job['users'] for job in jobs))
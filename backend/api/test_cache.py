@@ -0,0 +1,172 @@
+import threading
+import time
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api import views
+from api.models import Category, Date, Habit, UserAll
+
+
+class AnalyticsCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.category = Category.objects.create(user=self.user_all, name='Health')
+        self.habit = Habit.objects.create(user=self.user_all, name='Read', category=self.category,
+                                          start_date=date(2026, 3, 1))
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 2), is_done=True)
+        self.url = '/api/v1/habits/summary_report/'
+
+    def _version(self):
+        return UserAll.objects.get(pk=self.user_all.pk).data_version
+
+    def test_repeated_request_is_served_from_cache(self):
+        """A second identical request only resolves the profile and reads the data version"""
+        first = self.client.get(self.url, {'period': 'month', 'date': '2026-03-15'})
+
+        with self.assertNumQueries(2):
+            second = self.client.get(f'{self.url}?date=2026-03-15&period=month')
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+
+    def test_writes_invalidate_cached_payload(self):
+        """A check-in bumps the data version, so the next request is recomputed"""
+        params = {'period': 'month', 'date': '2026-03-15'}
+        before = self.client.get(self.url, params).json()
+
+        response = self.client.post('/api/v1/habits/update_status/',
+                                    {'habit_id': self.habit.id, 'date': '2026-03-03', 'is_done': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        after = self.client.get(self.url, params).json()
+
+        self.assertNotEqual(after, before)
+        self.assertEqual(after, self.client.get(self.url, params).json())
+
+    def test_every_model_write_bumps_version(self):
+        """Habit, Category and Date saves and deletes, bulk writes, queryset updates and reorders all move the version forward"""
+        versions = [self._version()]
+
+        def step():
+            versions.append(self._version())
+            self.assertGreater(versions[-1], versions[-2])
+
+        self.habit.save(update_fields=['name'])
+        step()
+        self.category.delete()
+        step()
+        entry = Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 5), is_done=True)
+        step()
+        entry.delete()
+        step()
+        Date.objects.bulk_create([Date(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 6))])
+        step()
+        Date.objects.filter(habit=self.habit, habit_date=date(2026, 3, 6)).update(quantity=2)
+        step()
+        self.client.post('/api/v1/habits/reorder/', [{'id': self.habit.id, 'order': 5}], format='json')
+        step()
+
+    def test_cache_is_per_user(self):
+        """Another user with the same parameters gets their own payload"""
+        params = {'period': 'month', 'date': '2026-03-15'}
+        mine = self.client.get(self.url, params).json()
+        other_auth = User.objects.create_user(username='other', password='password123')
+        UserAll.objects.create(auth_user=other_auth, name='Other')
+        self.client.force_authenticate(user=other_auth)
+
+        theirs = self.client.get(self.url, params).json()
+
+        self.assertNotEqual(theirs, mine)
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.habit = Habit.objects.create(user=self.user_all, name='Read', start_date=date(2026, 3, 1))
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 2), is_done=True)
+
+    def test_unchanged_data_answers_304_without_reading_dates(self):
+        """weekly_status, quarterly_status and the habit and category lists revalidate with If-None-Match"""
+        for url in ('/api/v1/habits/weekly_status/', '/api/v1/habits/quarterly_status/',
+                    '/api/v1/habits/', '/api/v1/categories/'):
+            etag = self.client.get(url)['ETag']
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertLessEqual(len(queries.captured_queries), 2)
+            self.assertFalse(any('"api_date"' in q['sql'] for q in queries.captured_queries), url)
+
+    def test_validator_changes_with_data_params_and_today(self):
+        """A check-in, another ?date or a new day produce a different ETag; weak If-None-Match still matches"""
+        url = '/api/v1/habits/weekly_status/'
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'"x", W/{etag}').status_code, 304)
+        self.assertNotEqual(self.client.get(url, {'date': '2026-03-02'})['ETag'], etag)
+        with mock.patch('api.cache.date') as fake_date:
+            fake_date.today.return_value = date(2099, 1, 1)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.post('/api/v1/habits/update_status/',
+                         {'habit_id': self.habit.id, 'date': '2026-03-03', 'is_done': True}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SingleFlightTest(TransactionTestCase):
+    def setUp(self):
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.habit = Habit.objects.create(user=self.user_all, name='Read', start_date=date(2026, 3, 1))
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 2), is_done=True)
+
+    def test_concurrent_identical_requests_compute_once(self):
+        """8 simultaneous habit_comparison requests share one computation and get the same payload"""
+        calls = []
+        load_histories = views.load_histories
+
+        def slow_load_histories(*args, **kwargs):
+            calls.append(1)
+            time.sleep(0.3)
+            return load_histories(*args, **kwargs)
+
+        barrier = threading.Barrier(8)
+        results = []
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(user=self.user_auth)
+            barrier.wait()
+            try:
+                response = client.get('/api/v1/habits/habit_comparison/', {'period': 'month', 'date': '2026-03-15'})
+                results.append((response.status_code, response.json()))
+            finally:
+                connection.close()
+
+        with mock.patch('api.views.load_histories', side_effect=slow_load_histories):
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(results[0][0], 200)
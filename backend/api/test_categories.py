@@ -1,5 +1,7 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 from api.models import UserAll, Category, Habit
@@ -112,3 +114,53 @@ class CategoryValidationTest(TestCase):
 
         active_response = self.client.get('/api/v1/categories/')
         self.assertIn(category.id, [item['id'] for item in active_response.data])
+
+
+class HabitCategoryQueryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+
+    def _add_habits(self, count, archived=False):
+        category = Category.objects.create(user=self.user_all, name=f'Category {Category.objects.count()}')
+        for i in range(count):
+            Habit.objects.create(user=self.user_all, name=f'{category.name} {i}', category=category,
+                                 is_archived=archived)
+        return category
+
+    def _count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_200_OK)
+        return len(queries.captured_queries)
+
+    def test_habit_lists_read_categories_with_a_join(self):
+        """Habit lists, export and summaries do not query the category of every habit"""
+        urls = [
+            '/api/v1/habits/',
+            '/api/v1/habits/archived/',
+            '/api/v1/habits/export/',
+            '/api/v1/habits/summary_report/',
+            '/api/v1/habits/habit_comparison/',
+        ]
+        self._add_habits(1)
+        self._add_habits(1, archived=True)
+        single = [self._count_queries(url) for url in urls]
+        self._add_habits(6)
+        self._add_habits(6, archived=True)
+        many = [self._count_queries(url) for url in urls]
+
+        self.assertEqual(many, single)
+
+    def test_category_filter_by_name(self):
+        """The category name parameter selects habits by category id; "Без категории" selects habits without one"""
+        work = self._add_habits(2)
+        self._add_habits(1)
+        Habit.objects.create(user=self.user_all, name='Loose')
+
+        by_name = self.client.get('/api/v1/habits/daily_statistics/', {'category': work.name, 'period': 'day'})
+        uncategorized = self.client.get('/api/v1/habits/habit_comparison/', {'category': 'Без категории'})
+
+        self.assertEqual(by_name.data['data'][0]['habit_count'], 2)
+        self.assertEqual([h['name'] for h in uncategorized.data['habits']], ['Loose'])
@@ -0,0 +1,209 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.history import DONE, HabitHistory, load_histories
+from api.models import Category, Date, Habit, UserAll, sum_periods
+
+
+class HabitHistoryTest(TestCase):
+    def setUp(self):
+        self.user_all = UserAll.objects.create(name='Test User')
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+        self.first_day = date(2026, 3, 4)
+        rnd = random.Random(11)
+        self.entries = {}
+        for offset in range(60):
+            if rnd.random() < 0.7:
+                day = self.first_day + timedelta(days=offset)
+                entry = (rnd.random() < 0.15, rnd.choice([None, rnd.randint(1, 9)]))
+                self.entries[day] = entry
+                Date.objects.create(user=self.user_all, habit=self.habit, habit_date=day, is_done=True,
+                                    is_restored=entry[0], quantity=entry[1])
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 5, 20), comment='not done')
+        self.history = load_histories([self.habit])[self.habit.id]
+
+    def _on_time(self, day):
+        return day in self.entries and not self.entries[day][0]
+
+    def test_totals_match_entries(self):
+        """Period totals equal the counts over the stored entries"""
+        first, last = date(2026, 3, 10), date(2026, 4, 20)
+        days = [d for d in self.entries if first <= d <= last]
+
+        totals = self.history.totals(first, last)
+
+        self.assertEqual(totals.on_time, sum(1 for d in days if self._on_time(d)))
+        self.assertEqual(totals.restored, sum(1 for d in days if self.entries[d][0]))
+        self.assertEqual(totals.quantity_sum, sum(self.entries[d][1] or 0 for d in days))
+        self.assertEqual(totals.units, sum(self.entries[d][1] or 1 for d in days))
+        self.assertEqual(self.history.done_days(first, last), sorted(days))
+
+    def test_streak_days_and_week_counts(self):
+        """Streaks need two on-time days in a row; week counts are bucketed by calendar week"""
+        first, last = date(2026, 2, 20), date(2026, 5, 10)
+        expected_streak = 0
+        day = first
+        while day <= last:
+            expected_streak += self._on_time(day) and self._on_time(day - timedelta(days=1))
+            day += timedelta(days=1)
+        monday = self.first_day - timedelta(days=self.first_day.weekday())
+        expected_weeks = [
+            sum(1 for i in range(7) if self._on_time(monday + timedelta(days=7 * week + i))
+                and monday + timedelta(days=7 * week + i) >= self.first_day)
+            for week in range(10)
+        ]
+
+        self.assertEqual(self.history.streak_days(first, last), expected_streak)
+        self.assertEqual(self.history.week_counts(self.first_day, monday + timedelta(days=69)), expected_weeks)
+
+    def test_empty_history(self):
+        """A habit without completions gives zero everywhere"""
+        empty = Habit.objects.create(user=self.user_all, name='Empty')
+        history = load_histories([empty])[empty.id]
+
+        self.assertEqual(history.totals(), (0, 0, 0, 0))
+        self.assertEqual(history.streak_days(self.first_day, self.first_day + timedelta(days=5)), 0)
+        self.assertIsNone(history.first_done())
+        self.assertEqual(history.week_counts(self.first_day, self.first_day), [0])
+
+
+class DateRollupTest(TestCase):
+    def setUp(self):
+        self.user_all = UserAll.objects.create(name='Test User')
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+        for day, is_restored, quantity in [
+            (date(2026, 3, 30), False, 5),
+            (date(2026, 3, 31), True, None),
+            (date(2026, 4, 1), False, None),
+            (date(2026, 4, 6), False, 2),
+        ]:
+            Date.objects.create(user=self.user_all, habit=self.habit, habit_date=day, is_done=True,
+                                is_restored=is_restored, quantity=quantity)
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 4, 2), quantity=7)
+
+    def test_rollup_by_week_and_month(self):
+        """Buckets hold on-time/restored counts, quantity sums and units of completed entries"""
+        dates = Date.objects.filter(habit=self.habit)
+
+        with self.assertNumQueries(1):
+            weeks = dates.rollup('week')
+
+        self.assertEqual(weeks, {
+            date(2026, 3, 30): {'on_time': 2, 'restored': 1, 'quantity_sum': 5, 'units': 7},
+            date(2026, 4, 6): {'on_time': 1, 'restored': 0, 'quantity_sum': 2, 'units': 2},
+        })
+        months = dates.rollup('month')
+        self.assertEqual(months[date(2026, 4, 1)], {'on_time': 2, 'restored': 0, 'quantity_sum': 2, 'units': 3})
+        self.assertEqual(
+            sum_periods(dates.rollup('day'), date(2026, 3, 31), date(2026, 4, 1)),
+            {'on_time': 1, 'restored': 1, 'quantity_sum': 0, 'units': 2},
+        )
+
+
+class BadgeHistogramTest(TestCase):
+    def _history(self, days):
+        rnd = random.Random(days)
+        history = HabitHistory(1, date(2000, 1, 3), days)
+        for i in range(days):
+            if rnd.random() < 0.6:
+                history.flags[i] = DONE
+        return history
+
+    def test_badge_histogram_on_multi_year_history(self):
+        """48 years of weeks with 0..7 on-time days in turn give 313 weeks of every count"""
+        weeks = 8 * 313
+        history = HabitHistory(1, date(2000, 1, 3), weeks * 7)
+        for week in range(weeks):
+            for i in range(week % 8):
+                history.flags[week * 7 + i] = DONE
+        last = history.first_day + timedelta(days=len(history) - 1)
+
+        self.assertEqual(dict(history.badge_histogram(history.first_day, last)), {count: 313 for count in range(8)})
+
+    def test_badge_histogram_matches_week_scan(self):
+        """The histogram equals counting every week separately"""
+        history = self._history(400)
+        first = history.first_day + timedelta(days=3)
+        last = history.first_day + timedelta(days=380)
+        expected = {}
+        week = first - timedelta(days=first.weekday())
+        while week <= last:
+            count = sum(
+                1 for i in range(7)
+                if first <= week + timedelta(days=i) <= last and history.is_on_time(week + timedelta(days=i))
+            )
+            expected[count] = expected.get(count, 0) + 1
+            week += timedelta(days=7)
+
+        self.assertEqual(dict(history.badge_histogram(first, last)), expected)
+
+
+class AnalyticsQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+
+    def _add_habits(self, count):
+        category = Category.objects.create(user=self.user_all, name=f'Category {count}')
+        for i in range(count):
+            habit = Habit.objects.create(user=self.user_all, name=f'Habit {i}', start_date=date(2026, 1, 1),
+                                         category=category)
+            for offset in range(0, 40, 2):
+                Date.objects.create(user=self.user_all, habit=habit, is_done=True,
+                                    habit_date=date(2026, 1, 1) + timedelta(days=offset))
+
+    def _count_queries(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_habits(self):
+        """habit_comparison, daily_statistics and analytics_chart read all habits' history at once"""
+        endpoints = [
+            ('/api/v1/habits/habit_comparison/', {'period': 'month', 'date': '2026-01-15'}),
+            ('/api/v1/habits/daily_statistics/', {'period': 'month', 'date': '2026-01-15'}),
+            ('/api/v1/habits/analytics_chart/', {}),
+        ]
+        self._add_habits(1)
+        single = [self._count_queries(url, params) for url, params in endpoints]
+        self._add_habits(5)
+        many = [self._count_queries(url, params) for url, params in endpoints]
+
+        self.assertEqual(many, single)
+
+    def test_analytics_chart_covers_long_history(self):
+        """The chart starts at the first week of a habit started years ago"""
+        start = date.today() - timedelta(days=1500)
+        habit = Habit.objects.create(user=self.user_all, name='Old', start_date=start)
+        Date.objects.create(user=self.user_all, habit=habit, habit_date=start, is_done=True, quantity=3)
+
+        weeks = self.client.get('/api/v1/habits/analytics_chart/').data['weeks']
+
+        first_monday = start - timedelta(days=start.weekday())
+        self.assertEqual(weeks[0]['week_start'], first_monday.isoformat())
+        self.assertEqual(weeks[0]['days_done'], 1)
+        self.assertEqual(weeks[0]['quantity'], 3)
+        self.assertEqual(weeks[0]['total_days'], 7 - start.weekday())
+
+    def test_habit_comparison_explicit_range(self):
+        """start_date/end_date override the period and are reflected in every habit's stats"""
+        self._add_habits(2)
+
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/v1/habits/habit_comparison/',
+                                       {'start_date': '2026-01-03', 'end_date': '2026-01-10', 'period': 'year'})
+
+        self.assertEqual(response.data['period_label'], '03.01.2026 - 10.01.2026')
+        habit = response.data['habits'][0]
+        self.assertEqual(habit['category_name'], 'Category 2')
+        self.assertEqual(habit['done_history'], ['2026-01-03', '2026-01-05', '2026-01-07', '2026-01-09'])
+        self.assertEqual(habit['completed_days'], 4)
+        self.assertEqual(habit['streak_days'], 0)
@@ -0,0 +1,116 @@
+import re
+import unittest
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Category, Date, Habit, UserAll, calendar_fields
+from api.rollups import refresh_latest_entries
+
+# Полный проход в EXPLAIN QUERY PLAN SQLite: "SCAN api_date" или "SCAN api_date USING INDEX ..."
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN format is SQLite-specific')
+class HotQueryPlanTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        category = Category.objects.create(user=self.user_all, name='Health')
+        for i in range(3):
+            habit = Habit.objects.create(user=self.user_all, name=f'Habit {i}', start_date=date(2026, 1, 1),
+                                         category=category)
+            for offset in range(0, 60, 2):
+                Date.objects.create(user=self.user_all, habit=habit, is_done=True, is_restored=offset % 6 == 0,
+                                    habit_date=date(2026, 1, 1) + timedelta(days=offset), quantity=offset or None,
+                                    comment='note' if offset % 10 == 0 else '')
+
+    def _full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith(('SELECT', 'UPDATE')):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                scans += [(row[3], query['sql']) for row in cursor.fetchall() if FULL_SCAN.match(row[3])]
+        return scans
+
+    def test_hot_queries_use_indexes(self):
+        """Every query of weekly_status, analytics_chart and habit_comparison is an index search"""
+        endpoints = [
+            ('/api/v1/habits/weekly_status/', {'date': '2026-02-18'}),
+            ('/api/v1/habits/analytics_chart/', {}),
+            ('/api/v1/habits/habit_comparison/', {'period': 'month', 'date': '2026-02-15'}),
+        ]
+        for url, params in endpoints:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url, params).status_code, 200)
+                self.assertEqual(self._full_scans(queries), [])
+
+    def test_latest_entry_lookup_uses_partial_indexes(self):
+        """The latest comment/photo lookups read the partial indexes"""
+        with CaptureQueriesContext(connection) as queries:
+            refresh_latest_entries(Habit.objects.filter(user=self.user_all))
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[-1]['sql'])
+            plan = ' '.join(row[3] for row in cursor.fetchall())
+        self.assertIn('api_date_comment_idx', plan)
+        self.assertIn('api_date_photo_idx', plan)
+        self.assertEqual(self._full_scans(queries), [])
+
+    def test_period_grouping_reads_only_the_index(self):
+        """rollup() by week, month and year groups the stored columns of the covering index (daily_statistics)"""
+        dates = Date.objects.filter(user=self.user_all, habit__in=list(Habit.objects.filter(user=self.user_all)))
+        # Без статистики планировщик SQLite выбирает более узкий уникальный индекс
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        for kind in ('week', 'month', 'year'):
+            with self.subTest(kind=kind):
+                with CaptureQueriesContext(connection) as queries:
+                    dates.filter(habit_date__range=[date(2026, 1, 10), date(2026, 2, 20)]).rollup(kind)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[-1]['sql'])
+                    plan = ' '.join(row[3] for row in cursor.fetchall())
+                self.assertIn('USING COVERING INDEX api_date_done_cover_idx', plan)
+
+
+class CalendarFieldsTest(TestCase):
+    def setUp(self):
+        self.user_all = UserAll.objects.create(name='Test User')
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+
+    def _assert_in_sync(self):
+        for entry in Date.objects.all():
+            self.assertEqual(
+                {'week_start': entry.week_start, 'month_start': entry.month_start, 'year': entry.year},
+                calendar_fields(entry.habit_date),
+            )
+
+    def test_save_and_bulk_writes_keep_calendar_fields(self):
+        """week_start, month_start and year follow habit_date through save, bulk_create, bulk_update and update"""
+        entry = Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 1), is_done=True)
+        self.assertEqual((entry.week_start, entry.month_start, entry.year),
+                         (date(2026, 2, 23), date(2026, 3, 1), 2026))
+        entry.habit_date = date(2025, 12, 31)
+        entry.save(update_fields=['habit_date'])
+        self._assert_in_sync()
+
+        bulk = Date.objects.bulk_create(
+            Date(user=self.user_all, habit=self.habit, habit_date=date(2026, 1, day)) for day in range(1, 8)
+        )
+        self._assert_in_sync()
+        for created in bulk:
+            created.habit_date = created.habit_date.replace(month=5)
+        Date.objects.bulk_update(bulk, ['habit_date'])
+        self._assert_in_sync()
+        Date.objects.filter(id=entry.id).update(habit_date=date(2024, 2, 29))
+        self._assert_in_sync()
+        self.assertEqual(Date.objects.get(id=entry.id).week_start, date(2024, 2, 26))
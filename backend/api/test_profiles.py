@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Category, Habit, UserAll
+
+
+class ProfileMiddlewareTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        category = Category.objects.create(user=self.user_all, name='Health')
+        Habit.objects.create(user=self.user_all, name='Read', category=category)
+
+    def _profile_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300)
+        # Чтение версии данных для ETag (api/cache.py) — не поиск профиля
+        return [q['sql'] for q in queries.captured_queries if 'FROM "api_userall"' in q['sql']
+                and not q['sql'].startswith('SELECT "api_userall"."data_version"')], response
+
+    def test_profile_resolved_once_per_request(self):
+        """get_queryset and HabitSerializer share one profile lookup"""
+        self.client.force_authenticate(user=self.user_auth)
+
+        lookups, response = self._profile_queries('get', '/api/v1/habits/')
+
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual([h['name'] for h in response.data], ['Read'])
+
+    def test_session_caches_profile_id(self):
+        """After the first request of a session the profile costs no query"""
+        self.client.login(username='testuser', password='password123')
+        self._profile_queries('get', '/api/v1/habits/')
+
+        lookups, _ = self._profile_queries('post', '/api/v1/habits/', {'name': 'Run'})
+
+        self.assertEqual(lookups, [])
+        self.assertEqual(Habit.objects.get(name='Run').user, self.user_all)
+
+    def test_profile_created_for_new_user(self):
+        """A user without UserAll gets a profile named after the username"""
+        newcomer = User.objects.create_user(username='newcomer', password='password123')
+        self.client.force_authenticate(user=newcomer)
+
+        self.assertEqual(self.client.get('/api/v1/habits/').status_code, 200)
+
+        self.assertEqual(UserAll.objects.get(auth_user=newcomer).name, 'newcomer')
+
+    def test_profile_api_hides_data_version(self):
+        """The internal cache version is not part of the profile payload"""
+        self.client.force_authenticate(user=self.user_auth)
+
+        response = self.client.get(f'/api/v1/user/{self.user_all.pk}/')
+
+        self.assertEqual(response.data['name'], 'Test User')
+        self.assertNotIn('data_version', response.data)
@@ -0,0 +1,412 @@
+import base64
+import random
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.bitmaps import range_mask
+from api.models import IS_ON_TIME, Date, Habit, HabitMonthStat, HabitStreakSegment, HabitWeekStat, HabitYearBitmap, UserAll
+from api import rollups
+from api.rollups import range_bitmaps, rebuild_habit_rollups, sync_date_rollups, year_bitmaps_from_dates
+from api.streaks import streak_segments
+
+
+class WeekStatRollupTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+        self.monday = date(2026, 3, 9)
+
+    def _week_stats(self):
+        return list(
+            HabitWeekStat.objects.filter(habit=self.habit)
+            .order_by('week_start')
+            .values_list('week_start', 'on_time_count', 'quantity_sum')
+        )
+
+    def _check_in(self, day, **data):
+        payload = {'habit_id': self.habit.id, 'date': day.isoformat(), 'is_done': True}
+        payload.update(data)
+        return self.client.post('/api/v1/habits/update_status/', payload, format='json')
+
+    def test_update_status_keeps_week_stat_in_sync(self):
+        """Check-ins through update_status increment and decrement the weekly rollup"""
+        self._check_in(self.monday, quantity=5)
+        self._check_in(self.monday + timedelta(days=1), is_restored=True, quantity=3)
+        self._check_in(self.monday + timedelta(days=2))
+
+        self.assertEqual(self._week_stats(), [(self.monday, 2, 8)])
+
+        self._check_in(self.monday, is_done=False)
+
+        self.assertEqual(self._week_stats(), [(self.monday, 1, 3)])
+
+    def test_empty_week_row_is_removed(self):
+        """A week without completions does not keep a rollup row"""
+        self._check_in(self.monday)
+        self._check_in(self.monday, is_done=False)
+
+        self.assertEqual(self._week_stats(), [])
+
+    def test_moving_entry_refreshes_both_weeks(self):
+        """Changing habit_date through the dates API updates the old and the new week"""
+        entry = Date.objects.create(user=self.user_all, habit=self.habit, habit_date=self.monday, is_done=True)
+        next_week = self.monday + timedelta(days=7)
+
+        response = self.client.patch(f'/api/v1/date/{entry.id}/', {'habit_date': next_week.isoformat()}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._week_stats(), [(next_week, 1, 0)])
+
+    def test_dates_list_post_and_delete(self):
+        """Entries created and deleted through the dates API are reflected in the rollup"""
+        response = self.client.post('/api/v1/dates/', {
+            'habit': self.habit.id, 'habit_date': self.monday.isoformat(), 'is_done': True, 'quantity': 4,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._week_stats(), [(self.monday, 1, 4)])
+
+        self.client.delete(f"/api/v1/date/{response.data['id']}/")
+
+        self.assertEqual(self._week_stats(), [])
+
+    def test_rebuild_stats_command_matches_incremental_updates(self):
+        """rebuild_stats recreates exactly the rows maintained on write"""
+        for i in range(10):
+            self._check_in(self.monday + timedelta(days=i), quantity=i + 1, is_restored=(i == 3))
+        expected_weeks = self._week_stats()
+        expected_months = list(HabitMonthStat.objects.order_by('month_start').values())
+        expected_segments = list(HabitStreakSegment.objects.order_by('start_date').values_list(
+            'start_date', 'end_date', 'is_active'))
+        HabitWeekStat.objects.all().delete()
+        HabitMonthStat.objects.all().delete()
+        expected_bitmaps = list(HabitYearBitmap.objects.values_list('year', 'done', 'restored'))
+        HabitStreakSegment.objects.all().delete()
+        HabitYearBitmap.objects.all().delete()
+
+        call_command('rebuild_stats', stdout=StringIO())
+
+        self.assertEqual(self._week_stats(), expected_weeks)
+        self.assertEqual(
+            [dict(row, id=None) for row in HabitMonthStat.objects.order_by('month_start').values()],
+            [dict(row, id=None) for row in expected_months],
+        )
+        self.assertEqual(
+            list(HabitStreakSegment.objects.order_by('start_date').values_list('start_date', 'end_date', 'is_active')),
+            expected_segments,
+        )
+        self.assertEqual(
+            [(year, bytes(done), bytes(restored))
+             for year, done, restored in HabitYearBitmap.objects.values_list('year', 'done', 'restored')],
+            [(year, bytes(done), bytes(restored)) for year, done, restored in expected_bitmaps],
+        )
+
+
+class MonthStatRollupTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.habit = Habit.objects.create(user=self.user_all, name='Read', start_date=date(2026, 1, 10))
+
+    def _add(self, day, **kwargs):
+        return Date.objects.create(user=self.user_all, habit=self.habit, habit_date=day, is_done=True, **kwargs)
+
+    def test_month_stat_counts_and_quantities(self):
+        """Month rows keep done/on-time/restored counts and quantity totals"""
+        self._add(date(2026, 3, 1), quantity=5)
+        self._add(date(2026, 3, 2), is_restored=True)
+        self._add(date(2026, 3, 31), quantity=2)
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 3), comment='skip')
+
+        stat = HabitMonthStat.objects.get(habit=self.habit)
+
+        self.assertEqual(stat.month_start, date(2026, 3, 1))
+        self.assertEqual(
+            (stat.done_count, stat.on_time_count, stat.restored_count, stat.quantity_sum, stat.units),
+            (3, 2, 1, 7, 8),
+        )
+
+    def test_report_and_summary_read_month_rollup(self):
+        """report and summary_report month/year/all views use the monthly totals"""
+        self._add(date(2026, 1, 5))  # before start_date: ignored by the "all" summary
+        self._add(date(2026, 1, 12), quantity=4)
+        self._add(date(2026, 2, 3), is_restored=True)
+
+        report = self.client.get(f'/api/v1/habits/{self.habit.id}/report/', {'period': 'month', 'date': '2026-02-01'})
+        self.assertEqual(
+            [(item['completions'], item['quantity']) for item in report.data['items'][:3]],
+            [(2, 5), (0, 1), (0, 0)],
+        )
+
+        summary = self.client.get('/api/v1/habits/summary_report/', {'period': 'all'})
+        self.assertEqual((summary.data['total_completions'], summary.data['total_quantity']), (1, 5))
+
+        summary = self.client.get('/api/v1/habits/summary_report/', {'period': 'year', 'date': '2026-02-01'})
+        self.assertIn({'label': '2026', 'completions': 2, 'quantity': 6}, summary.data['items'])
+
+
+class StreakSegmentTest(TestCase):
+    def setUp(self):
+        self.user_all = UserAll.objects.create(name='Test User')
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+        self.first_day = date(2026, 3, 1)
+
+    def _segments(self):
+        return list(
+            HabitStreakSegment.objects.filter(habit=self.habit)
+            .order_by('start_date')
+            .values_list('start_date', 'end_date', 'is_active')
+        )
+
+    def _expected_segments(self):
+        on_time = Date.objects.filter(IS_ON_TIME, habit=self.habit)
+        return streak_segments(on_time.values_list('habit_date', flat=True))
+
+    def test_segments_follow_streak_rules(self):
+        """Two hits in a row start a streak, a single miss ends it"""
+        for offset in [0, 1, 2, 4, 6, 7]:
+            Date.objects.create(user=self.user_all, habit=self.habit,
+                                habit_date=self.first_day + timedelta(days=offset), is_done=True)
+
+        def day(offset):
+            return self.first_day + timedelta(days=offset)
+
+        self.assertEqual(self._segments(), [
+            (day(0), day(0), False),
+            (day(1), day(2), True),
+            (day(3), day(6), False),
+            (day(7), day(7), True),
+        ])
+
+    def test_out_of_order_writes_match_full_rebuild(self):
+        """Incremental tail updates give the same segments as a full recomputation"""
+        rnd = random.Random(7)
+        for _ in range(120):
+            day = self.first_day + timedelta(days=rnd.randint(0, 40))
+            entry = Date.objects.filter(habit=self.habit, habit_date=day).first()
+            if entry is None:
+                Date.objects.create(user=self.user_all, habit=self.habit, habit_date=day,
+                                    is_done=True, is_restored=rnd.random() < 0.2)
+            elif rnd.random() < 0.5:
+                entry.delete()
+            else:
+                entry.is_restored = not entry.is_restored
+                entry.save()
+            self.assertEqual(self._segments(), self._expected_segments())
+
+    def test_save_locks_profile_and_habits_before_writing(self):
+        """Date.save locks the profile, then every affected habit, before it writes the Date row or reads rollups"""
+        other = Habit.objects.create(user=self.user_all, name='Run')
+        entry = Date.objects.create(user=self.user_all, habit=self.habit, habit_date=self.first_day, is_done=True)
+        entry.habit = other
+
+        with mock.patch.object(rollups, 'lock_habits', wraps=rollups.lock_habits) as lock, \
+                CaptureQueriesContext(connection) as queries:
+            entry.save()
+
+        lock.assert_called_once_with({self.habit.id, other.id})
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertTrue(statements[0].startswith('UPDATE "api_userall"'))
+        self.assertIn('"api_habit"."id" IN', statements[1])
+        self.assertIn('ORDER BY', statements[1])
+        self.assertTrue(statements[2].startswith('UPDATE "api_date"'))
+
+    def test_comment_edit_skips_rollup_tables(self):
+        """Editing only the comment of a done day leaves week, month, segment and bitmap rows alone"""
+        entry = Date.objects.create(user=self.user_all, habit=self.habit, habit_date=self.first_day,
+                                    is_done=True, quantity=3)
+        entry = Date.objects.get(pk=entry.pk)
+        entry.comment = 'note'
+
+        with CaptureQueriesContext(connection) as queries:
+            entry.save()
+
+        rollup_tables = ('api_habitweekstat', 'api_habitmonthstat', 'api_habitstreaksegment', 'api_habityearbitmap')
+        self.assertFalse([q['sql'] for q in queries.captured_queries if any(t in q['sql'] for t in rollup_tables)])
+        entry.quantity = 4
+        entry.save()
+        self.assertEqual(HabitMonthStat.objects.get(habit=self.habit).quantity_sum, 4)
+
+    def test_interleaved_writes_then_syncs_match_rebuild(self):
+        """Two workers' rows written before either sync runs: the serialized syncs still converge and never collide"""
+        days = [self.first_day + timedelta(days=offset) for offset in (0, 1, 2)]
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=days[0], is_done=True)
+        first, second = Date.objects.bulk_create([
+            Date(user=self.user_all, habit=self.habit, habit_date=days[1], is_done=True, quantity=2),
+            Date(user=self.user_all, habit=self.habit, habit_date=days[2], is_done=True, is_restored=True),
+        ])
+
+        for entry in (second, first):
+            with transaction.atomic():
+                sync_date_rollups(entry)
+        incremental = (
+            self._segments(),
+            list(HabitWeekStat.objects.filter(habit=self.habit).values_list('week_start', 'on_time_count', 'quantity_sum')),
+            list(HabitMonthStat.objects.filter(habit=self.habit).values_list('month_start', 'done_count', 'quantity_sum')),
+            list(HabitYearBitmap.objects.filter(habit=self.habit).values_list('year', 'done', 'restored')),
+        )
+        rebuild_habit_rollups(Habit.objects.filter(id=self.habit.id))
+
+        self.assertEqual(incremental, (
+            self._segments(),
+            list(HabitWeekStat.objects.filter(habit=self.habit).values_list('week_start', 'on_time_count', 'quantity_sum')),
+            list(HabitMonthStat.objects.filter(habit=self.habit).values_list('month_start', 'done_count', 'quantity_sum')),
+            list(HabitYearBitmap.objects.filter(habit=self.habit).values_list('year', 'done', 'restored')),
+        ))
+
+
+class LatestEntryPointerTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+        self.first_day = date(2026, 3, 1)
+
+    def _pointers(self):
+        return tuple(Habit.objects.filter(id=self.habit.id).values_list(
+            'latest_comment_entry_id', 'latest_photo_entry_id').get())
+
+    def _expected_pointers(self):
+        dates = Date.objects.filter(habit=self.habit).order_by('-habit_date', '-id')
+        comment = dates.filter(comment__isnull=False).exclude(comment__exact='').first()
+        photo = dates.exclude(photo=None).exclude(photo='').first()
+        return (comment.id if comment else None, photo.id if photo else None)
+
+    def test_random_writes_keep_pointers_correct(self):
+        """Pointers always match the most recent entry with a comment / photo"""
+        rnd = random.Random(3)
+        for _ in range(100):
+            day = self.first_day + timedelta(days=rnd.randint(0, 15))
+            entry = Date.objects.filter(habit=self.habit, habit_date=day).first()
+            action = rnd.random()
+            if entry is None:
+                Date.objects.create(user=self.user_all, habit=self.habit, habit_date=day, is_done=True,
+                                    comment=rnd.choice(['', None, 'note']),
+                                    photo=rnd.choice([None, '', 'habit_photos/a.jpg']))
+            elif action < 0.3:
+                entry.delete()
+            elif action < 0.6:
+                entry.comment = rnd.choice(['', 'note'])
+                entry.save(update_fields=['comment'])
+            elif action < 0.8:
+                entry.photo = rnd.choice(['', 'habit_photos/b.jpg'])
+                entry.save()
+            else:
+                new_day = self.first_day + timedelta(days=rnd.randint(0, 15))
+                if not Date.objects.filter(habit=self.habit, habit_date=new_day).exists():
+                    entry.habit_date = new_day
+                    entry.save()
+            self.assertEqual(self._pointers(), self._expected_pointers())
+
+    def test_clear_comment_moves_pointer_to_previous_comment(self):
+        """clear_comment empties the latest comment and the pointer falls back to the previous one"""
+        older = Date.objects.create(user=self.user_all, habit=self.habit, habit_date=self.first_day, comment='first')
+        Date.objects.create(user=self.user_all, habit=self.habit,
+                            habit_date=self.first_day + timedelta(days=1), comment='second')
+
+        response = self.client.post('/api/v1/habits/clear_comment/', {'habit_id': self.habit.id}, format='json')
+
+        self.assertEqual(response.data, {'status': 'cleared'})
+        self.assertEqual(self._pointers(), (older.id, None))
+
+
+class YearBitmapTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.habit = Habit.objects.create(user=self.user_all, name='Read')
+        self.first_day = date(2025, 12, 20)
+
+    def _bitmaps(self):
+        return sorted(
+            (bitmap.year, bytes(bitmap.done), bytes(bitmap.restored))
+            for bitmap in HabitYearBitmap.objects.filter(habit=self.habit)
+        )
+
+    def test_random_writes_match_rebuilt_bitmaps(self):
+        """Bits set on every write equal the bitmaps built from all Date rows"""
+        rnd = random.Random(5)
+        for _ in range(80):
+            day = self.first_day + timedelta(days=rnd.randint(0, 30))
+            entry = Date.objects.filter(habit=self.habit, habit_date=day).first()
+            if entry is None:
+                Date.objects.create(user=self.user_all, habit=self.habit, habit_date=day,
+                                    is_done=rnd.random() < 0.8, is_restored=rnd.random() < 0.3)
+            elif rnd.random() < 0.4:
+                entry.delete()
+            else:
+                entry.is_done = not entry.is_done
+                entry.save()
+        expected = sorted(
+            (bitmap.year, bitmap.done, bitmap.restored)
+            for bitmap in year_bitmaps_from_dates(Date.objects.filter(habit=self.habit))
+        )
+
+        self.assertEqual(self._bitmaps(), expected)
+
+    def test_range_mask_spans_years(self):
+        """Masks of a range crossing New Year keep one bit per day in order"""
+        for offset in (0, 11, 12, 20):
+            Date.objects.create(user=self.user_all, habit=self.habit, is_done=True,
+                                habit_date=self.first_day + timedelta(days=offset))
+
+        done, restored = range_bitmaps([self.habit], self.first_day, self.first_day + timedelta(days=20))[self.habit.id]
+
+        self.assertEqual(done, (1 << 0) | (1 << 11) | (1 << 12) | (1 << 20))
+        self.assertEqual(restored, 0)
+        self.assertEqual(range_mask({}, self.first_day, self.first_day), 0)
+
+    def test_quarterly_status_reads_bitmaps(self):
+        """quarterly_status reports done and restored days of the quarter"""
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 1, 2), is_done=True)
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 3, 31),
+                            is_done=True, is_restored=True)
+
+        response = self.client.get('/api/v1/habits/quarterly_status/', {'date': '2026-02-10'})
+
+        days = response.data[0]['days']
+        self.assertEqual(len(days), 90)
+        self.assertEqual([d['date'] for d in days if d['is_done']], ['2026-01-02', '2026-03-31'])
+        self.assertEqual([d['date'] for d in days if d['is_restored']], ['2026-03-31'])
+
+    def test_quarterly_status_compact_year(self):
+        """?format=compact returns base64 bitstrings for the requested range"""
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 1, 1), is_done=True)
+        Date.objects.create(user=self.user_all, habit=self.habit, habit_date=date(2026, 12, 31),
+                            is_done=True, is_restored=True)
+
+        response = self.client.get('/api/v1/habits/quarterly_status/',
+                                   {'date': '2026-06-01', 'period': 'year', 'format': 'compact'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data[0]
+        self.assertEqual((data['quarter_start'], data['quarter_end']), ('2026-01-01', '2026-12-31'))
+        self.assertNotIn('days', data)
+        done = int.from_bytes(base64.b64decode(data['done']), 'little')
+        restored = int.from_bytes(base64.b64decode(data['restored']), 'little')
+        self.assertEqual(done, 1 | 1 << 364)
+        self.assertEqual(restored, 1 << 364)
+
+    def test_quarterly_status_rejects_reversed_range(self):
+        """An explicit range ending before it starts is a bad request"""
+        response = self.client.get('/api/v1/habits/quarterly_status/',
+                                   {'start_date': '2026-03-01', 'end_date': '2026-02-01', 'format': 'compact'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,73 @@
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Category, Date, Habit, UserAll
+
+
+class SlugTest(TestCase):
+    def _create_user(self, i):
+        auth = User.objects.create_user(username=f'user{i}', password='password123')
+        user = UserAll.objects.create(auth_user=auth, name='Reader')
+        habit = Habit.objects.create(user=user, name='Reading')
+        return user, habit
+
+    def _check_in_queries(self, user, habit):
+        with CaptureQueriesContext(connection) as queries:
+            Date.objects.create(user=user, habit=habit, habit_date=date(2026, 3, 1), is_done=True)
+        return len(queries.captured_queries)
+
+    def test_same_names_get_distinct_slugs(self):
+        """Users sharing habit and category names still get unique slugs"""
+        habits = [self._create_user(i)[1] for i in range(3)]
+        categories = [Category.objects.create(user=habit.user, name='Здоровье') for habit in habits]
+
+        self.assertEqual(len({h.slug for h in habits}), 3)
+        self.assertTrue(all(h.slug.startswith('reading-') for h in habits))
+        self.assertEqual(len({c.slug for c in categories}), 3)
+
+    def test_date_save_cost_does_not_grow_with_shared_names(self):
+        """Benchmark: a check-in runs the same queries for the 1st and the 30th user with a "Reading" habit"""
+        first = self._check_in_queries(*self._create_user(0))
+        for i in range(1, 30):
+            user, habit = self._create_user(i)
+            Date.objects.create(user=user, habit=habit, habit_date=date(2026, 3, 1), is_done=True)
+
+        last = self._check_in_queries(*self._create_user(30))
+
+        self.assertEqual(last, first)
+
+    def test_date_save_does_not_fetch_habit(self):
+        """Date name and slug are derived on read, so a check-in by habit id never loads the habit"""
+        user, habit = self._create_user(0)
+
+        with CaptureQueriesContext(connection) as queries:
+            entry = Date.objects.create(user=user, habit_id=habit.id, habit_date=date(2026, 3, 1), is_done=True)
+
+        self.assertFalse(any('"api_habit"."name"' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(entry.slug, f'{habit.id}-2026-03-01')
+        self.assertEqual(Date.objects.select_related('habit').get(id=entry.id).name, 'Reading - 2026-03-01')
+
+    def test_suffix_collision_is_retried(self):
+        """A random suffix that is already taken is regenerated instead of failing the insert"""
+        user, _ = self._create_user(0)
+        with mock.patch('api.models.secrets.token_hex', side_effect=['aaaaaaaa', 'aaaaaaaa', 'bbbbbbbb']):
+            first = Habit.objects.create(user=user, name='Чтение')
+            second = Habit.objects.create(user=user, name='Бег')
+
+        self.assertEqual((first.slug, second.slug), ('aaaaaaaa', 'bbbbbbbb'))
+
+    def test_other_integrity_errors_are_not_retried(self):
+        """A duplicate category name still fails, and the slug is reset for the caller"""
+        user, _ = self._create_user(0)
+        Category.objects.create(user=user, name='Здоровье')
+        duplicate = Category(user=user, name='Здоровье')
+
+        with self.assertRaises(IntegrityError):
+            duplicate.save()
+
+        self.assertEqual(duplicate.slug, '')
@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.models import Category, Date, Habit, UserAll
+
+
+class WeeklyStatusTest(TestCase):
+    url = '/api/v1/habits/weekly_status/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_auth = User.objects.create_user(username='testuser', password='password123')
+        self.user_all = UserAll.objects.create(auth_user=self.user_auth, name='Test User')
+        self.client.force_authenticate(user=self.user_auth)
+        self.category = Category.objects.create(user=self.user_all, name='Health')
+        self.monday = date(2026, 3, 9)
+
+    def _create_habit(self, name, days_done=(), **kwargs):
+        habit = Habit.objects.create(
+            user=self.user_all, name=name, category=self.category,
+            start_date=self.monday - timedelta(days=60), **kwargs
+        )
+        for day in days_done:
+            Date.objects.create(user=self.user_all, habit=habit, habit_date=day, is_done=True, quantity=2)
+        return habit
+
+    def _get_week(self):
+        return self.client.get(self.url, {'date': self.monday.isoformat()})
+
+    def test_statuses_cover_the_whole_week(self):
+        """Every habit gets seven daily statuses starting from Monday"""
+        habit = self._create_habit('Read', days_done=[self.monday, self.monday + timedelta(days=2)])
+
+        response = self._get_week()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data[0]
+        self.assertEqual(data['id'], habit.id)
+        self.assertEqual(data['category_name'], 'Health')
+        self.assertEqual([s['date'] for s in data['statuses']],
+                         [(self.monday + timedelta(days=i)).isoformat() for i in range(7)])
+        self.assertEqual([s['is_done'] for s in data['statuses']],
+                         [True, False, True, False, False, False, False])
+        self.assertEqual(data['weekly_overflow'], 4)
+        self.assertEqual(data['monthly_total'], 2)
+        self.assertEqual(data['monthly_overflow'], 4)
+
+    def test_crown_streak_counts_consecutive_full_weeks(self):
+        """Three full weeks in a row (including the current one) give crown_streak=3"""
+        first_day = self.monday - timedelta(days=14)
+        self._create_habit('Run', days_done=[first_day + timedelta(days=i) for i in range(21)])
+
+        data = self._get_week().data[0]
+
+        self.assertEqual(data['crown_streak'], 3)
+        self.assertEqual(data['weekly_award_streak'], 3)
+        self.assertTrue(data['prev_week_sun_done'])
+        self.assertEqual(data['prev_week_count'], 7)
+
+    def test_weekly_award_streak_extends_previous_crowns(self):
+        """A partial week after two full weeks continues the award streak"""
+        first_day = self.monday - timedelta(days=14)
+        days = [first_day + timedelta(days=i) for i in range(14)]
+        days += [self.monday + timedelta(days=i) for i in range(4)]
+        self._create_habit('Run', days_done=days)
+
+        data = self._get_week().data[0]
+
+        self.assertEqual(data['crown_streak'], 0)
+        self.assertEqual(data['weekly_award_streak'], 3)
+
+    def test_latest_comment_and_photo(self):
+        """The most recent comment and photo are returned with their details"""
+        habit = self._create_habit('Write')
+        Date.objects.create(user=self.user_all, habit=habit, habit_date=self.monday - timedelta(days=5),
+                            comment='old', photo='habit_photos/old.jpg')
+        Date.objects.create(user=self.user_all, habit=habit, habit_date=self.monday - timedelta(days=1),
+                            comment='new', is_done=True)
+
+        data = self._get_week().data[0]
+
+        self.assertEqual(data['latest_comment'], 'new')
+        self.assertEqual(data['latest_comment_details']['photo'], None)
+        self.assertEqual(data['latest_photo_details']['comment'], 'old')
+        self.assertTrue(data['latest_photo'].endswith('/media/habit_photos/old.jpg'))
+
+    def test_query_count_does_not_depend_on_habit_count(self):
+        """weekly_status runs a constant number of queries for any number of habits"""
+        history = [self.monday - timedelta(days=i) for i in range(1, 40)]
+        self._create_habit('Habit 0', days_done=history)
+
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(self._get_week().status_code, status.HTTP_200_OK)
+
+        for i in range(1, 8):
+            habit = self._create_habit(f'Habit {i}', days_done=history)
+            Date.objects.create(user=self.user_all, habit=habit, habit_date=self.monday, comment='note',
+                                photo='habit_photos/note.jpg')
+
+        with CaptureQueriesContext(connection) as many:
+            response = self._get_week()
+
+        self.assertEqual(len(response.data), 8)
+        self.assertLessEqual(len(many.captured_queries), len(single.captured_queries) + 1)
+        self.assertLessEqual(len(many.captured_queries), 8)
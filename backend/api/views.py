@@ -1,8 +1,10 @@
+from collections import defaultdict
 from datetime import date, datetime, timedelta
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.db.models import Case, F, IntegerField, Max, Min, Q, Sum, Value, When
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Coalesce
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
@@ -14,7 +16,15 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Achievement, Category, Date, Habit, UserAll, ReminderSettings, PushSubscription
+from .bitmaps import encode_mask
+from .cache import cached_response, conditional_response
+from .dashboard import build_weekly_status
+from .models import (
+    IS_DONE, IS_ON_TIME, Achievement, Category, Date, Habit, UserAll, ReminderSettings, PushSubscription, sum_periods
+)
+from .history import load_histories
+from .rollups import active_streak_segments, habit_totals_since_start, month_totals, range_bitmaps
+from .streaks import active_days
 from .serializers import (
     AchievementSerializer, CategorySerializer, DateSerializer, HabitSerializer,
     LoginSerializer, RegisterSerializer, UserAllSerializer, UserSerializer,
@@ -22,6 +32,10 @@ from .serializers import (
 )
 
 
+# Максимальная длина диапазона тепловой карты quarterly_status (дней)
+MAX_HEATMAP_DAYS = 366 * 5
+
+
 class AchievementViewSet(viewsets.ModelViewSet):
     queryset = Achievement.objects.all()
     serializer_class = AchievementSerializer
@@ -42,20 +56,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return super().dispatch(*args, **kwargs)
 
     def get_queryset(self):
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=self.request.user,
-            defaults={'name': self.request.user.username, 'age': ''}
-        )
+        user_profile = self.request.profile
         qs = Category.objects.filter(user=user_profile).order_by('order')
         if self.action == 'list':
             return qs.filter(is_archived=False)
         return qs
 
+    @conditional_response('categories')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=self.request.user,
-            defaults={'name': self.request.user.username, 'age': ''}
-        )
+        user_profile = self.request.profile
         max_order = Category.objects.filter(user=user_profile).aggregate(
             max_order=Max('order')
         )['max_order'] or 0
@@ -64,10 +76,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def reorder(self, request):
         """Accept [{id, order}, ...] and bulk-update category ordering."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
+        user_profile = request.profile
         items = request.data  # list of {id, order}
         if not isinstance(items, list):
             return Response({'error': 'Expected a list'}, status=status.HTTP_400_BAD_REQUEST)
@@ -76,30 +85,26 @@ class CategoryViewSet(viewsets.ModelViewSet):
             new_order = item.get('order')
             if category_id is not None and new_order is not None:
                 Category.objects.filter(id=category_id, user=user_profile).update(order=new_order)
+        UserAll.bump_data_version(user_profile.pk)
         return Response({'status': 'ok'})
 
     @action(detail=True, methods=['patch', 'post'])
     def archive(self, request, pk=None):
         """Toggle is_archived for a category and keep its habits in sync."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
+        user_profile = request.profile
         category = get_object_or_404(Category, id=pk, user=user_profile)
         category.is_archived = not category.is_archived
         category.save(update_fields=['is_archived'])
         Habit.objects.filter(user=user_profile, category=category).update(
             is_archived=category.is_archived
         )
+        UserAll.bump_data_version(user_profile.pk)
         return Response(CategorySerializer(category).data)
 
     @action(detail=False, methods=['get'])
     def archived(self, request):
         """Return archived categories for the current user."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
+        user_profile = request.profile
         categories = Category.objects.filter(user=user_profile, is_archived=True).order_by('order')
         return Response(CategorySerializer(categories, many=True).data)
 
@@ -109,10 +114,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
 @ensure_csrf_cookie
 def dates_list(request):
     print(f"DEBUG: dates_list method={request.method} user={request.user}")
-    user_profile, _ = UserAll.objects.get_or_create(
-        auth_user=request.user,
-        defaults={'name': request.user.username, 'age': ''}
-    )
+    user_profile = request.profile
     
     if request.method == 'POST':
         # Add user to request data
@@ -126,7 +128,7 @@ def dates_list(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     # GET request: filter by user
-    dates = Date.objects.filter(user=user_profile)
+    dates = Date.objects.filter(user=user_profile).select_related('habit')
     serializer = DateSerializer(dates, many=True)
     return Response(serializer.data)
 
@@ -140,26 +142,24 @@ class HabitViewSet(viewsets.ModelViewSet):
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
 
+    def perform_content_negotiation(self, request, force=False):
+        # ?format=compact у quarterly_status — режим ответа, а не формат рендерера DRF
+        if self.action == 'quarterly_status' and request.query_params.get('format') == 'compact':
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     def get_queryset(self):
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=self.request.user,
-            defaults={'name': self.request.user.username, 'age': ''}
-        )
-        qs = Habit.objects.filter(user=user_profile).order_by('order')
-        if self.action == 'list':
-            return qs.filter(is_archived=False)
-        return qs
+        archived = False if self.action == 'list' else None
+        return Habit.objects.for_profile(self.request.profile, archived=archived)
+
+    @conditional_response('habits')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         try:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=self.request.user,
-                defaults={
-                    'name': self.request.user.username,
-                    'age': ''
-                }
-            )
-            print(f"DEBUG: HabitViewSet.perform_create user_profile={user_profile}, data={self.request.data}")
+            user_profile = self.request.profile
+            print(f"DEBUG: HabitViewSet.perform_create user_profile={user_profile.pk}, data={self.request.data}")
             # Assign order = max existing order + 1
             max_order = Habit.objects.filter(user=user_profile).aggregate(
                 max_order=Max('order')
@@ -174,10 +174,7 @@ class HabitViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def reorder(self, request):
         """Accept [{id, order}, ...] and bulk-update habit ordering."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
+        user_profile = request.profile
         items = request.data  # list of {id, order}
         if not isinstance(items, list):
             return Response({'error': 'Expected a list'}, status=status.HTTP_400_BAD_REQUEST)
@@ -186,15 +183,13 @@ class HabitViewSet(viewsets.ModelViewSet):
             new_order = item.get('order')
             if habit_id is not None and new_order is not None:
                 Habit.objects.filter(id=habit_id, user=user_profile).update(order=new_order)
+        UserAll.bump_data_version(user_profile.pk)
         return Response({'status': 'ok'})
 
     @action(detail=True, methods=['patch', 'post'])
     def archive(self, request, pk=None):
         """Toggle is_archived for a habit."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
+        user_profile = request.profile
         habit = get_object_or_404(Habit, id=pk, user=user_profile)
         habit.is_archived = not habit.is_archived
         habit.save()
@@ -203,14 +198,12 @@ class HabitViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def archived(self, request):
         """Return archived habits for the current user."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
-        habits = Habit.objects.filter(user=user_profile, is_archived=True).order_by('order')
+        user_profile = request.profile
+        habits = Habit.objects.for_profile(user_profile, archived=True)
         return Response(HabitSerializer(habits, many=True).data)
 
     @action(detail=True, methods=['get'])
+    @cached_response('report')
     def report(self, request, pk=None):
         habit = self.get_object()
         period = request.query_params.get('period', 'day')
@@ -229,7 +222,7 @@ class HabitViewSet(viewsets.ModelViewSet):
             end_date = start_date + timedelta(days=6)
             
             # Return daily entries (with comments/photos)
-            dates = Date.objects.filter(habit=habit, habit_date__range=[start_date, end_date], is_done=True).order_by('habit_date')
+            dates = Date.objects.filter(IS_DONE, habit=habit, habit_date__range=[start_date, end_date]).order_by('habit_date')
             entries = []
             for d in dates:
                 entries.append({
@@ -253,31 +246,30 @@ class HabitViewSet(viewsets.ModelViewSet):
                 next_month = date(today.year, today.month + 1, 1)
             end_date = next_month - timedelta(days=1)
             
+            # Calendar weeks touching the month, all in one grouped query
+            buckets = Date.objects.filter(
+                habit=habit,
+                habit_date__range=[
+                    start_date - timedelta(days=start_date.weekday()),
+                    end_date + timedelta(days=6 - end_date.weekday()),
+                ],
+            ).rollup('week')
+
             items = []
             curr = start_date
             while curr <= end_date:
                 # Find Monday of this week range
                 monday = curr - timedelta(days=curr.weekday())
                 sunday = monday + timedelta(days=6)
-                monday_in_month = max(monday, start_date)
-                sunday_in_month = min(sunday, end_date)
-                
-                # Check if this "chunk" is already handled (if range overlaps weeks)
-                # But we'll just use calendar weeks for simplicity
-                week_dates = Date.objects.filter(habit=habit, habit_date__range=[monday, sunday], is_done=True)
                 
                 # We show week label as Mon-Sun
                 label = f"{monday.strftime('%d.%m')} - {sunday.strftime('%d.%m')}"
-                
-                completions = week_dates.filter(is_restored=False).count()
-                quantity = week_dates.aggregate(
-                    total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField()))
-                )['total'] or 0
+                week_totals = buckets.get(monday, {'on_time': 0, 'units': 0})
                 
                 items.append({
                     "label": label,
-                    "completions": completions,
-                    "quantity": quantity
+                    "completions": week_totals['on_time'],
+                    "quantity": week_totals['units']
                 })
                 # Skip to next Monday
                 curr = sunday + timedelta(days=1)
@@ -288,23 +280,13 @@ class HabitViewSet(viewsets.ModelViewSet):
             # Yearly range (current year, broken by months)
             items = []
             months_ru = {1: 'Янв', 2: 'Фев', 3: 'Мар', 4: 'Апр', 5: 'Май', 6: 'Июн', 7: 'Июл', 8: 'Авг', 9: 'Сен', 10: 'Окт', 11: 'Ноя', 12: 'Дек'}
+            totals = month_totals([habit], date(today.year, 1, 1), date(today.year, 12, 1))
             for m in range(1, 13):
-                m_start = date(today.year, m, 1)
-                if m == 12:
-                    m_end = date(today.year, 12, 31)
-                else:
-                    m_end = date(today.year, m + 1, 1) - timedelta(days=1)
-                
-                month_dates = Date.objects.filter(habit=habit, habit_date__range=[m_start, m_end], is_done=True)
-                completions = month_dates.filter(is_restored=False).count()
-                quantity = month_dates.aggregate(
-                    total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField()))
-                )['total'] or 0
-                
+                month_total = totals[date(today.year, m, 1)]
                 items.append({
                     "label": months_ru[m],
-                    "completions": completions,
-                    "quantity": quantity
+                    "completions": month_total['on_time_count'],
+                    "quantity": month_total['units']
                 })
             return Response({"habit": {"id": habit.id, "name": habit.name}, "period": period, "items": items})
 
@@ -315,20 +297,13 @@ class HabitViewSet(viewsets.ModelViewSet):
             if not earliest_date:
                 earliest_date = date.today()
             
+            totals = month_totals([habit], date(earliest_date.year, 1, 1), date(date.today().year, 12, 1))
             for y in range(earliest_date.year, date.today().year + 1):
-                y_start = date(y, 1, 1)
-                y_end = date(y, 12, 31)
-                
-                year_dates = Date.objects.filter(habit=habit, habit_date__range=[y_start, y_end], is_done=True)
-                completions = year_dates.filter(is_restored=False).count()
-                quantity = year_dates.aggregate(
-                    total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField()))
-                )['total'] or 0
-                
+                year_totals = [totals[date(y, m, 1)] for m in range(1, 13)]
                 items.append({
                     "label": str(y),
-                    "completions": completions,
-                    "quantity": quantity
+                    "completions": sum(t['on_time_count'] for t in year_totals),
+                    "quantity": sum(t['units'] for t in year_totals)
                 })
             return Response({"habit": {"id": habit.id, "name": habit.name}, "period": period, "items": items})
 
@@ -337,10 +312,7 @@ class HabitViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def export(self, request):
         """Экспорт всех данных пользователя: привычки, категории, все записи выполнения."""
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username, 'age': ''}
-        )
+        user_profile = request.profile
 
         # Категории
         categories = Category.objects.filter(user=user_profile).order_by('order')
@@ -355,13 +327,13 @@ class HabitViewSet(viewsets.ModelViewSet):
         ]
 
         # Привычки со всеми записями выполнения
-        habits = Habit.objects.filter(user=user_profile).order_by('order')
+        habits = Habit.objects.for_profile(user_profile, archived=None)
+        records_by_habit = defaultdict(list)
+        for record in Date.objects.filter(user=user_profile).order_by('habit_date'):
+            records_by_habit[record.habit_id].append(record)
         habits_data = []
         for habit in habits:
-            records = Date.objects.filter(
-                user=user_profile,
-                habit=habit
-            ).order_by('habit_date')
+            records = records_by_habit[habit.id]
 
             statuses = [
                 {
@@ -398,21 +370,12 @@ class HabitViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     @method_decorator(ensure_csrf_cookie)
+    @conditional_response('weekly_status')
     def weekly_status(self, request):
 
         try:
-            # Get or create UserAll profile for authenticated user
-            user_profile, created = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={
-                    'name': request.user.username,
-                    'age': ''
-                }
-            )
+            user_profile = request.profile
 
-            # Get habits for this user
-            habits = Habit.objects.filter(user=user_profile, is_archived=False).order_by('order')
-            
             # Determine the start of the week
             date_param = request.query_params.get('date')
             if date_param:
@@ -422,277 +385,8 @@ class HabitViewSet(viewsets.ModelViewSet):
                     reference_date = date.today()
             else:
                 reference_date = date.today()
-                
-            days_since_monday = reference_date.weekday()
-            start_date = reference_date - timedelta(days=days_since_monday)
-            end_date = start_date + timedelta(days=6)
-            
-            # Monthly range anchored to the end of the week (current/new month)
-            start_of_month = date(end_date.year, end_date.month, 1)
-            if end_date.month == 12:
-                next_month = date(end_date.year + 1, 1, 1)
-            else:
-                next_month = date(end_date.year, end_date.month + 1, 1)
-            end_of_month = next_month - timedelta(days=1)
-            
-            # Check if this week spans across a month boundary
-            is_transition_week = start_date.month != end_date.month
-            
-            if is_transition_week:
-                prev_start_of_month = date(start_date.year, start_date.month, 1)
-                prev_end_of_month = start_of_month - timedelta(days=1)
-            else:
-                prev_start_of_month = None
-                prev_end_of_month = None
-            
-            result = []
-            for habit in habits:
-                try:
-                    habit_data = HabitSerializer(habit).data
-                    
-                    # Fetch latest comment of all time (most recent)
-                    latest_date_entry = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        comment__isnull=False
-                    ).exclude(comment__exact='').order_by('-habit_date', '-id').first()
-
-                    # Check previous week for streak continuation (Sunday and Saturday)
-                    prev_sun = start_date - timedelta(days=1)
-                    prev_sat = start_date - timedelta(days=2)
-                    prev_fri = start_date - timedelta(days=3)
-
-                    today_dt = date.today()
-                    is_streak_active_today = None # Lazy evaluation cache
 
-                    if prev_sun > today_dt:
-                        if is_streak_active_today is None:
-                            is_streak_active_today = self._is_streak_active_on_date(habit, user_profile, today_dt)
-                        habit_data['prev_week_sun_done'] = is_streak_active_today
-                    else:
-                        habit_data['prev_week_sun_done'] = Date.objects.filter(user=user_profile, habit=habit, habit_date=prev_sun, is_done=True, is_restored=False).exists()
-
-                    if prev_sat > today_dt:
-                        if is_streak_active_today is None:
-                            is_streak_active_today = self._is_streak_active_on_date(habit, user_profile, today_dt)
-                        habit_data['prev_week_sat_done'] = is_streak_active_today
-                    else:
-                        habit_data['prev_week_sat_done'] = Date.objects.filter(user=user_profile, habit=habit, habit_date=prev_sat, is_done=True, is_restored=False).exists()
-
-                    if prev_fri > today_dt:
-                        if is_streak_active_today is None:
-                            is_streak_active_today = self._is_streak_active_on_date(habit, user_profile, today_dt)
-                        habit_data['prev_week_fri_done'] = is_streak_active_today
-                    else:
-                        habit_data['prev_week_fri_done'] = Date.objects.filter(user=user_profile, habit=habit, habit_date=prev_fri, is_done=True, is_restored=False).exists()
-
-                    # Count previous week completions for dot transition
-                    prev_week_start = start_date - timedelta(days=7)
-                    habit_data['prev_week_count'] = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        habit_date__range=[prev_week_start, prev_sun],
-                        is_done=True,
-                        is_restored=False
-                    ).count()
-                    
-                    habit_data['latest_comment'] = None
-                    habit_data['latest_comment_details'] = None
-                    if latest_date_entry:
-                        habit_data['latest_comment'] = latest_date_entry.comment
-                        photo_url = None
-                        if latest_date_entry.photo:
-                            try:
-                                photo_url = request.build_absolute_uri(latest_date_entry.photo.url)
-                            except Exception:
-                                pass
-                                
-                        habit_data['latest_comment_details'] = {
-                            "id": latest_date_entry.id,
-                            "date": latest_date_entry.habit_date.isoformat(),
-                            "quantity": latest_date_entry.quantity,
-                            "is_done": latest_date_entry.is_done,
-                            "comment": latest_date_entry.comment,
-                            "photo": photo_url
-                        }
-                    
-                    # Fetch latest photo of all time (most recent)
-                    latest_photo_entry = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit
-                    ).exclude(photo=None).exclude(photo='').order_by('-habit_date', '-id').first()
-                    
-                    habit_data['latest_photo'] = None
-                    habit_data['latest_photo_details'] = None
-                    if latest_photo_entry:
-                        photo_url = None
-                        if latest_photo_entry.photo:
-                            try:
-                                photo_url = request.build_absolute_uri(latest_photo_entry.photo.url)
-                            except Exception:
-                                pass
-
-                        habit_data['latest_photo_details'] = {
-                            "id": latest_photo_entry.id,
-                            "date": latest_photo_entry.habit_date.isoformat(),
-                            "quantity": latest_photo_entry.quantity,
-                            "is_done": latest_photo_entry.is_done,
-                            "comment": latest_photo_entry.comment,
-                            "photo": photo_url
-                        }
-                        habit_data['latest_photo'] = photo_url
-                    
-                    # Detect if habit has quantity tracking at all
-                    has_quantity_tracking = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        quantity__gt=0
-                    ).exists()
-
-                    # Get statuses for the range (Monday to Sunday)
-                    statuses = []
-                    weekly_overflow = 0
-                    for i in range(7):
-                        current_date = start_date + timedelta(days=i)
-                        date_entry = Date.objects.filter(
-                            user=user_profile,
-                            habit=habit,
-                            habit_date=current_date
-                        ).first()
-                        
-                        is_done = date_entry.is_done if date_entry else False
-                        qty = date_entry.quantity if date_entry else None
-                        
-                        if is_done and date_entry and has_quantity_tracking and qty and qty > 0:
-                            weekly_overflow += qty
-                        
-                        photo_url = None
-                        if date_entry and date_entry.photo:
-                            try:
-                                photo_url = request.build_absolute_uri(date_entry.photo.url)
-                            except Exception:
-                                pass
-
-                        statuses.append({
-                            "date": current_date.isoformat(),
-                            "is_done": is_done,
-                            "is_restored": date_entry.is_restored if date_entry else False,
-                            "id": date_entry.id if date_entry else None,
-                            "quantity": qty,
-                            "comment": date_entry.comment if date_entry else None,
-                            "photo": photo_url
-                        })
-                    habit_data['statuses'] = statuses
-                    habit_data['weekly_overflow'] = weekly_overflow
-                    
-                    # Calculate monthly overflow (sum of positive quantities only)
-                    monthly_overflow = 0
-                    if has_quantity_tracking:
-                        monthly_overflow = Date.objects.filter(
-                            user=user_profile,
-                            habit=habit,
-                            habit_date__range=[start_of_month, end_of_month],
-                            is_done=True,
-                            quantity__gte=1
-                        ).aggregate(
-                            total=Sum('quantity')
-                        )['total'] or 0
-                    
-                    # Calculate monthly total (ONLY on-time completions, daily count)
-                    monthly_total = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        habit_date__range=[start_of_month, end_of_month],
-                        is_done=True,
-                        is_restored=False
-                    ).count()
-                    
-                    habit_data['monthly_overflow'] = monthly_overflow
-                    habit_data['monthly_total'] = monthly_total
-
-                    # Calculate previous month stats if transition week
-                    if is_transition_week:
-                        prev_monthly_overflow = 0
-                        if has_quantity_tracking:
-                            prev_monthly_overflow = Date.objects.filter(
-                                user=user_profile,
-                                habit=habit,
-                                habit_date__range=[prev_start_of_month, prev_end_of_month],
-                                is_done=True,
-                                quantity__gte=1
-                            ).aggregate(
-                                total=Sum('quantity')
-                            )['total'] or 0
-                        
-                        prev_monthly_total = Date.objects.filter(
-                            user=user_profile,
-                            habit=habit,
-                            habit_date__range=[prev_start_of_month, prev_end_of_month],
-                            is_done=True,
-                            is_restored=False
-                        ).count()
-                        
-                        habit_data['prev_monthly_overflow'] = prev_monthly_overflow
-                        habit_data['prev_monthly_total'] = prev_monthly_total
-                        habit_data['is_transition_week'] = True
-                    else:
-                        habit_data['is_transition_week'] = False
-
-                    weekly_completions = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        habit_date__range=[start_date, end_date],
-                        is_done=True,
-                        is_restored=False
-                    ).count()
-
-                    # Calculate crown streak (consecutive weeks of 7/7 on-time completions)
-                    crown_streak = 0
-                    temp_week_start = start_date
-                    # Limit lookback to prevent excessive queries
-                    for _ in range(100):
-                        week_completions = Date.objects.filter(
-                            user=user_profile,
-                            habit=habit,
-                            habit_date__range=[temp_week_start, temp_week_start + timedelta(days=6)],
-                            is_done=True,
-                            is_restored=False
-                        ).count()
-                        
-                        if week_completions >= 7:
-                            crown_streak += 1
-                            temp_week_start -= timedelta(days=7)
-                        else:
-                            break
-                    habit_data['crown_streak'] = crown_streak
-
-                    weekly_award_streak = crown_streak if weekly_completions >= 7 else 1
-                    if weekly_completions in [3, 4, 5, 6]:
-                        temp_week_start = start_date - timedelta(days=7)
-                        while True:
-                            prev_week_completions = Date.objects.filter(
-                                user=user_profile,
-                                habit=habit,
-                                habit_date__range=[temp_week_start, temp_week_start + timedelta(days=6)],
-                                is_done=True,
-                                is_restored=False
-                            ).count()
-                            if prev_week_completions >= 7:
-                                weekly_award_streak += 1
-                                temp_week_start -= timedelta(days=7)
-                            else:
-                                break
-                    habit_data['weekly_award_streak'] = weekly_award_streak
-                    
-                    result.append(habit_data)
-                except Exception as habit_e:
-                    import traceback
-                    print(f"ERROR: processing habit {habit.id}: {habit_e}")
-                    traceback.print_exc()
-                    # Skip problematic habit or add partial data
-                    continue
-                
-            return Response(result)
+            return Response(build_weekly_status(request, user_profile, reference_date))
         except Exception as e:
             import traceback
             print(f"CRITICAL ERROR in weekly_status: {e}")
@@ -705,17 +399,20 @@ class HabitViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     @method_decorator(ensure_csrf_cookie)
+    @conditional_response('quarterly_status')
+    @cached_response('quarterly_status')
     def quarterly_status(self, request):
         """
         Возвращает статусы выполнения привычек за текущий квартал (~91 день).
         Параметр ?date=YYYY-MM-DD — опорная дата (по умолчанию сегодня).
+        Параметр ?period=year — весь год опорной даты вместо квартала;
+        ?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD — произвольный диапазон.
         Ответ: список объектов { id, name, days: [{date, is_done, is_restored}] }
+        С ?format=compact вместо days отдаются done и restored — base64 битовых строк:
+        бит k (младшие биты байта первыми) соответствует дню quarter_start + k.
         """
         try:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={'name': request.user.username, 'age': ''}
-            )
+            user_profile = request.profile
 
             date_param = request.query_params.get('date')
             try:
@@ -723,46 +420,61 @@ class HabitViewSet(viewsets.ModelViewSet):
             except ValueError:
                 ref_date = date.today()
 
-            # Квартал: определяем начало текущего квартала
-            quarter_month_start = ((ref_date.month - 1) // 3) * 3 + 1
-            quarter_start = date(ref_date.year, quarter_month_start, 1)
-            # Конец квартала: начало следующего квартала - 1 день
-            if quarter_month_start + 3 > 12:
-                quarter_end = date(ref_date.year + 1, 1, 1) - timedelta(days=1)
+            if request.query_params.get('period') == 'year':
+                quarter_start = date(ref_date.year, 1, 1)
+                quarter_end = date(ref_date.year, 12, 31)
             else:
-                quarter_end = date(ref_date.year, quarter_month_start + 3, 1) - timedelta(days=1)
+                # Квартал: определяем начало текущего квартала
+                quarter_month_start = ((ref_date.month - 1) // 3) * 3 + 1
+                quarter_start = date(ref_date.year, quarter_month_start, 1)
+                # Конец квартала: начало следующего квартала - 1 день
+                if quarter_month_start + 3 > 12:
+                    quarter_end = date(ref_date.year + 1, 1, 1) - timedelta(days=1)
+                else:
+                    quarter_end = date(ref_date.year, quarter_month_start + 3, 1) - timedelta(days=1)
 
-            habits = Habit.objects.filter(user=user_profile, is_archived=False).order_by('order')
+            req_start_date = request.query_params.get('start_date')
+            req_end_date = request.query_params.get('end_date')
+            if req_start_date and req_end_date:
+                try:
+                    quarter_start = datetime.strptime(req_start_date, '%Y-%m-%d').date()
+                    quarter_end = datetime.strptime(req_end_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response({'error': 'Invalid date format'}, status=status.HTTP_400_BAD_REQUEST)
+                if quarter_end < quarter_start or (quarter_end - quarter_start).days >= MAX_HEATMAP_DAYS:
+                    return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Загружаем все записи за квартал одним запросом
-            all_dates = Date.objects.filter(
-                user=user_profile,
-                habit__in=habits,
-                habit_date__range=[quarter_start, quarter_end]
-            ).values('habit_id', 'habit_date', 'is_done', 'is_restored')
-
-            # Индексируем по (habit_id, date)
-            date_index = {}
-            for entry in all_dates:
-                key = (entry['habit_id'], entry['habit_date'].isoformat())
-                date_index[key] = {
-                    'is_done': entry['is_done'],
-                    'is_restored': entry['is_restored']
-                }
+            compact = request.query_params.get('format') == 'compact'
+
+            habits = Habit.objects.for_profile(user_profile)
+
+            # Биты выполнения за квартал из годовых карт (одна строка на привычку и год)
+            bitmaps = range_bitmaps(habits, quarter_start, quarter_end)
 
             result = []
             total_days = (quarter_end - quarter_start).days + 1
 
             for habit in habits:
+                done_mask, restored_mask = bitmaps.get(habit.id, (0, 0))
+                if compact:
+                    result.append({
+                        'id': habit.id,
+                        'name': habit.name,
+                        'start_date': habit.start_date.isoformat() if habit.start_date else None,
+                        'quarter_start': quarter_start.isoformat(),
+                        'quarter_end': quarter_end.isoformat(),
+                        'done': encode_mask(done_mask, total_days),
+                        'restored': encode_mask(restored_mask, total_days),
+                    })
+                    continue
+
                 days = []
                 for i in range(total_days):
                     d = quarter_start + timedelta(days=i)
-                    d_str = d.isoformat()
-                    entry = date_index.get((habit.id, d_str))
                     days.append({
-                        'date': d_str,
-                        'is_done': entry['is_done'] if entry else False,
-                        'is_restored': entry['is_restored'] if entry else False,
+                        'date': d.isoformat(),
+                        'is_done': bool(done_mask >> i & 1),
+                        'is_restored': bool(restored_mask >> i & 1),
                     })
 
                 result.append({
@@ -782,12 +494,10 @@ class HabitViewSet(viewsets.ModelViewSet):
 
 
     @action(detail=False, methods=['get'])
+    @cached_response('summary_report')
     def summary_report(self, request):
         try:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={'name': request.user.username, 'age': ''}
-            )
+            user_profile = request.profile
             period = request.query_params.get('period', 'all')
             date_param = request.query_params.get('date', date.today().isoformat())
             try:
@@ -795,22 +505,17 @@ class HabitViewSet(viewsets.ModelViewSet):
             except ValueError:
                 today = date.today()
 
-            habits = Habit.objects.filter(user=user_profile, is_archived=False)
+            habits = Habit.objects.for_profile(user_profile)
             
             # Default "all" view (Original habit-based list)
             if period == 'all':
                 habit_summaries = []
                 total_completions = 0
                 total_quantity = 0
+                # Правило 2: учитываем только записи начиная с start_date привычки
+                totals = habit_totals_since_start(habits)
                 for habit in habits:
-                    # Правило 2: учитываем только записи начиная с start_date привычки
-                    dates_qs = Date.objects.filter(habit=habit, is_done=True)
-                    if habit.start_date:
-                        dates_qs = dates_qs.filter(habit_date__gte=habit.start_date)
-                    habit_completions = dates_qs.filter(is_restored=False).count()
-                    habit_quantity = dates_qs.aggregate(
-                        total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField()))
-                    )['total'] or 0
+                    habit_completions, habit_quantity = totals.get(habit.id, (0, 0))
                     total_completions += habit_completions
                     total_quantity += habit_quantity
                     habit_summaries.append({
@@ -834,14 +539,17 @@ class HabitViewSet(viewsets.ModelViewSet):
                 days_since_monday = today.weekday()
                 start_date = today - timedelta(days=days_since_monday)
                 end_date = start_date + timedelta(days=6)
+                buckets = Date.objects.filter(
+                    user=user_profile, habit__in=habits, habit_date__range=[start_date, end_date]
+                ).rollup('day')
                 
                 curr = start_date
                 while curr <= end_date:
-                    day_dates = Date.objects.filter(user=user_profile, habit__in=habits, habit_date=curr, is_done=True)
+                    day_totals = buckets.get(curr, {'on_time': 0, 'units': 0})
                     items.append({
                         "label": curr.strftime('%d.%m'),
-                        "completions": day_dates.filter(is_restored=False).count(),
-                        "quantity": day_dates.aggregate(total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField())))['total'] or 0
+                        "completions": day_totals['on_time'],
+                        "quantity": day_totals['units']
                     })
                     curr += timedelta(days=1)
             
@@ -853,44 +561,47 @@ class HabitViewSet(viewsets.ModelViewSet):
                 else:
                     next_month = date(today.year, today.month + 1, 1)
                 end_date = next_month - timedelta(days=1)
+                buckets = Date.objects.filter(
+                    user=user_profile,
+                    habit__in=habits,
+                    habit_date__range=[
+                        start_date - timedelta(days=start_date.weekday()),
+                        end_date + timedelta(days=6 - end_date.weekday()),
+                    ],
+                ).rollup('week')
                 
                 curr = start_date
                 while curr <= end_date:
                     monday = curr - timedelta(days=curr.weekday())
                     sunday = monday + timedelta(days=6)
-                    week_dates = Date.objects.filter(user=user_profile, habit__in=habits, habit_date__range=[monday, sunday], is_done=True)
+                    week_totals = buckets.get(monday, {'on_time': 0, 'units': 0})
                     items.append({
                         "label": f"{monday.strftime('%d.%m')} - {sunday.strftime('%d.%m')}",
-                        "completions": week_dates.filter(is_restored=False).count(),
-                        "quantity": week_dates.aggregate(total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField())))['total'] or 0
+                        "completions": week_totals['on_time'],
+                        "quantity": week_totals['units']
                     })
                     curr = sunday + timedelta(days=1)
 
             elif period == 'month':
                 months_ru = {1: 'Янв', 2: 'Фев', 3: 'Мар', 4: 'Апр', 5: 'Май', 6: 'Июн', 7: 'Июл', 8: 'Авг', 9: 'Сен', 10: 'Окт', 11: 'Ноя', 12: 'Дек'}
+                totals = month_totals(habits, date(today.year, 1, 1), date(today.year, 12, 1))
                 for m in range(1, 13):
-                    m_start = date(today.year, m, 1)
-                    if m == 12:
-                        m_end = date(today.year, 12, 31)
-                    else:
-                        m_end = date(today.year, m + 1, 1) - timedelta(days=1)
-                    month_dates = Date.objects.filter(user=user_profile, habit__in=habits, habit_date__range=[m_start, m_end], is_done=True)
+                    month_total = totals[date(today.year, m, 1)]
                     items.append({
                         "label": months_ru[m],
-                        "completions": month_dates.filter(is_restored=False).count(),
-                        "quantity": month_dates.aggregate(total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField())))['total'] or 0
+                        "completions": month_total['on_time_count'],
+                        "quantity": month_total['units']
                     })
 
             elif period == 'year':
                 earliest_date = Date.objects.filter(user=user_profile).aggregate(Min('habit_date'))['habit_date__min'] or date.today()
+                totals = month_totals(habits, date(earliest_date.year, 1, 1), date(date.today().year, 12, 1))
                 for y in range(earliest_date.year, date.today().year + 1):
-                    y_start = date(y, 1, 1)
-                    y_end = date(y, 12, 31)
-                    year_dates = Date.objects.filter(user=user_profile, habit__in=habits, habit_date__range=[y_start, y_end], is_done=True)
+                    year_totals = [totals[date(y, m, 1)] for m in range(1, 13)]
                     items.append({
                         "label": str(y),
-                        "completions": year_dates.filter(is_restored=False).count(),
-                        "quantity": year_dates.aggregate(total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField())))['total'] or 0
+                        "completions": sum(t['on_time_count'] for t in year_totals),
+                        "quantity": sum(t['units'] for t in year_totals)
                     })
 
             return Response({
@@ -904,92 +615,8 @@ class HabitViewSet(viewsets.ModelViewSet):
             traceback.print_exc()
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def _is_streak_active_on_date(self, habit, user_profile, check_date):
-        """
-        Determines if the streak for a habit is active on a given date.
-        A streak becomes active after 2 consecutive hits.
-        A streak becomes inactive after 1 miss.
-        """
-        start_date = check_date - timedelta(days=45)
-        if habit.start_date and habit.start_date > start_date:
-            start_date = habit.start_date
-
-        dates = Date.objects.filter(
-            user=user_profile, habit=habit,
-            habit_date__range=[start_date, check_date],
-            is_done=True,
-            is_restored=False
-        ).values_list('habit_date', flat=True)
-        done_dates = set(dates)
-
-        streak_active = False
-        consecutive_hits = 0
-        consecutive_misses = 0
-
-        curr = start_date
-        while curr <= check_date:
-            is_done = curr in done_dates
-            if is_done:
-                consecutive_hits += 1
-                consecutive_misses = 0
-                if consecutive_hits >= 2:
-                    streak_active = True
-            else:
-                consecutive_hits = 0
-                consecutive_misses += 1
-                if consecutive_misses >= 1:
-                    if curr < check_date:
-                        streak_active = False
-            curr += timedelta(days=1)
-
-        return streak_active
-
-    def _get_streak_history(self, habit, start_date, end_date):
-        """
-        Calculates streak history for a habit.
-        A streak becomes active after 2 consecutive hits.
-        A streak becomes inactive after 2 consecutive misses.
-        """
-        # Look back at least 2 days before start_date to determine initial state
-        lookback_start = habit.start_date or (start_date - timedelta(days=7))
-        if lookback_start > start_date - timedelta(days=7):
-            lookback_start = start_date - timedelta(days=7)
-            
-        dates = Date.objects.filter(
-            user=habit.user, habit=habit,
-            habit_date__range=[lookback_start, end_date],
-            is_done=True,
-            is_restored=False  # Only dark-green days count for streaks
-        ).values_list('habit_date', flat=True)
-        done_dates = set(dates)
-        
-        streak_active = False
-        consecutive_hits = 0
-        consecutive_misses = 0
-        
-        streak_history = {} # date -> bool
-        
-        curr = lookback_start
-        while curr <= end_date:
-            is_done = curr in done_dates
-            if is_done:
-                consecutive_hits += 1
-                consecutive_misses = 0
-                if consecutive_hits >= 2:
-                    streak_active = True
-            else:
-                consecutive_hits = 0
-                consecutive_misses += 1
-                if consecutive_misses >= 1:
-                    streak_active = False
-            
-            if curr >= start_date:
-                streak_history[curr] = streak_active
-                
-            curr += timedelta(days=1)
-        return streak_history
-
     @action(detail=False, methods=['get'])
+    @cached_response('daily_statistics')
     def daily_statistics(self, request):
         try:
             """
@@ -999,14 +626,7 @@ class HabitViewSet(viewsets.ModelViewSet):
             - end_date: конечная дата (формат YYYY-MM-DD), по умолчанию - сегодня
             - period: предустановленный период ('week', 'month', 'year'), переопределяет start_date/end_date
             """
-            # Get or create UserAll profile for authenticated user
-            user_profile, created = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={
-                    'name': request.user.username,
-                    'age': ''
-                }
-            )
+            user_profile = request.profile
 
             # Определяем период
             date_param = request.query_params.get('date')
@@ -1094,19 +714,49 @@ class HabitViewSet(viewsets.ModelViewSet):
             habit_id = request.query_params.get('habit_id')
             category_name = request.query_params.get('category')
             
-            habits = Habit.objects.filter(user=user_profile, is_archived=False)
+            habits = Habit.objects.for_profile(user_profile, category=category_name)
             if habit_id and habit_id != 'all':
                 habits = habits.filter(id=habit_id)
-            if category_name and category_name != 'Все':
-                if category_name == 'Без категории':
-                    habits = habits.filter(category__isnull=True)
-                else:
-                    habits = habits.filter(category__name=category_name)
             
-            # Pre-calculate streaks for all selected habits
-            all_streak_histories = {}
-            for habit in habits:
-                all_streak_histories[habit.id] = self._get_streak_history(habit, start_date, end_date)
+            habit_list = list(habits)
+
+            # Итоги всех периодов одним запросом. Недели, начинающиеся не с понедельника
+            # (явный start_date), собираем из дневных итогов; последняя неделя месяца
+            # может выходить за end_date
+            kind = period if period in ('week', 'month', 'year') else 'day'
+            if kind == 'week' and start_date.weekday() != 0:
+                kind = 'day'
+            range_end = end_date + timedelta(days=6) if period == 'week' else end_date
+            buckets = Date.objects.filter(
+                user=user_profile,
+                habit__in=habit_list,
+                habit_date__range=[start_date, range_end],
+            ).rollup(kind)
+
+            # Active streak segments of all selected habits in one query
+            streak_segments = active_streak_segments(habit_list, start_date, end_date)
+
+            def period_stats(first, last):
+                if kind == 'month':
+                    first_bucket = date(first.year, first.month, 1)
+                elif kind == 'year':
+                    first_bucket = date(first.year, 1, 1)
+                else:
+                    first_bucket = first
+                totals = sum_periods(buckets, first_bucket, last)
+                # Серии считаются только внутри запрошенного периода
+                streak_last = min(last, end_date)
+                return {
+                    # Count habits that existed by the end of the period
+                    'habit_count': sum(1 for h in habit_list if h.start_date is None or h.start_date <= last),
+                    'completed_count': totals['units'],
+                    'completed_days': totals['on_time'],
+                    'restored_days': totals['restored'],
+                    'extra_quantity': totals['quantity_sum'],
+                    'streak_count': sum(
+                        active_days(segments, first, streak_last) for segments in streak_segments.values()
+                    ),
+                }
 
             # Собираем статистику по дням или агрегированным периодам
             statistics = []
@@ -1115,43 +765,11 @@ class HabitViewSet(viewsets.ModelViewSet):
             if period == 'day' or not period:
                 # Daily bars (Showing the week containing start_date)
                 while current_date <= end_date:
-                    day_dates = Date.objects.filter(
-                        user=user_profile,
-                        habit__in=habits,
-                        habit_date=current_date,
-                        is_done=True
-                    )
-                    
-                    completed_days = day_dates.filter(is_restored=False).count()
-                    restored_days = day_dates.filter(is_restored=True).count()
-                    extra_quantity = day_dates.filter(quantity__isnull=False).aggregate(
-                        total=Sum('quantity')
-                    )['total'] or 0
-
-                    completed_count = (
-                        day_dates.filter(quantity__isnull=True).count() + 
-                        extra_quantity
-                    )
-
-                    # Count habits that existed by this date
-                    habit_count = habits.filter(Q(start_date__isnull=True) | Q(start_date__lte=current_date)).count()
-                    
-                    # Streak count for this day
-                    streak_count = 0
-                    for habit_id, history in all_streak_histories.items():
-                        if history.get(current_date):
-                            streak_count += 1
-
                     statistics.append({
                         'date': current_date.isoformat(),
                         'label': str(current_date.day),
                         'days_in_period': 1,
-                        'habit_count': habit_count,
-                        'completed_count': completed_count,
-                        'completed_days': completed_days,
-                        'restored_days': restored_days,
-                        'extra_quantity': extra_quantity,
-                        'streak_count': streak_count,
+                        **period_stats(current_date, current_date),
                     })
                     current_date += timedelta(days=1)
             
@@ -1159,51 +777,22 @@ class HabitViewSet(viewsets.ModelViewSet):
                 # Weekly aggregation (Bars = Week groups of the month)
                 while current_date <= end_date:
                     period_end = current_date + timedelta(days=6)
-                    day_dates = Date.objects.filter(
-                        user=user_profile,
-                        habit__in=habits,
-                        habit_date__range=[current_date, period_end],
-                        is_done=True
-                    )
-                    
-                    completed_days = day_dates.filter(is_restored=False).count()
-                    restored_days = day_dates.filter(is_restored=True).count()
-                    extra_quantity = day_dates.filter(quantity__isnull=False).aggregate(
-                        total=Sum('quantity')
-                    )['total'] or 0
-
-                    completed_count = (
-                        day_dates.filter(quantity__isnull=True).count() + 
-                        extra_quantity
-                    )
-                    
                     days_in_period = (period_end - current_date).days + 1
-                    habit_count = habits.filter(Q(start_date__isnull=True) | Q(start_date__lte=period_end)).count()
-                    
-                    # Streak count for this week (total marks across all habits)
-                    streak_count = 0
-                    c_date = current_date
-                    while c_date <= period_end:
-                        for habit_id, history in all_streak_histories.items():
-                            if history.get(c_date):
-                                streak_count += 1
-                        c_date += timedelta(days=1)
 
                     statistics.append({
                         'date': current_date.isoformat(),
                         'label': f"{current_date.day}-{period_end.day}",
                         'week_number': current_date.isocalendar()[1],
                         'days_in_period': days_in_period,
-                        'habit_count': habit_count,
-                        'completed_count': completed_count,
-                        'completed_days': completed_days,
-                        'restored_days': restored_days,
-                        'extra_quantity': extra_quantity,
-                        'streak_count': streak_count,
+                        **period_stats(current_date, period_end),
                     })
                     current_date = period_end + timedelta(days=1)
 
             elif period == 'month':
+                months_ru = {
+                    1: 'Янв', 2: 'Фев', 3: 'Мар', 4: 'Апр', 5: 'Май', 6: 'Июн',
+                    7: 'Июл', 8: 'Авг', 9: 'Сен', 10: 'Окт', 11: 'Ноя', 12: 'Дек'
+                }
                 # Monthly aggregation (Bars = months)
                 while current_date <= end_date:
                     # Get last day of current month
@@ -1213,52 +802,13 @@ class HabitViewSet(viewsets.ModelViewSet):
                         period_end = date(current_date.year, current_date.month + 1, 1) - timedelta(days=1)
                     
                     period_end = min(period_end, end_date)
-                    
-                    day_dates = Date.objects.filter(
-                        user=user_profile,
-                        habit__in=habits,
-                        habit_date__range=[current_date, period_end],
-                        is_done=True
-                    )
-                    
-                    completed_days = day_dates.filter(is_restored=False).count()
-                    restored_days = day_dates.filter(is_restored=True).count()
-                    extra_quantity = day_dates.filter(quantity__isnull=False).aggregate(
-                        total=Sum('quantity')
-                    )['total'] or 0
-
-                    completed_count = (
-                        day_dates.filter(quantity__isnull=True).count() + 
-                        extra_quantity
-                    )
-                    
                     days_in_period = (period_end - current_date).days + 1
-                    habit_count = habits.filter(Q(start_date__isnull=True) | Q(start_date__lte=period_end)).count()
-                    
-                    months_ru = {
-                        1: 'Янв', 2: 'Фев', 3: 'Мар', 4: 'Апр', 5: 'Май', 6: 'Июн',
-                        7: 'Июл', 8: 'Авг', 9: 'Сен', 10: 'Окт', 11: 'Ноя', 12: 'Дек'
-                    }
-                    
-                    # Streak count for this month
-                    streak_count = 0
-                    c_date = current_date
-                    while c_date <= period_end:
-                        for habit_id, history in all_streak_histories.items():
-                            if history.get(c_date):
-                                streak_count += 1
-                        c_date += timedelta(days=1)
 
                     statistics.append({
                         'date': current_date.isoformat(),
                         'label': months_ru[current_date.month],
                         'days_in_period': days_in_period,
-                        'habit_count': habit_count,
-                        'completed_count': completed_count,
-                        'completed_days': completed_days,
-                        'restored_days': restored_days,
-                        'extra_quantity': extra_quantity,
-                        'streak_count': streak_count,
+                        **period_stats(current_date, period_end),
                     })
                     current_date = period_end + timedelta(days=1)
 
@@ -1270,39 +820,13 @@ class HabitViewSet(viewsets.ModelViewSet):
                 while current_date <= end_date:
                     period_end = date(current_date.year, 12, 31)
                     period_end = min(period_end, end_date)
-                    
-                    day_dates = Date.objects.filter(
-                        user=user_profile,
-                        habit__in=habits,
-                        habit_date__range=[current_date, period_end],
-                        is_done=True
-                    )
-                    completed_days = day_dates.filter(is_restored=False).count()
-                    restored_days = day_dates.filter(is_restored=True).count()
-                    extra_quantity = day_dates.filter(quantity__isnull=False).aggregate(total=Sum('quantity'))['total'] or 0
-                    completed_count = day_dates.filter(quantity__isnull=True).count() + extra_quantity
                     days_in_period = (period_end - current_date).days + 1
-                    habit_count = habits.filter(Q(start_date__isnull=True) | Q(start_date__lte=period_end)).count()
-                    
-                    # Streak count for this year
-                    streak_count = 0
-                    c_date = current_date
-                    while c_date <= period_end:
-                        for habit_id, history in all_streak_histories.items():
-                            if history.get(c_date):
-                                streak_count += 1
-                        c_date += timedelta(days=1)
 
                     statistics.append({
                         'date': current_date.isoformat(),
                         'label': str(current_date.year),
                         'days_in_period': days_in_period,
-                        'habit_count': habit_count,
-                        'completed_count': completed_count,
-                        'completed_days': completed_days,
-                        'restored_days': restored_days,
-                        'extra_quantity': extra_quantity,
-                        'streak_count': streak_count,
+                        **period_stats(current_date, period_end),
                     })
                     current_date = date(current_date.year + 1, 1, 1)
             
@@ -1321,23 +845,17 @@ class HabitViewSet(viewsets.ModelViewSet):
 
 
     @action(detail=False, methods=['get'])
+    @cached_response('analytics_chart')
     def analytics_chart(self, request):
         try:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={'name': request.user.username, 'age': ''}
-            )
+            user_profile = request.profile
             
             # Filter by specific habit or category if provided
             habit_id = request.query_params.get('habit_id')
             category_name = request.query_params.get('category_name')
-            habits = Habit.objects.filter(user=user_profile, is_archived=False)
-            
-            if category_name and category_name != 'all' and category_name != 'Все':
-                if category_name == 'Без категории':
-                    habits = habits.filter(category__isnull=True)
-                else:
-                    habits = habits.filter(category__name=category_name)
+            if category_name == 'all':
+                category_name = None
+            habits = Habit.objects.for_profile(user_profile, category=category_name)
 
             if habit_id and habit_id != 'all' and habit_id:
                 try:
@@ -1345,16 +863,23 @@ class HabitViewSet(viewsets.ModelViewSet):
                 except (ValueError, TypeError):
                     pass
 
+            habit_list = list(habits)
+
+            # Первая выполненная отметка каждой привычки — одним запросом
+            first_done = dict(
+                Date.objects.filter(IS_DONE, user=user_profile, habit__in=habit_list)
+                .values('habit_id')
+                .annotate(first_day=Min('habit_date'))
+                .values_list('habit_id', 'first_day')
+                .order_by()
+            )
+
             # Get the earliest start_date among selected habits
-            habit_start = habits.aggregate(Min('start_date'))['start_date__min']
+            habit_start = min((h.start_date for h in habit_list if h.start_date), default=None)
 
             # Also look at earliest actual completed entry — user may have backdated records
             # before the habit's start_date
-            earliest_done = Date.objects.filter(
-                user=user_profile,
-                habit__in=habits,
-                is_done=True,
-            ).aggregate(Min('habit_date'))['habit_date__min']
+            earliest_done = min(first_done.values(), default=None)
 
             today = date.today()
 
@@ -1379,10 +904,25 @@ class HabitViewSet(viewsets.ModelViewSet):
                 5: 'Май', 6: 'Июнь', 7: 'Июль', 8: 'Август',
                 9: 'Сентябрь', 10: 'Октябрь', 11: 'Ноябрь', 12: 'Декабрь'
             }
-            
-            # Safeguard against too many weeks (e.g. if start_date was incorrectly set to year 1900)
-            if (end_of_chart - week_start).days > 1000:
-                week_start = end_of_chart - timedelta(days=365)
+
+            # Недельные итоги одним сгруппированным запросом: по каждой привычке и неделе —
+            # выполнения вовремя, количество и первая такая отметка недели
+            week_totals = defaultdict(lambda: [0, 0])
+            first_on_time = {}
+            for row in (
+                Date.objects.filter(
+                    IS_ON_TIME,
+                    user=user_profile,
+                    habit__in=habit_list,
+                    habit_date__range=[week_start, end_of_chart],
+                )
+                .values('habit_id', week=F('week_start'))
+                .annotate(completions=Count('id'), units=Sum(Coalesce('quantity', 1)), first_day=Min('habit_date'))
+                .order_by()
+            ):
+                week_totals[row['week']][0] += row['completions']
+                week_totals[row['week']][1] += row['units']
+                first_on_time[row['habit_id'], row['week']] = row['first_day']
             
             week_index = 1
             while week_start <= end_of_chart:
@@ -1390,31 +930,13 @@ class HabitViewSet(viewsets.ModelViewSet):
                 # Use Thursday to determine the month of the week (ISO 8601 style)
                 thursday = week_start + timedelta(days=3)
                 
-                week_dates = Date.objects.filter(
-                    user=user_profile,
-                    habit__in=habits,
-                    habit_date__range=[week_start, week_end],
-                    is_done=True,
-                    is_restored=False
-                )
-                
-                total_completions = week_dates.count()
-                total_quantity = week_dates.aggregate(
-                    total=Sum(Case(When(quantity__isnull=True, then=Value(1)), default=F('quantity'), output_field=IntegerField()))
-                )['total'] or 0
+                total_completions, total_quantity = week_totals.get(week_start, (0, 0))
                 
                 # Calculate active habits and total possible days in this week
                 total_possible_days = 0
                 active_habits_count = 0
-                for habit in habits:
-                    earliest_done = Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        habit_date__range=[week_start, week_end],
-                        is_done=True,
-                        is_restored=False
-                    ).aggregate(Min('habit_date'))['habit_date__min']
-
+                for habit in habit_list:
+                    earliest_done = first_on_time.get((habit.id, week_start))
                     if (habit.start_date and habit.start_date <= week_end) or earliest_done:
                         active_habits_count += 1
                         effective_start = habit.start_date if habit.start_date else earliest_done
@@ -1467,6 +989,15 @@ class HabitViewSet(viewsets.ModelViewSet):
                 if key not in unique_months:
                     unique_months.append(key)
             
+            chart_month_totals = {}
+            if unique_months:
+                chart_month_totals = month_totals(
+                    habit_list, date(*unique_months[0], 1), date(*unique_months[-1], 1)
+                )
+
+            # Даты активации привычек: start_date, иначе дата создания, иначе первая отметка
+            activation_dates = [h.start_date or h.created_at or first_done.get(h.id) for h in habit_list]
+
             prev_percentage = None
             for i, (y, m) in enumerate(unique_months):
                 m_start = date(y, m, 1)
@@ -1475,30 +1006,14 @@ class HabitViewSet(viewsets.ModelViewSet):
                 else:
                     m_end = date(y, m + 1, 1) - timedelta(days=1)
                 
-                days_in_month = (m_end - m_start).days + 1
-                # Include habits with no start_date (active from the beginning) or started before month end
-                active_habits = habits.filter(
-                    Q(start_date__isnull=True) | Q(start_date__lte=m_end)
-                ).count()
-                
-                month_dates = Date.objects.filter(
-                    user=user_profile,
-                    habit__in=habits,
-                    habit_date__range=[m_start, m_end],
-                    is_done=True,
-                    is_restored=False
-                )
-                
+                month_completions = chart_month_totals[m_start]['on_time_count']
+
                 # Правило 2: max_possible считаем только дни после старта привычки
                 # Правило 1: архивированные уже исключены (habits = is_archived=False)
                 max_possible = 0
-                for h in habits:
-                    # Определяем дату старта привычки
-                    h_start = h.start_date or h.created_at
-                    if h_start is None:
-                        # Если вообще нет даты — берём самую раннюю отметку
-                        earliest = Date.objects.filter(habit=h, is_done=True).aggregate(Min('habit_date'))['habit_date__min']
-                        h_start = earliest or m_start
+                for h_start in activation_dates:
+                    # Привычка без дат активна весь месяц
+                    h_start = h_start or m_start
                     # Привычка существовала в этом месяце?
                     if h_start > m_end:
                         continue  # Привычка ещё не существовала в этом месяце
@@ -1509,7 +1024,7 @@ class HabitViewSet(viewsets.ModelViewSet):
                         max_possible += days_active
                 percentage = 0
                 if max_possible > 0:
-                    percentage = min(round((month_dates.count() / max_possible) * 100), 100)
+                    percentage = min(round((month_completions / max_possible) * 100), 100)
                 
                 trend = None
                 if prev_percentage is not None:
@@ -1533,14 +1048,14 @@ class HabitViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['get'])
+    @cached_response('habit_comparison')
     def habit_comparison(self, request):
         """
         Returns aggregated stats for each habit over the specified period.
+        ?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD set an explicit range instead of the period.
+        All habits are served by a fixed number of queries.
         """
-        user_profile, _ = UserAll.objects.get_or_create(
-            auth_user=request.user,
-            defaults={'name': request.user.username}
-        )
+        user_profile = request.profile
 
         # Period logic
         date_param = request.query_params.get('date')
@@ -1589,20 +1104,32 @@ class HabitViewSet(viewsets.ModelViewSet):
             end_date = start_date + timedelta(days=6)
             label = "За неделю"
 
+        req_start_date = request.query_params.get('start_date')
+        req_end_date = request.query_params.get('end_date')
+        if req_start_date and req_end_date:
+            try:
+                start_date, end_date = (
+                    datetime.strptime(req_start_date, '%Y-%m-%d').date(),
+                    datetime.strptime(req_end_date, '%Y-%m-%d').date(),
+                )
+                label = f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
+            except ValueError:
+                pass
+
         category_name = request.query_params.get('category')
         habit_id = request.query_params.get('habit_id')
-        habits = Habit.objects.filter(user=user_profile, is_archived=False)
         if habit_id and habit_id != 'all':
-            habits = habits.filter(id=habit_id)
-        elif category_name and category_name != 'Все':
-            if category_name == 'Без категории':
-                habits = habits.filter(category__isnull=True)
-            else:
-                habits = habits.filter(category__name=category_name)
+            habits = Habit.objects.for_profile(user_profile).filter(id=habit_id)
+        else:
+            habits = Habit.objects.for_profile(user_profile, category=category_name)
                 
         statistics = []
+        # Полная история всех привычек одним запросом: период, серии и итоги за всё время
+        habits = list(habits)
+        histories = load_histories(habits, user=user_profile)
 
         for habit in habits:
+            history = histories[habit.id]
             # Правило 2: считаем только с даты старта привычки
             # Правило 1: архивированные уже исключены (is_archived=False)
             h_start = habit.start_date or habit.created_at
@@ -1610,93 +1137,38 @@ class HabitViewSet(viewsets.ModelViewSet):
             if h_start and h_start > start_date:
                 date_filter_start = h_start
 
-            day_dates = Date.objects.filter(
-                user=user_profile,
-                habit=habit,
-                habit_date__range=[date_filter_start, end_date],
-                is_done=True
-            )
-            
-            # Count days
-            completed_days = day_dates.filter(is_restored=False).count()
-            restored_days = day_dates.filter(is_restored=True).count()
-            
-            # Sum quantity
-            extra_quantity = day_dates.filter(quantity__isnull=False).aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
+            period_totals = history.totals(date_filter_start, end_date)
+            completed_days = period_totals.on_time
+            restored_days = period_totals.restored
+            extra_quantity = period_totals.quantity_sum
 
             # Streak days for this habit in the period
-            # Use full week context for streaks to match daily_statistics logic
-            streak_start = start_date
-            streak_end = end_date
-            if period == 'day':
-                days_since_monday = start_date.weekday()
-                streak_start = start_date - timedelta(days=days_since_monday)
-                streak_end = streak_start + timedelta(days=6)
-            
-            streak_history = self._get_streak_history(habit, streak_start, streak_end)
-            streak_days = sum(1 for d, active in streak_history.items() if active and start_date <= d <= end_date)
+            streak_days = history.streak_days(start_date, end_date)
             
             days_in_period = (end_date - start_date).days + 1
             streak_percentage = (streak_days / days_in_period * 100) if days_in_period > 0 else 0
 
             # Get actual dates done in this period
-            done_history = list(day_dates.values_list('habit_date', flat=True))
-            done_history_str = [d.isoformat() for d in done_history]
+            done_history_str = [d.isoformat() for d in history.done_days(date_filter_start, end_date)]
 
             # ── All-time statistics ──────────────────────────────────────────────
             # Определяем эффективную дату начала отсчёта
-            first_done_date = Date.objects.filter(
-                user=user_profile, habit=habit, is_done=True
-            ).order_by('habit_date').values_list('habit_date', flat=True).first()
-
-            effective_start = habit.start_date or first_done_date
+            effective_start = habit.start_date or history.first_done()
 
             if effective_start:
                 today_dt = date.today()
                 alltime_days_total = max(0, (today_dt - effective_start).days + 1)
-                alltime_days_done = Date.objects.filter(
-                    user=user_profile,
-                    habit=habit,
-                    habit_date__range=[effective_start, today_dt],
-                    is_done=True,
-                    is_restored=False
-                ).count()
-
-                # Загружаем все даты выполнения одним запросом
-                all_done_set = set(
-                    Date.objects.filter(
-                        user=user_profile,
-                        habit=habit,
-                        habit_date__gte=effective_start,
-                        is_done=True,
-                        is_restored=False
-                    ).values_list('habit_date', flat=True)
-                )
+                alltime_days_done = history.totals(effective_start, today_dt).on_time
 
-                alltime_lightning = 0        # 3/7
-                alltime_double_lightning = 0 # 4/7
-                alltime_star = 0             # 5/7
-                alltime_double_star = 0      # 6/7
-                alltime_crown = 0            # 7/7
-
-                # Начинаем с понедельника недели effective_start
-                week_iter = effective_start - timedelta(days=effective_start.weekday())
-                while week_iter <= today_dt:
-                    week_end_iter = week_iter + timedelta(days=6)
-                    wc = sum(1 for d in all_done_set if week_iter <= d <= week_end_iter)
-                    if wc == 3:
-                        alltime_lightning += 1
-                    elif wc == 4:
-                        alltime_double_lightning += 1
-                    elif wc == 5:
-                        alltime_star += 1
-                    elif wc == 6:
-                        alltime_double_star += 1
-                    elif wc >= 7:
-                        alltime_crown += 1
-                    week_iter += timedelta(days=7)
+                # Гистограмма недель по числу выполнений, начиная с недели effective_start
+                badges = history.badge_histogram(
+                    effective_start, today_dt + timedelta(days=6 - today_dt.weekday())
+                )
+                alltime_lightning = badges[3]         # 3/7
+                alltime_double_lightning = badges[4]  # 4/7
+                alltime_star = badges[5]              # 5/7
+                alltime_double_star = badges[6]       # 6/7
+                alltime_crown = badges[7]             # 7/7
             else:
                 alltime_days_total = 0
                 alltime_days_done = 0
@@ -1739,10 +1211,7 @@ class HabitViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def update_status(self, request):
         try:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={'name': request.user.username}
-            )
+            user_profile = request.profile
             data = request.data
             habit_id = data.get('habit_id')
             habit_date_str = data.get('date')
@@ -1812,22 +1281,17 @@ class HabitViewSet(viewsets.ModelViewSet):
     def clear_comment(self, request):
         """Сбросить последний комментарий привычки"""
         try:
-            user_profile, _ = UserAll.objects.get_or_create(
-                auth_user=request.user,
-                defaults={'name': request.user.username}
-            )
+            user_profile = request.profile
             habit_id = request.data.get('habit_id')
             if not habit_id:
                 return Response({'error': 'habit_id is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-            habit = get_object_or_404(Habit, id=habit_id, user=user_profile)
+            habit = get_object_or_404(
+                Habit.objects.select_related('latest_comment_entry'), id=habit_id, user=user_profile
+            )
 
-            # Находим последнюю запись с комментарием
-            latest_entry = Date.objects.filter(
-                user=user_profile,
-                habit=habit,
-                comment__isnull=False
-            ).exclude(comment__exact='').order_by('-habit_date', '-id').first()
+            # Последняя запись с комментарием хранится прямо в привычке
+            latest_entry = habit.latest_comment_entry
 
             if latest_entry:
                 latest_entry.comment = ''
@@ -1843,12 +1307,9 @@ class HabitViewSet(viewsets.ModelViewSet):
 def api_dates_detail(request, pk):
     print(f"DEBUG: api_dates_detail pk={pk} method={request.method} user={request.user}")
     # Ensure user profile exists
-    user_profile, _ = UserAll.objects.get_or_create(
-        auth_user=request.user,
-        defaults={'name': request.user.username, 'age': ''}
-    )
+    user_profile = request.profile
     
-    post = get_object_or_404(Date, id=pk)
+    post = get_object_or_404(Date.objects.select_related('habit'), id=pk)
     
     # Check ownership
     if post.user != user_profile:
@@ -1993,7 +1454,7 @@ class CurrentUserView(APIView):
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def reminder_settings(request):
-    user_profile, _ = UserAll.objects.get_or_create(auth_user=request.user)
+    user_profile = request.profile
     settings, _ = ReminderSettings.objects.get_or_create(user=user_profile)
     
     if request.method == 'PATCH':
@@ -2009,7 +1470,7 @@ def reminder_settings(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def subscribe_push(request):
-    user_profile, _ = UserAll.objects.get_or_create(auth_user=request.user)
+    user_profile = request.profile
     serializer = PushSubscriptionSerializer(data=request.data)
     if serializer.is_valid():
         PushSubscription.objects.update_or_create(
@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +88,25 @@ DATABASES = {
 }
 
 
+# Кэш вычисленных ответов аналитики (api/cache.py). LocMemCache вытесняет давно
+# не читанные записи сверх MAX_ENTRIES (LRU) и у каждого воркера gunicorn свой;
+# общий кэш для всех воркеров — например, django.core.cache.backends.redis.RedisCache
+ANALYTICS_CACHE_BACKEND = os.getenv('ANALYTICS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': ANALYTICS_CACHE_BACKEND,
+        'LOCATION': os.getenv('ANALYTICS_CACHE_LOCATION', 'analytics'),
+        'TIMEOUT': int(os.getenv('ANALYTICS_CACHE_TIMEOUT', '86400')),
+    },
+}
+if ANALYTICS_CACHE_BACKEND.endswith(('LocMemCache', 'FileBasedCache', 'DatabaseCache')):
+    CACHES['analytics']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('ANALYTICS_CACHE_MAX_ENTRIES', '5000'))}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 